@@ -0,0 +1,188 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from analytics.rolling import (
+    cross_products,
+    has_constant,
+    running_sums,
+    solve_windows,
+)
+
+
+# Resamples per pool task. Fixed, so each chunk's seed - and the bands - are
+# the same however many workers the chunks are spread over.
+CHUNK_SIZE = 25
+
+
+class RollingBands:
+    """Bootstrap percentile bands around rolling OLS coefficients."""
+
+    def __init__(
+        self,
+        lower: pd.DataFrame,
+        upper: pd.DataFrame,
+        resamples: int,
+        block_length: int,
+        level: float,
+    ) -> None:
+        self.lower = lower
+        self.upper = upper
+        self.resamples = resamples
+        self.block_length = block_length
+        self.level = level
+
+
+def block_lengths(window: int, block_length: int) -> list[int]:
+    """Blocks making up one resampled window; the last is cut to fit."""
+    n_blocks, remainder = divmod(window, block_length)
+    return [block_length] * n_blocks + ([remainder] if remainder else [])
+
+
+def resample_windows(
+    block_sums: dict[int, list[np.ndarray]],
+    lengths: list[int],
+    window: int,
+    ends: np.ndarray,
+    resamples: int,
+    constant: bool,
+    seed: np.random.SeedSequence,
+) -> np.ndarray:
+    """
+    Coefficients for `resamples` moving-block resamples of every window
+    ending at `ends`, as a (resamples, windows, k) array.
+
+    Each resampled window is len(lengths) blocks drawn from inside the
+    window. block_sums[length] holds each block's X'X, X'y, y'y, sum(y) and
+    observation count, indexed by the block's first row, so a resample's
+    normal equations are a sum of gathered blocks rather than a pass over
+    its rows.
+    """
+    rng = np.random.default_rng(seed)
+    first_rows = ends - window + 1
+    xtx = xty = yty = ysum = nobs = 0.0
+    for length in lengths:
+        bxx, bxy, byy, by, bn = block_sums[length]
+        # A block may start anywhere that keeps it inside the window.
+        offsets = rng.integers(0, window - length + 1, (resamples, len(ends)))
+        starts = first_rows + offsets
+        xtx = xtx + bxx[starts]
+        xty = xty + bxy[starts]
+        yty = yty + byy[starts]
+        ysum = ysum + by[starts]
+        nobs = nobs + bn[starts]
+
+    k = xty.shape[-1]
+    params, _, _ = solve_windows(
+        xtx.reshape(-1, k, k),
+        xty.reshape(-1, k),
+        yty.ravel(),
+        ysum.ravel(),
+        nobs.ravel(),
+        constant,
+    )
+    return params.reshape(resamples, len(ends), k)
+
+
+def bootstrap_rolling_ols(
+    endog: pd.Series,
+    exog: pd.DataFrame,
+    window: int = 60,
+    resamples: int = 500,
+    block_length: int = 5,
+    level: float = 0.9,
+    seed: int = 0,
+    max_workers: int | None = None,
+) -> RollingBands:
+    """
+    Moving-block bootstrap bands for rolling_ols(endog, exog, window).
+
+    For every window, `resamples` pseudo-windows are built from blocks of
+    block_length consecutive days drawn from inside it (keeping the short
+    range autocorrelation of daily returns), the regression is re-solved
+    on each, and the (1 - level) / 2 and (1 + level) / 2 percentiles of the
+    coefficients form the band. Per-row cross products and their block
+    sums are computed once and shared by every resample.
+
+    Resamples run in chunks on a process pool of max_workers processes
+    (BOOTSTRAP_WORKERS, default up to 4). Each chunk draws from its own
+    child of SeedSequence(seed), so a given seed always gives the same
+    bands.
+    """
+    x = exog.to_numpy(dtype=np.float64)
+    y = endog.reindex(exog.index).to_numpy(dtype=np.float64)
+    n, k = x.shape
+    lower = np.full((n, k), np.nan)
+    upper = np.full((n, k), np.nan)
+
+    if window <= n:
+        cumulative = running_sums(*cross_products(y, x))
+        lengths = block_lengths(window, block_length)
+        block_sums = {
+            length: [c[length:] - c[:-length] for c in cumulative]
+            for length in set(lengths)
+        }
+        ends = np.arange(window - 1, n)
+        chunks = [
+            min(CHUNK_SIZE, resamples - start)
+            for start in range(0, resamples, CHUNK_SIZE)
+        ]
+        seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+        args = (block_sums, lengths, window, ends)
+        constant = has_constant(x)
+        draws = np.concatenate(
+            _run_chunks(args, chunks, seeds, constant, _workers(max_workers))
+        )
+        percentiles = [(1 - level) / 2 * 100, (1 + level) / 2 * 100]
+        # Only windows with missing rows can have NaN draws, and
+        # nanpercentile is several times slower, so use it only then.
+        percentile = np.nanpercentile if np.isnan(draws).any() else np.percentile
+        lower[window - 1 :], upper[window - 1 :] = percentile(
+            draws, percentiles, axis=0
+        )
+
+    return RollingBands(
+        lower=pd.DataFrame(lower, index=exog.index, columns=exog.columns),
+        upper=pd.DataFrame(upper, index=exog.index, columns=exog.columns),
+        resamples=resamples,
+        block_length=block_length,
+        level=level,
+    )
+
+
+def _workers(max_workers: int | None) -> int:
+    if max_workers is not None:
+        return max_workers
+    default = min(4, os.cpu_count() or 1)
+    return int(os.getenv("BOOTSTRAP_WORKERS", str(default)))
+
+
+def _run_chunks(
+    args: tuple,
+    chunks: list[int],
+    seeds: list[np.random.SeedSequence],
+    constant: bool,
+    workers: int,
+) -> list[np.ndarray]:
+    def serial() -> list[np.ndarray]:
+        return [
+            resample_windows(*args, size, constant, seed)
+            for size, seed in zip(chunks, seeds)
+        ]
+
+    if workers <= 1 or len(chunks) == 1:
+        return serial()
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            futures = [
+                pool.submit(resample_windows, *args, size, constant, seed)
+                for size, seed in zip(chunks, seeds)
+            ]
+            return [future.result() for future in futures]
+    except (BrokenProcessPool, OSError, AssertionError):
+        # No child processes here (e.g. inside a daemonic process); the
+        # chunks and their seeds are the same, so neither are the bands.
+        return serial()
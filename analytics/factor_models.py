@@ -0,0 +1,144 @@
+from typing import Hashable
+
+import numpy as np
+import pandas as pd
+
+from analytics.rolling import cross_products, running_sums, solve_windows
+
+
+class ModelFit:
+    """Full-sample OLS fit of one model, plus its rolling coefficients."""
+
+    def __init__(
+        self,
+        name: str,
+        params: pd.Series,
+        bse: pd.Series,
+        nobs: int,
+        rsquared: float,
+        ssr: float,
+        rolling_params: pd.DataFrame | None = None,
+    ) -> None:
+        self.name = name
+        self.params = params
+        self.bse = bse
+        self.nobs = nobs
+        self.rsquared = rsquared
+        self.ssr = ssr
+        self.rolling_params = rolling_params
+
+    @property
+    def tvalues(self) -> pd.Series:
+        return self.params / self.bse
+
+    @property
+    def k(self) -> int:
+        return len(self.params)
+
+    @property
+    def rsquared_adj(self) -> float:
+        return 1.0 - (1.0 - self.rsquared) * (self.nobs - 1) / (self.nobs - self.k)
+
+    @property
+    def llf(self) -> float:
+        """Gaussian log-likelihood, as statsmodels' OLS reports it."""
+        n = self.nobs
+        return -n / 2 * (np.log(2 * np.pi * self.ssr / n) + 1)
+
+    @property
+    def aic(self) -> float:
+        return -2 * self.llf + 2 * self.k
+
+    @property
+    def bic(self) -> float:
+        return -2 * self.llf + self.k * np.log(self.nobs)
+
+
+def fit_nested_models(
+    endog: pd.Series,
+    exog: pd.DataFrame,
+    models: dict[str, list[Hashable]],
+    window: int | None = 60,
+) -> dict[str, ModelFit]:
+    """
+    Fit several OLS models of endog, each on an intercept plus a subset of
+    exog's columns, on the same sample (rows where endog and every column
+    are present), so their information criteria are comparable.
+
+    The cross products of [1, exog] with itself and with endog are built
+    once; every model's normal equations are a sub-block of them, for the
+    full sample and for each rolling window alike, so an extra model only
+    costs its k x k solves.
+    """
+    y = endog.reindex(exog.index).to_numpy(dtype=np.float64)
+    x = exog.to_numpy(dtype=np.float64)
+    keep = ~(np.isnan(y) | np.isnan(x).any(axis=1))
+    index = exog.index[keep]
+    y, x = y[keep], np.column_stack([np.ones(keep.sum()), x[keep]])
+    columns = list(exog.columns)
+    xx, xy, yy, ysum, valid = cross_products(y, x)
+
+    if window is not None and window <= len(y):
+        cxx, cxy, cyy, cy, cn = running_sums(xx, xy, yy, ysum, valid)
+        # Row 0 is the full sample, the rest the windows ending at each day.
+        stacked = [
+            np.concatenate([c[-1:], c[window:] - c[:-window]])
+            for c in [cxx, cxy, cyy, cy, cn]
+        ]
+    else:
+        stacked = [a.sum(axis=0, keepdims=True) for a in [xx, xy, yy, ysum, valid]]
+    sxx, sxy, syy, sy, sn = stacked
+
+    fits = {}
+    for name, factors in models.items():
+        idx = [0] + [columns.index(factor) + 1 for factor in factors]
+        mxx = sxx[:, idx][:, :, idx]
+        mxy = sxy[:, idx]
+        params, bse, rsquared = solve_windows(mxx, mxy, syy, sy, sn, True)
+        ssr = syy[0] - params[0] @ mxy[0]
+        labels = ["const"] + list(factors)
+        rolling = None
+        if len(params) > 1:
+            rolling = pd.DataFrame(np.nan, index=index, columns=labels)
+            rolling.iloc[window - 1 :] = params[1:]
+        fits[name] = ModelFit(
+            name=name,
+            params=pd.Series(params[0], index=labels),
+            bse=pd.Series(bse[0], index=labels),
+            nobs=int(sn[0]),
+            rsquared=float(rsquared[0]),
+            ssr=float(ssr),
+            rolling_params=rolling,
+        )
+    return fits
+
+
+def comparison_table(fits: dict[str, ModelFit]) -> pd.DataFrame:
+    """
+    Side-by-side table of fits: one column per model, rows for the alpha and
+    each factor's coefficient (t-statistic in parentheses), then R^2, adjusted
+    R^2, AIC, BIC and the number of observations. Factors given as
+    (dataset, factor) pairs are labelled by the factor.
+    """
+
+    def label(factor: Hashable) -> str:
+        if factor == "const":
+            return "alpha"
+        return str(factor[-1] if isinstance(factor, tuple) else factor)
+
+    rows: dict[str, dict[str, str]] = {}
+    for name, fit in fits.items():
+        for factor, coef in fit.params.items():
+            rows.setdefault(label(factor), {})[name] = (
+                f"{coef:.4f} ({fit.tvalues[factor]:.2f})"
+            )
+    for row, value in [
+        ("R²", lambda fit: f"{fit.rsquared:.4f}"),
+        ("Adj. R²", lambda fit: f"{fit.rsquared_adj:.4f}"),
+        ("AIC", lambda fit: f"{fit.aic:.1f}"),
+        ("BIC", lambda fit: f"{fit.bic:.1f}"),
+        ("Obs", lambda fit: f"{fit.nobs}"),
+    ]:
+        rows[row] = {name: value(fit) for name, fit in fits.items()}
+    table = pd.DataFrame.from_dict(rows, orient="index")
+    return table.reindex(index=list(rows), columns=list(fits)).fillna("")
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.utils.extmath import randomized_svd
+
+
+# Above this many tickers "auto" switches from an exact SVD to randomized SVD.
+LARGE_UNIVERSE = 100
+
+
+class PCAResult:
+    """Top-k principal components of a returns panel, labelled by ticker."""
+
+    def __init__(
+        self,
+        columns: pd.Index,
+        components: np.ndarray,
+        explained_variance_ratio: np.ndarray,
+        mean: np.ndarray,
+        n_samples: int,
+        method: str,
+    ) -> None:
+        self.columns = columns
+        self.components_ = components
+        self.explained_variance_ratio_ = explained_variance_ratio
+        self.mean_ = mean
+        self.n_samples = n_samples
+        self.method = method
+
+    @property
+    def n_components(self) -> int:
+        return len(self.explained_variance_ratio_)
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.components_.nbytes
+            + self.explained_variance_ratio_.nbytes
+            + self.mean_.nbytes
+            + self.columns.memory_usage(deep=True)
+        )
+
+    def top(self, n_components: int) -> "PCAResult":
+        """
+        The leading n_components of this fit, without refitting. Components
+        come out in order of explained variance, so this matches a fit for
+        n_components (exactly for the full SVD; the randomized one only
+        gets closer with more components).
+        """
+        return PCAResult(
+            self.columns,
+            self.components_[:n_components],
+            self.explained_variance_ratio_[:n_components],
+            self.mean_,
+            self.n_samples,
+            self.method,
+        )
+
+    def transform(self, returns: pd.DataFrame) -> np.ndarray:
+        X = returns[self.columns].to_numpy(dtype=np.float64)
+        X = np.where(np.isnan(X), self.mean_, X)
+        return (X - self.mean_) @ self.components_.T
+
+
+def prepare_returns(
+    returns: pd.DataFrame, min_obs: int = 20
+) -> tuple[np.ndarray, pd.Index, pd.Index]:
+    """
+    Turn a returns panel with gaps into a dense matrix without throwing away
+    whole days: tickers with fewer than min_obs returns and days with no
+    returns at all are dropped, and the remaining holes are filled with the
+    ticker's mean return, so they add nothing to its variance or covariances.
+    """
+    returns = returns.loc[:, returns.count() >= min_obs].dropna(how="all")
+    X = returns.to_numpy(dtype=np.float64, copy=True)
+    missing = np.isnan(X)
+    if missing.any():
+        X[missing] = np.take(np.nanmean(X, axis=0), np.nonzero(missing)[1])
+    return X, returns.index, returns.columns
+
+
+def fit_pca(
+    returns: pd.DataFrame,
+    n_components: int,
+    method: str = "auto",
+    chunk_size: int = 500,
+    random_state: int = 0,
+) -> PCAResult:
+    """
+    Fit the top n_components of a date x ticker returns panel.
+
+    method is "full" (exact SVD, what the page always used), "randomized"
+    (randomized SVD; only the top-k subspace is computed, so cost grows with
+    k rather than with the number of tickers), "incremental" (IncrementalPCA
+    over chunk_size-row blocks, for panels too long to decompose at once) or
+    "auto", which picks full for small universes and randomized otherwise.
+    """
+    X, _, columns = prepare_returns(returns)
+    n_samples, n_features = X.shape
+    n_components = min(n_components, n_samples, n_features)
+    if method == "auto":
+        method = "full" if n_features <= LARGE_UNIVERSE else "randomized"
+
+    mean = X.mean(axis=0)
+    if method == "full":
+        pca = PCA(n_components=n_components, svd_solver="full").fit(X)
+        components, ratio = pca.components_, pca.explained_variance_ratio_
+    elif method == "randomized":
+        X -= mean
+        total_variance = (X**2).sum() / (n_samples - 1)
+        _, singular_values, components = randomized_svd(
+            X, n_components, n_oversamples=10, n_iter=4, random_state=random_state
+        )
+        ratio = singular_values**2 / (n_samples - 1) / total_variance
+    elif method == "incremental":
+        pca = IncrementalPCA(n_components=n_components)
+        starts = list(range(0, n_samples, max(chunk_size, n_components)))
+        if len(starts) > 1 and n_samples - starts[-1] < n_components:
+            # partial_fit needs at least n_components rows; fold a short tail
+            # into the block before it.
+            starts.pop()
+        for start, end in zip(starts, starts[1:] + [n_samples]):
+            pca.partial_fit(X[start:end])
+        components, ratio = pca.components_, pca.explained_variance_ratio_
+    else:
+        raise ValueError(f"Unknown PCA method {method}")
+
+    return PCAResult(columns, components, ratio, mean, n_samples, method)
@@ -0,0 +1,126 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+
+class RiskReport:
+    """
+    Daily risk of a portfolio of holdings over a returns history. VaR and
+    CVaR are positive losses as a fraction of the portfolio's value; the
+    per-holding frame has each holding's weight, beta, marginal and
+    component contribution to daily volatility, and its share of it.
+    """
+
+    def __init__(
+        self,
+        level: float,
+        nobs: int,
+        historical_var: float,
+        historical_cvar: float,
+        parametric_var: float,
+        parametric_cvar: float,
+        volatility: float,
+        beta: float,
+        holdings: pd.DataFrame,
+    ) -> None:
+        self.level = level
+        self.nobs = nobs
+        self.historical_var = historical_var
+        self.historical_cvar = historical_cvar
+        self.parametric_var = parametric_var
+        self.parametric_cvar = parametric_cvar
+        self.volatility = volatility
+        self.beta = beta
+        self.holdings = holdings
+
+    @property
+    def annualized_volatility(self) -> float:
+        return self.volatility * np.sqrt(TRADING_DAYS)
+
+
+def fill_holes(returns: np.ndarray) -> np.ndarray:
+    """
+    Fill missing returns with the holding's mean return, so the holes add
+    nothing to its variance or covariances; a holding with no returns at
+    all is treated as flat.
+    """
+    missing = np.isnan(returns)
+    if not missing.any():
+        return returns
+    means = np.nanmean(np.where(missing.all(axis=0), 0.0, returns), axis=0)
+    return np.where(missing, means, returns)
+
+
+def portfolio_risk(
+    returns: pd.DataFrame,
+    weights: np.ndarray,
+    benchmark: pd.Series,
+    level: float = 0.95,
+) -> RiskReport:
+    """
+    Risk of holding weights of the date x ticker returns panel. Everything
+    comes from the T x N matrix R and two matrix-vector products: the
+    portfolio's returns p = Rw and the demeaned panel's covariance with p
+    and with the benchmark, X'p and X'b. Since Sigma w = X'p / (T - 1), the
+    marginal contributions never need the N x N covariance matrix, and the
+    component contributions w * Sigma w / sigma sum to the portfolio's
+    volatility sigma.
+
+    Raises ValueError without a holding, or with fewer than two days on
+    which the benchmark and some holding both have a return.
+    """
+    benchmark = benchmark.reindex(returns.index)
+    rows = benchmark.notna().to_numpy() & returns.notna().any(axis=1).to_numpy()
+    R = fill_holes(returns.to_numpy(dtype=np.float64)[rows])
+    b = benchmark.to_numpy(dtype=np.float64)[rows]
+    w = np.asarray(weights, dtype=np.float64)
+    nobs = len(R)
+    if not returns.shape[1]:
+        raise ValueError("No holdings to compute risk for.")
+    if nobs < 2:
+        raise ValueError(f"Risk needs at least two days of returns, got {nobs}.")
+
+    X = R - R.mean(axis=0)
+    p = R @ w
+    p_centered = p - p.mean()
+    b_centered = b - b.mean()
+    cov_with_portfolio = X.T @ p_centered / (nobs - 1)
+    cov_with_benchmark = X.T @ b_centered / (nobs - 1)
+    volatility = float(np.sqrt(p_centered @ p_centered / (nobs - 1)))
+    benchmark_variance = b_centered @ b_centered / (nobs - 1)
+
+    tail = 1 - level
+    cutoff = np.quantile(p, tail)
+    historical_var = -cutoff
+    historical_cvar = -p[p <= cutoff].mean()
+    z = NormalDist().inv_cdf(tail)
+    mean = p.mean()
+    parametric_var = -(mean + z * volatility)
+    parametric_cvar = -(mean - volatility * NormalDist().pdf(z) / tail)
+
+    marginal = cov_with_portfolio / volatility if volatility else cov_with_portfolio
+    component = w * marginal
+    holdings = pd.DataFrame(
+        {
+            "weight": w,
+            "beta": cov_with_benchmark / benchmark_variance,
+            "marginal": marginal,
+            "component": component,
+            "contribution": component / volatility if volatility else component,
+        },
+        index=returns.columns,
+    )
+    return RiskReport(
+        level,
+        nobs,
+        float(historical_var),
+        float(historical_cvar),
+        float(parametric_var),
+        float(parametric_cvar),
+        volatility,
+        float(w @ holdings["beta"].to_numpy()),
+        holdings,
+    )
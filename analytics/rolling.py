@@ -0,0 +1,143 @@
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+
+class RollingOLSResult:
+    """Rolling OLS estimates for one window length, aligned to the input index."""
+
+    def __init__(
+        self,
+        window: int,
+        params: pd.DataFrame,
+        bse: pd.DataFrame,
+        rsquared: pd.Series,
+        nobs: pd.Series,
+    ) -> None:
+        self.window = window
+        self.params = params
+        self.bse = bse
+        self.rsquared = rsquared
+        self.nobs = nobs
+
+    @property
+    def tvalues(self) -> pd.DataFrame:
+        return self.params / self.bse
+
+
+def cross_products(
+    endog: np.ndarray, exog: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-row cross products x_t x_t', x_t y_t, y_t^2, y_t and a validity flag.
+    Rows with a missing value contribute zeros and are not counted.
+    """
+    valid = ~(np.isnan(endog) | np.isnan(exog).any(axis=1))
+    x = np.where(valid[:, None], exog, 0.0)
+    y = np.where(valid, endog, 0.0)
+    xx = x[:, :, None] * x[:, None, :]
+    xy = x * y[:, None]
+    return xx, xy, y * y, y, valid.astype(np.float64)
+
+
+def has_constant(x: np.ndarray) -> bool:
+    """Whether some column of x is a non-zero constant (an intercept)."""
+    col_max, col_min = np.nanmax(x, axis=0), np.nanmin(x, axis=0)
+    return bool(np.any((col_max == col_min) & (col_max != 0)))
+
+
+def running_sums(*arrays: np.ndarray) -> list[np.ndarray]:
+    """Cumulative sums along the time axis, with a leading row of zeros."""
+    return [
+        np.concatenate([np.zeros((1,) + a.shape[1:]), np.cumsum(a, axis=0)])
+        for a in arrays
+    ]
+
+
+def solve_windows(
+    xtx: np.ndarray,
+    xty: np.ndarray,
+    yty: np.ndarray,
+    ysum: np.ndarray,
+    nobs: np.ndarray,
+    has_constant: bool,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Solve a stack of normal equations. Returns params, standard errors and
+    R^2 for each window; windows without enough observations are NaN.
+    """
+    k = xtx.shape[-1]
+    enough = nobs > k
+    # Swap in the identity for under-determined windows so one batched
+    # solve covers the stack; their results are masked out below.
+    xtx = np.where(enough[:, None, None], xtx, np.eye(k))
+    try:
+        xtx_inv = np.linalg.inv(xtx)
+    except np.linalg.LinAlgError:
+        xtx_inv = np.linalg.pinv(xtx)
+    params = np.einsum("tij,tj->ti", xtx_inv, xty)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ssr = np.maximum(yty - np.einsum("ti,ti->t", params, xty), 0.0)
+        sigma2 = ssr / (nobs - k)
+        bse = np.sqrt(sigma2[:, None] * np.einsum("tii->ti", xtx_inv))
+        tss = yty - ysum**2 / nobs if has_constant else yty
+        rsquared = 1.0 - ssr / tss
+
+    params[~enough] = np.nan
+    bse[~enough] = np.nan
+    rsquared[~enough] = np.nan
+    return params, bse, rsquared
+
+
+def rolling_ols(
+    endog: pd.Series,
+    exog: pd.DataFrame,
+    windows: int | Iterable[int] = 60,
+) -> dict[int, RollingOLSResult]:
+    """
+    Rolling least squares of endog on exog for one or more window lengths.
+
+    Cross products are accumulated once for the whole sample; each window's
+    X'X and X'y are the difference of two running sums, i.e. the O(k^2)
+    add-the-new-row / drop-the-old-row update, done for every step at once.
+    All windows share the same sums, so extra window lengths only cost the
+    batched k x k solves. Like statsmodels' RollingOLS, exog must already
+    include a constant if one is wanted, and the first window - 1 rows are NaN.
+    """
+    windows = [windows] if isinstance(windows, int) else list(windows)
+    x = exog.to_numpy(dtype=np.float64)
+    y = endog.reindex(exog.index).to_numpy(dtype=np.float64)
+    constant = has_constant(x)
+    cxx, cxy, cyy, cy, cn = running_sums(*cross_products(y, x))
+
+    results = {}
+    n = len(y)
+    for window in windows:
+        params = np.full(x.shape, np.nan)
+        bse = np.full(x.shape, np.nan)
+        rsquared = np.full(n, np.nan)
+        nobs = np.zeros(n)
+        if window <= n:
+            nobs[window - 1 :] = cn[window:] - cn[:-window]
+            (
+                params[window - 1 :],
+                bse[window - 1 :],
+                rsquared[window - 1 :],
+            ) = solve_windows(
+                cxx[window:] - cxx[:-window],
+                cxy[window:] - cxy[:-window],
+                cyy[window:] - cyy[:-window],
+                cy[window:] - cy[:-window],
+                nobs[window - 1 :],
+                constant,
+            )
+        results[window] = RollingOLSResult(
+            window=window,
+            params=pd.DataFrame(params, index=exog.index, columns=exog.columns),
+            bse=pd.DataFrame(bse, index=exog.index, columns=exog.columns),
+            rsquared=pd.Series(rsquared, index=exog.index, name="rsquared"),
+            nobs=pd.Series(nobs, index=exog.index, name="nobs"),
+        )
+    return results
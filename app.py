@@ -4,19 +4,21 @@ from dash import (
     html,
     Input,
     Output,
-    callback,
     set_props,
     State,
     page_container,
     page_registry,
-    callback_context,
 )
 import os
 import traceback
 from dotenv import load_dotenv
 from utils.utils import Logger
+from services.jobs import get_background_manager
+from utils.http import optimize_responses
+from utils.metrics import instrument_app, record_callback_error
 import dash_bootstrap_components as dbc
-from openbb import obb
+from services.openbb_session import login_in_background
+from services.returns_matrix import start_returns_build
 
 
 
@@ -33,7 +35,12 @@ else:
     load_dotenv()
     print("Running locally.")
     # Place any local development config here
-obb.account.login(pat=os.getenv("OPENBB_PERSONAL_ACCESS_TOKEN"), remember_me=True)  # type: ignore
+# Importing openbb and logging in takes seconds; do it off the boot and
+# request path. Price fetches wait for it if they get there first.
+login_in_background()
+# Dynos don't share a filesystem, so the web dyno builds the returns matrix
+# it reads itself, off the boot path.
+start_returns_build()
 
 def custom_error_handler(err):
     my_logger = Logger("Custom Dash Error Handler")
@@ -42,6 +49,7 @@ def custom_error_handler(err):
         Trackback info: {traceback.format_exc()}\n\n
     """
     my_logger.error(body)
+    record_callback_error()
     set_props(
         "toast-message",
         dict(
@@ -57,9 +65,12 @@ app = Dash(
     suppress_callback_exceptions=True,
     title="Testing Grounds",
     on_error=custom_error_handler,
+    background_callback_manager=get_background_manager(),
 )
 
 server = app.server
+instrument_app(app)
+optimize_responses(app)
 
 # Simple CSS for the sidebar
 sidebar_style = {
@@ -101,6 +112,10 @@ app.layout = html.Div(
         dcc.Location(id="url", refresh=False),
         # 2) Keep track of whether the sidebar is open (True) or closed (False)
         dcc.Store(id="sidebar-open", data=False),
+        # Header title for each page's path, looked up clientside.
+        dcc.Store(
+            id="page-titles", data={page["path"]: page["name"] for page in page_list}
+        ),
         html.Div(
             id="sidebar",
             style=sidebar_style,
@@ -202,7 +217,25 @@ app.layout = html.Div(
 )
 
 
-@app.callback(
+# Opening and closing the sidebar and setting the header title only touch
+# the browser's own state, so they run clientside: navigating or clicking
+# the toggle doesn't queue a request behind an analysis on the worker.
+app.clientside_callback(
+    """
+    function(nClicks, pathname, sidebarStyle, headerStyle, contentStyle, isOpen) {
+        // Navigating closes the sidebar; the toggle flips it.
+        const triggered = dash_clientside.callback_context.triggered;
+        const toggled = triggered.some(t => t.prop_id === "sidebar-toggle.n_clicks");
+        const open = toggled ? !isOpen : false;
+        const margin = open ? "250px" : "0px";
+        return [
+            {...sidebarStyle, marginLeft: open ? "0px" : "-250px"},
+            {...headerStyle, marginLeft: margin},
+            {...contentStyle, marginLeft: margin},
+            open,
+        ];
+    }
+    """,
     [
         Output("sidebar", "style"),
         Output("page-header", "style"),
@@ -211,77 +244,27 @@ app.layout = html.Div(
     ],
     [
         Input("sidebar-toggle", "n_clicks"),
-        Input("url", "pathname"),
+        Input("url", "pathname"),  # triggers if the user navigates
     ],
-    [  # triggers if the user navigates],
+    [
         State("sidebar", "style"),
         State("page-header", "style"),
         State("content", "style"),
         State("sidebar-open", "data"),  # the old open/closed state
     ],
+    prevent_initial_call=True,
 )
-def toggle_sidebar(
-    n_clicks,
-    pathname,
-    sidebar_style_state,
-    page_header_style_state,
-    content_style_state,
-    is_open,
-):
-    """
-    1) If user navigates (i.e., url changes), automatically close the sidebar.
-    2) Otherwise, if user clicks the toggle, flip the current open/closed state.
-    """
-
-    ctx = callback_context
-
-    if not ctx.triggered:
-        # no triggers => just return the same state
-        return (
-            sidebar_style_state,
-            page_header_style_state,
-            content_style_state,
-            is_open,
-        )
-
-    triggered_id = ctx.triggered[0]["prop_id"].split(".")[0]
 
-    # Make copies of the style dictionaries so we don't mutate them in place
-    new_sidebar_style = sidebar_style_state.copy()
-    new_page_header_style = page_header_style_state.copy()
-    new_content_style = content_style_state.copy()
-
-    if triggered_id == "url":
-        # user navigated => force close the sidebar
-        new_sidebar_style["marginLeft"] = "-250px"
-        new_content_style["marginLeft"] = "0px"
-        new_page_header_style["marginLeft"] = "0px"
-        return new_sidebar_style, new_page_header_style, new_content_style, False
-
-    else:
-        # user clicked the toggle button => flip open vs. closed
-        new_is_open = not is_open
-        if new_is_open:
-            new_sidebar_style["marginLeft"] = "0px"
-            new_content_style["marginLeft"] = "250px"
-            new_page_header_style["marginLeft"] = "250px"
-        else:
-            new_sidebar_style["marginLeft"] = "-250px"
-            new_content_style["marginLeft"] = "0px"
-            new_page_header_style["marginLeft"] = "0px"
-
-        return new_sidebar_style, new_page_header_style, new_content_style, new_is_open
-
-
-@app.callback(
+app.clientside_callback(
+    """
+    function(pathname, pageTitles) {
+        return pageTitles[pathname] || "Testing Grounds";
+    }
+    """,
     Output("page-header-title", "children"),
     Input("url", "pathname"),
+    State("page-titles", "data"),
 )
-def update_page_title(pathname):
-    for page in page_registry.values():
-        if page["path"] == pathname:
-            return page["name"]
-    return "Testing Grounds"  # default fallback
 
 
 if __name__ == "__main__":
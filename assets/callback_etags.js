@@ -0,0 +1,57 @@
+// Revalidate repeated callback requests instead of downloading them again.
+//
+// The server gives every JSON response an ETag (utils/http.py), but browsers
+// never send If-None-Match for POSTs, which is how Dash calls callbacks. This
+// keeps the last response body for each callback request body that came with
+// an ETag, sends the ETag on the next identical request, and turns the
+// server's empty 304 back into that body for the Dash renderer. The server
+// still runs the callback to compute the ETag; only the download is saved.
+(function () {
+    const MAX_ENTRIES = 20;
+    const cache = new Map();
+    const originalFetch = window.fetch.bind(window);
+
+    window.fetch = async function (resource, init) {
+        const url = typeof resource === "string" ? resource : resource.url;
+        if (
+            !init ||
+            init.method !== "POST" ||
+            typeof init.body !== "string" ||
+            !url.includes("_dash-update-component")
+        ) {
+            return originalFetch(resource, init);
+        }
+        const key = init.body;
+        const cached = cache.get(key);
+        if (cached) {
+            const headers = new Headers(init.headers || {});
+            headers.set("If-None-Match", cached.etag);
+            init = {...init, headers};
+        }
+
+        const response = await originalFetch(resource, init);
+        if (response.status === 304 && cached) {
+            // Most recently used last, so the oldest entry is evicted first.
+            cache.delete(key);
+            cache.set(key, cached);
+            return new Response(cached.body, {
+                status: 200,
+                headers: {"Content-Type": cached.contentType},
+            });
+        }
+        const etag = response.headers.get("ETag");
+        if (response.status === 200 && etag) {
+            const body = await response.clone().text();
+            cache.delete(key);
+            cache.set(key, {
+                etag,
+                body,
+                contentType: response.headers.get("Content-Type"),
+            });
+            if (cache.size > MAX_ENTRIES) {
+                cache.delete(cache.keys().next().value);
+            }
+        }
+        return response;
+    };
+})();
@@ -0,0 +1,151 @@
+"""
+Many portfolio queries against a fake warehouse that takes --latency
+seconds per query, with a 4 connection pool: blocking get_user_portfolios
+from one thread per user vs submit_query futures and the asyncio wrapper.
+Also checks that the async results match the blocking ones, that a failed
+query is resubmitted, and that cancelling a future, timing out and
+cancelling an awaiting task each abort the query in the warehouse.
+
+    python -m benchmarks.bench_async_queries
+    python -m benchmarks.bench_async_queries --users 200 --latency 1
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.providers import FakeWarehouse
+
+POOL_SIZE = 4
+
+
+def check(label: str, ok: bool) -> bool:
+    print(f"  {label:52s} {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=0.5, help="seconds per warehouse query"
+    )
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+    # Imported here so the other benchmarks still run where the Snowflake
+    # connector isn't installed.
+    from services.snow import SnowflakeConnector
+
+    # Few days of closes, so the fake's own pandas work per query stays small
+    # next to the latency being simulated.
+    warehouse = FakeWarehouse(2000, n_users=args.users, days=20)
+    warehouse.latency = args.latency
+    db = SnowflakeConnector("bench", connect=warehouse)
+    db.pool.close_all()
+    db.pool.connect = warehouse
+    db.pool.max_size = POOL_SIZE
+    db.replica = None
+    sql = db._load_sql("sql/user_portfolios.sql")
+    user_ids = list(range(1, args.users + 1))
+
+    db.invalidate_cache()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as threads:
+        blocking = dict(zip(user_ids, threads.map(db.get_user_portfolios, user_ids)))
+    blocking_s = time.perf_counter() - start
+
+    db.invalidate_cache()
+    start = time.perf_counter()
+    futures = {
+        user_id: db.submit_query(
+            sql, {"user_id": user_id}, template="sql/user_portfolios.sql"
+        )
+        for user_id in user_ids
+    }
+    submitted_ms = (time.perf_counter() - start) * 1000
+    async_results = {user_id: future.result() for user_id, future in futures.items()}
+    futures_s = time.perf_counter() - start
+
+    async def gather_all() -> list:
+        return await asyncio.gather(
+            *(db.get_user_portfolios_async(user_id) for user_id in user_ids)
+        )
+
+    db.invalidate_cache()
+    start = time.perf_counter()
+    gathered = dict(zip(user_ids, asyncio.run(gather_all())))
+    asyncio_s = time.perf_counter() - start
+
+    print(
+        f"{args.users} users, warehouse latency {args.latency:g}s, "
+        f"pool of {POOL_SIZE} connections"
+    )
+    print(f"  blocking, one thread per user  {blocking_s:8.2f} s")
+    print(
+        f"  submit_query futures           {futures_s:8.2f} s  "
+        f"(all submitted in {submitted_ms:.1f} ms)"
+    )
+    print(f"  asyncio.gather                 {asyncio_s:8.2f} s")
+    print(f"  peak queries in flight: {db.async_runner.metrics()['peak_in_flight']}\n")
+
+    ok = check(
+        "async results match blocking results",
+        all(
+            async_results[u].equals(blocking[u]) and gathered[u].equals(blocking[u])
+            for u in user_ids
+        ),
+    )
+
+    retries = db.async_runner.metrics()["retries"]
+    warehouse.async_failures = 1
+    future = db.submit_query("select 1 with user_portfolio as", retry_delay=0.1)
+    future.result()
+    ok &= check(
+        "failed query resubmitted",
+        db.async_runner.metrics()["retries"] == retries + 1,
+    )
+
+    def aborted_after(action) -> bool:
+        before = len(warehouse.aborted)
+        action()
+        deadline = time.monotonic() + 5
+        while len(warehouse.aborted) == before and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(warehouse.aborted) == before + 1
+
+    def cancel_future() -> None:
+        future = db.submit_query(sql, {"user_id": 1})
+        time.sleep(0.2)
+        future.cancel()
+
+    def time_out() -> None:
+        future = db.submit_query(sql, {"user_id": 1}, timeout=0.2)
+        try:
+            future.result()
+        except TimeoutError:
+            pass
+
+    def cancel_task() -> None:
+        async def client_goes_away() -> None:
+            task = asyncio.ensure_future(db.query_async(sql, {"user_id": 1}))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        asyncio.run(client_goes_away())
+
+    ok &= check("cancelled future aborts the query", aborted_after(cancel_future))
+    ok &= check("timed out future aborts the query", aborted_after(time_out))
+    ok &= check("cancelled asyncio task aborts the query", aborted_after(cancel_task))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
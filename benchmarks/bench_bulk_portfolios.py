@@ -0,0 +1,80 @@
+"""
+Loading many users' portfolios against a fake warehouse: one
+get_user_portfolios query per user vs a single get_user_portfolios_bulk
+query. Checks that the bulk frames match the per-user ones and that the
+per-user calls that follow are served from the result cache.
+
+    python -m benchmarks.bench_bulk_portfolios
+    python -m benchmarks.bench_bulk_portfolios --users 200 --latency 0.5
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from benchmarks.providers import FakeWarehouse
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--holdings", type=int, default=5000)
+    parser.add_argument(
+        "--latency", type=float, default=0.1, help="seconds per warehouse query"
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    # Imported here so the other benchmarks still run where the Snowflake
+    # connector isn't installed.
+    from services.snow import SnowflakeConnector
+
+    warehouse = FakeWarehouse(args.holdings, n_users=args.users)
+    warehouse.latency = args.latency
+    db = SnowflakeConnector("bench", connect=warehouse)
+    db.pool.close_all()
+    db.pool.connect = warehouse
+    db.replica = None
+    user_ids = list(range(1, args.users + 1))
+
+    db.invalidate_cache()
+    start = time.perf_counter()
+    one_by_one = {user_id: db.get_user_portfolios(user_id) for user_id in user_ids}
+    one_by_one_ms = (time.perf_counter() - start) * 1000
+    one_by_one_queries = len(warehouse.queries)
+
+    db.invalidate_cache()
+    warehouse.queries.clear()
+    start = time.perf_counter()
+    bulk = db.get_user_portfolios_bulk(user_ids)
+    bulk_ms = (time.perf_counter() - start) * 1000
+    bulk_queries = len(warehouse.queries)
+
+    cached = {user_id: db.get_user_portfolios(user_id) for user_id in user_ids}
+    cache_misses = len(warehouse.queries) - bulk_queries
+
+    ok = all(
+        bulk[user_id]
+        .reset_index(drop=True)
+        .equals(one_by_one[user_id].reset_index(drop=True))
+        and cached[user_id].equals(bulk[user_id])
+        for user_id in user_ids
+    )
+    rows = sum(len(frame) for frame in bulk.values())
+    print(
+        f"{args.users} users, {rows} holdings, "
+        f"warehouse latency {args.latency:g}s per query"
+    )
+    print(
+        f"  one query per user    {one_by_one_ms:10.1f} ms  "
+        f"{one_by_one_queries} queries"
+    )
+    print(f"  bulk                  {bulk_ms:10.1f} ms  {bulk_queries} query")
+    print(f"  per-user calls after bulk: {cache_misses} warehouse queries")
+    print(f"  bulk frames match per-user frames: {ok}")
+    if not ok or cache_misses:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Cold price fetch for a 30-ticker request against a provider with a fixed
+round trip per call, one slow symbol and one invalid symbol: one symbol at
+a time (max_workers=1) vs the default thread pool, then with one symbol
+hanging past the per-symbol timeout. Then concurrent requests: threads
+fetching different tickers shouldn't queue behind each other, and processes
+filling neighbouring ranges of the same tickers mustn't lose each other's
+rows or leave the coverage claiming rows that aren't on disk.
+
+    python -m benchmarks.bench_fetch
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import pandas as pd
+
+from benchmarks.providers import SyntheticPriceFetcher, synthetic_tickers
+from services.price_store import (
+    DEFAULT_MAX_WORKERS,
+    PriceHistoryStore,
+    failed_tickers,
+)
+
+N_TICKERS, LATENCY, SLOW_LATENCY = 30, 0.05, 0.4
+HANG_LATENCY, HANG_TIMEOUT = 3.0, 1.0
+
+
+def cold_fetch(
+    label: str,
+    tickers: list[str],
+    fetcher: SyntheticPriceFetcher,
+    max_workers: int,
+    symbol_timeout: float,
+) -> None:
+    end_date = date.today() - timedelta(days=1)
+    start_date = end_date - timedelta(days=365 * 5)
+    with tempfile.TemporaryDirectory() as root:
+        store = PriceHistoryStore(
+            root=root,
+            fetcher=fetcher,
+            environment="bench",
+            max_workers=max_workers,
+            symbol_timeout=symbol_timeout,
+        )
+        start = time.perf_counter()
+        closes = store.get_closes(tickers, start_date, end_date)
+        elapsed = time.perf_counter() - start
+    print(
+        f"{label:24s} {elapsed * 1000:8.1f} ms  {closes.shape[1]} tickers served, "
+        f"failed: {', '.join(failed_tickers(closes))}"
+    )
+
+
+def concurrent_threads(tickers: list[str]) -> None:
+    """One request per ticker from as many threads, each with a slow fetch."""
+    end_date = date.today() - timedelta(days=1)
+    start_date = end_date - timedelta(days=365)
+    with tempfile.TemporaryDirectory() as root:
+        store = PriceHistoryStore(
+            root=root,
+            fetcher=SyntheticPriceFetcher(latency=SLOW_LATENCY),
+            environment="bench",
+        )
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(tickers)) as threads:
+            list(
+                threads.map(
+                    lambda t: store.get_closes([t], start_date, end_date), tickers
+                )
+            )
+        elapsed = time.perf_counter() - start
+    print(
+        f"{len(tickers)} threads, one ticker each   {elapsed * 1000:8.1f} ms  "
+        f"(one fetch takes {SLOW_LATENCY * 1000:.0f} ms)"
+    )
+
+
+def fill_range(root: str, tickers: list[str], start_date: date, end_date: date):
+    PriceHistoryStore(
+        root=root,
+        fetcher=SyntheticPriceFetcher(latency=SLOW_LATENCY),
+        environment="bench",
+    ).get_closes(tickers, start_date, end_date)
+
+
+def concurrent_processes(tickers: list[str]) -> bool:
+    """
+    Processes filling consecutive quarters of the same tickers at once, all
+    from an empty store. Each ticker's file must keep every quarter's rows,
+    and every business day the coverage claims must be in it.
+    """
+    quarters = [(date(2022, m, 1), date(2022, m + 2, 28)) for m in (1, 4, 7, 10)]
+    with tempfile.TemporaryDirectory() as root:
+        context = multiprocessing.get_context("fork")
+        jobs = [
+            context.Process(target=fill_range, args=(root, tickers, *quarter))
+            for quarter in quarters
+        ]
+        for job in jobs:
+            job.start()
+        for job in jobs:
+            job.join()
+        with open(os.path.join(root, "_coverage.json")) as file:
+            coverage = json.load(file)
+        store = PriceHistoryStore(root=root, environment="bench")
+        ok = True
+        for ticker in tickers:
+            history = store._read(ticker)
+            ok &= all(len(history.loc[str(s) : str(e)]) for s, e in quarters)
+            covered = pd.bdate_range(*coverage.get(ticker, [date.today()] * 2))
+            ok &= covered.isin(history.index).all()
+    print(
+        f"{len(quarters)} processes, neighbouring ranges {'ok' if ok else 'FAILED'}: "
+        f"no rows lost, coverage matches the rows on disk"
+    )
+    return bool(ok)
+
+
+def main() -> None:
+    # The failed symbols' warnings are expected; keep them out of the report.
+    logging.disable(logging.WARNING)
+    tickers = synthetic_tickers(N_TICKERS - 1) + ["BADSYMBOL"]
+    print(
+        f"{N_TICKERS} tickers, {LATENCY * 1000:.0f} ms per call, "
+        f"{tickers[0]} takes {SLOW_LATENCY * 1000:.0f} ms, BADSYMBOL fails"
+    )
+    for max_workers in [1, DEFAULT_MAX_WORKERS, N_TICKERS]:
+        fetcher = SyntheticPriceFetcher(
+            latency=LATENCY, slow={tickers[0]: SLOW_LATENCY}, failing={"BADSYMBOL"}
+        )
+        cold_fetch(f"max_workers={max_workers}", tickers, fetcher, max_workers, 20.0)
+
+    print(
+        f"\n{tickers[1]} hangs for {HANG_LATENCY:g}s, "
+        f"symbol_timeout={HANG_TIMEOUT:g}s"
+    )
+    fetcher = SyntheticPriceFetcher(
+        latency=LATENCY,
+        slow={tickers[0]: SLOW_LATENCY, tickers[1]: HANG_LATENCY},
+        failing={"BADSYMBOL"},
+    )
+    cold_fetch(
+        f"max_workers={DEFAULT_MAX_WORKERS}",
+        tickers,
+        fetcher,
+        DEFAULT_MAX_WORKERS,
+        HANG_TIMEOUT,
+    )
+
+    print()
+    concurrent_threads(synthetic_tickers(8))
+    if not concurrent_processes(synthetic_tickers(3)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
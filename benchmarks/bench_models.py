@@ -0,0 +1,98 @@
+"""
+Fitting CAPM, FF3, FF5 and Carhart to the same active returns: one
+statsmodels OLS plus one rolling fit per model vs fit_nested_models over a
+shared design matrix. Checks the shared fit's coefficients, standard
+errors, R^2, AIC and BIC against statsmodels.
+
+    python -m benchmarks.bench_models
+    python -m benchmarks.bench_models --years 10
+"""
+
+import argparse
+import logging
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from analytics.factor_models import fit_nested_models
+from benchmarks.providers import write_factor_fixtures
+from benchmarks.suite import measure
+from callbacks.fama_french import (
+    COMPARISON_FACTORS,
+    factor_regression,
+    rolling_factor_regression,
+)
+from services.factors import FACTOR_DATASETS, FactorStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        store = FactorStore(
+            root=workdir,
+            fixture_dir=write_factor_fixtures(workdir),
+            environment="bench",
+        )
+        end_date = pd.Timestamp.today().normalize()
+        start_date = end_date - pd.DateOffset(years=args.years)
+        shared = store.for_models(list(COMPARISON_FACTORS), start_date, end_date)
+        per_model = {
+            model: store.for_model(model, start_date, end_date)
+            for model in COMPARISON_FACTORS
+        }
+
+    rng = np.random.default_rng(0)
+    active = pd.Series(
+        rng.normal(0, 0.008, len(shared)), index=shared.index, name="Active Returns"
+    )
+    models = {
+        model: [
+            next((name, f) for name in FACTOR_DATASETS[model] if (name, f) in shared)
+            for f in factors
+        ]
+        for model, factors in COMPARISON_FACTORS.items()
+    }
+
+    def separately() -> dict:
+        results = {}
+        for model, factors in COMPARISON_FACTORS.items():
+            data = per_model[model].join(active, how="inner")
+            rolling_factor_regression(data, factors)
+            results[model] = factor_regression(data, factors)
+        return results
+
+    def shared_fit() -> dict:
+        return fit_nested_models(active * 100, shared, models)
+
+    expected, fits = separately(), shared_fit()
+    ok = True
+    for model, result in expected.items():
+        fit = fits[model]
+        same = (
+            np.allclose(result.params.to_numpy(), fit.params.to_numpy())
+            and np.allclose(result.bse.to_numpy(), fit.bse.to_numpy())
+            and np.isclose(result.rsquared, fit.rsquared)
+            and np.isclose(result.aic, fit.aic)
+            and np.isclose(result.bic, fit.bic)
+        )
+        ok &= same
+        print(f"  {model:8s} matches statsmodels: {same}")
+
+    separate_ms = measure(separately, args.repeat)["median_ms"]
+    shared_ms = measure(shared_fit, args.repeat)["median_ms"]
+    print(f"\n{len(shared)} days, {len(COMPARISON_FACTORS)} models")
+    print(f"  one fit per model     {separate_ms:10.2f} ms")
+    print(f"  shared design matrix  {shared_ms:10.2f} ms")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
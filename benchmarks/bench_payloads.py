@@ -0,0 +1,147 @@
+"""
+Bytes on the wire for representative callback responses - the PCA charts,
+the Fama-French summary and rolling chart (single model with bootstrap
+bands, and the model comparison) and a block of portfolio grid rows -
+served through utils.http.optimize_responses: uncompressed, gzip, brotli
+(if installed) and a repeat of the same request revalidated by ETag.
+
+    python -m benchmarks.bench_payloads
+    python -m benchmarks.bench_payloads --tickers 100 --years 10
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from dash import Dash, Patch, html
+from dash._utils import to_json
+from flask import Response
+
+from benchmarks.providers import synthetic_holdings, synthetic_tickers
+from benchmarks.suite import N_COMPONENTS, Suite, date_range
+from callbacks.fama_french import (
+    COMPARE_ALL,
+    page_prefix as ff_prefix,
+    rolling_coeffs_traces,
+    run_factor_analysis,
+)
+from callbacks.pca import run_pca_analysis
+from services.pca_cache import PCAFitCache
+from utils import http
+from utils.grid import GridRowSource
+
+
+def callback_response(outputs: dict[str, tuple[str, object]]) -> str:
+    """JSON shaped like Dash's reply to a multi-output callback request."""
+    response: dict = {}
+    for component, (prop, value) in outputs.items():
+        response.setdefault(component, {})[prop] = value
+    return to_json({"multi": True, "response": response})
+
+
+def payloads(workdir: str, tickers: int, years: int, holdings: int) -> dict[str, str]:
+    suite = Suite(workdir, repeat=1)
+    store = suite.price_store("payloads")
+    start_date, end_date = date_range(years)
+    names = synthetic_tickers(tickers)
+
+    bar, line, scatter, _ = run_pca_analysis(
+        names,
+        N_COMPONENTS,
+        start_date,
+        end_date,
+        price_store=store,
+        pca_cache=PCAFitCache(),
+    )
+    pca = callback_response(
+        {
+            "pca-bar-chart": ("figure", bar),
+            "pca-line-chart": ("figure", line),
+            "pca-scatter-plot": ("figure", scatter),
+        }
+    )
+
+    def fama_french(model: str) -> str:
+        summary, coeffs, bands = run_factor_analysis(
+            names,
+            [1 / tickers] * tickers,
+            model,
+            start_date,
+            end_date,
+            price_store=store,
+            factor_store=suite.factor_store,
+            with_bands=True,
+        )
+        fig = Patch()
+        fig["data"] = rolling_coeffs_traces(coeffs, bands)
+        return callback_response(
+            {
+                ff_prefix + "text-output-pre": ("children", summary),
+                ff_prefix + "rolling-coeffs-chart": ("figure", fig),
+            }
+        )
+
+    rows = GridRowSource().get_rows(
+        "portfolio",
+        lambda: synthetic_holdings(holdings).rename(columns=str.lower),
+        {"startRow": 0, "endRow": 100},
+    )
+    return {
+        "pca update_graphs": pca,
+        "ff update_tables FF5": fama_french("FF5"),
+        "ff update_tables compare": fama_french(COMPARE_ALL),
+        "portfolio rows (100)": to_json(rows),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--holdings", type=int, default=1000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    os.environ.setdefault("BOOTSTRAP_RESAMPLES", "100")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bodies = payloads(workdir, args.tickers, args.years, args.holdings)
+    app = Dash(__name__)
+    app.layout = html.Div()
+    http.optimize_responses(app)
+
+    @app.server.route("/payload/<name>", methods=["POST"])
+    def payload(name: str) -> Response:
+        return Response(bodies[name], mimetype="application/json")
+
+    client = app.server.test_client()
+    encodings = ["identity", "gzip"] + (["br"] if http.brotli is not None else [])
+    print(
+        f"{args.tickers} tickers, {args.years} years, {args.holdings} holdings; "
+        f"brotli {'installed' if http.brotli is not None else 'not installed'}"
+    )
+    header = "".join(f"{e:>12s}" for e in encodings)
+    print(f"{'payload':28s}{header}{'repeat':>12s}{'gzip ms':>10s}")
+    for name in bodies:
+        sizes = []
+        for encoding in encodings:
+            response = client.post(
+                f"/payload/{name}", headers={"Accept-Encoding": encoding}
+            )
+            sizes.append(len(response.data))
+        etag = response.headers["ETag"]
+        repeat = client.post(
+            f"/payload/{name}",
+            headers={"Accept-Encoding": encodings[-1], "If-None-Match": etag},
+        )
+        assert repeat.status_code == 304
+        start = time.perf_counter()
+        http.compress(bodies[name].encode(), "gzip")
+        gzip_ms = (time.perf_counter() - start) * 1000
+        cells = "".join(f"{size:12,d}" for size in sizes)
+        print(f"{name:28s}{cells}{len(repeat.data):12,d}{gzip_ms:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Large-universe PCA: exact vs randomized vs incremental on a synthetic
+2500-day x 1000-ticker returns panel with gaps (late listings and random
+missing days).
+
+    python -m benchmarks.bench_pca
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from analytics.pca import fit_pca
+
+N_DAYS, N_TICKERS, N_FACTORS, TOP_K = 2500, 1000, 5, 5
+
+
+def make_panel(seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    factor_returns = rng.normal(0, 0.01, (N_DAYS, N_FACTORS)) * np.linspace(
+        2, 0.5, N_FACTORS
+    )
+    loadings = rng.normal(0, 1, (N_FACTORS, N_TICKERS))
+    returns = factor_returns @ loadings + rng.normal(0, 0.01, (N_DAYS, N_TICKERS))
+    # 5% of cells missing at random, and a tenth of the names list part way in.
+    returns[rng.random(returns.shape) < 0.05] = np.nan
+    late = rng.choice(N_TICKERS, N_TICKERS // 10, replace=False)
+    for column in late:
+        returns[: rng.integers(100, N_DAYS // 2), column] = np.nan
+    return pd.DataFrame(
+        returns,
+        index=pd.bdate_range("2015-01-01", periods=N_DAYS),
+        columns=[f"T{i:04d}" for i in range(N_TICKERS)],
+    )
+
+
+def subspace_agreement(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean cosine of the principal angles between two row spaces (1 = same)."""
+    return float(np.linalg.svd(a @ b.T, compute_uv=False).mean())
+
+
+def main() -> None:
+    panel = make_panel()
+    print(
+        f"{N_DAYS} days x {N_TICKERS} tickers, "
+        f"{panel.isna().to_numpy().mean():.1%} missing, "
+        f"rows left after dropna(): {len(panel.dropna())}"
+    )
+
+    results = {}
+    for method in ["full", "randomized", "incremental"]:
+        start = time.perf_counter()
+        results[method] = fit_pca(panel, TOP_K, method=method)
+        elapsed = time.perf_counter() - start
+        ratio = results[method].explained_variance_ratio_
+        print(
+            f"{method:12s} {elapsed * 1000:8.1f} ms  "
+            f"top-{TOP_K} explained variance {ratio.sum():.4f}"
+        )
+
+    for method in ["randomized", "incremental"]:
+        agreement = subspace_agreement(
+            results[method].components_, results["full"].components_
+        )
+        print(f"{method} vs full subspace agreement: {agreement:.6f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Portfolio replica against a fake warehouse: checks that the replica gives
+the same portfolio as sql/user_portfolios.sql after a full sync and after
+incremental syncs (an edited holding, a new holding, a day of new
+closes, a sold holding), and times serving the page from the warehouse vs the replica.
+
+    python -m benchmarks.bench_replica
+    python -m benchmarks.bench_replica --holdings 2000 --latency 0.4
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks.providers import FakeWarehouse
+from benchmarks.suite import measure
+from services.replica import PortfolioReplica
+
+NUMERIC_COLUMNS = [
+    "num_shares",
+    "avg_cost",
+    "price",
+    "market_value",
+    "total_cost",
+    "unrealized_gain_loss",
+]
+
+
+def mismatches(db, replica: PortfolioReplica) -> list[str]:
+    """Columns where the replica's portfolio differs from the warehouse's."""
+    db.replica = None
+    db.invalidate_cache()
+    expected = db.get_user_portfolios(1).sort_values("ticker", ignore_index=True)
+    actual = replica.get_user_portfolios(1).sort_values("ticker", ignore_index=True)
+    db.replica = replica
+    if list(expected["ticker"]) != list(actual["ticker"]):
+        return ["ticker"]
+    problems = []
+    for column in expected.columns:
+        if column in NUMERIC_COLUMNS:
+            same = ((expected[column] - actual[column]).abs() < 1e-6).all()
+        elif column.endswith("date"):
+            same = (pd.to_datetime(expected[column]) == actual[column]).all()
+        else:
+            same = (expected[column] == actual[column]).all()
+        if not same:
+            problems.append(column)
+    return problems
+
+
+def check(label: str, db, replica: PortfolioReplica, counts: dict) -> bool:
+    problems = mismatches(db, replica)
+    status = "ok" if not problems else f"MISMATCH in {', '.join(problems)}"
+    print(f"{label:28s} {counts}  {status}")
+    return not problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--holdings", type=int, default=500)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per warehouse query"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    # Imported here so the other benchmarks still run where the Snowflake
+    # connector isn't installed.
+    from services.snow import SnowflakeConnector
+
+    warehouse = FakeWarehouse(args.holdings)
+    db = SnowflakeConnector("bench", connect=warehouse)
+    db.pool.close_all()
+    db.pool.connect = warehouse
+
+    with tempfile.TemporaryDirectory() as workdir:
+        replica = PortfolioReplica(
+            path=os.path.join(workdir, "portfolio.db"), environment="bench"
+        )
+        db.replica = replica
+        ok = check("full sync", db, replica, replica.sync(db))
+
+        warehouse.update_holding("T0001", 42.0)
+        warehouse.add_holding("NEWCO", 10.0, 12.5)
+        ok &= check("edited and new holding", db, replica, replica.sync(db))
+
+        warehouse.add_closes("2024-01-03", list(warehouse.holdings["ticker"]), 99.0)
+        ok &= check("new day of closes", db, replica, replica.sync(db))
+        warehouse.remove_holding("NEWCO")
+        ok &= check("sold holding", db, replica, replica.sync(db))
+        ok &= check("nothing changed", db, replica, replica.sync(db))
+
+        warehouse.latency = args.latency
+
+        def from_warehouse() -> pd.DataFrame:
+            db.replica = None
+            db.invalidate_cache()
+            try:
+                return db.get_user_portfolios(1)
+            finally:
+                db.replica = replica
+
+        warehouse_ms = measure(from_warehouse, args.repeat)["median_ms"]
+        replica_ms = measure(lambda: db.get_user_portfolios(1), args.repeat)[
+            "median_ms"
+        ]
+        sync_ms = measure(lambda: replica.sync(db), args.repeat)["median_ms"]
+
+    print(f"\n{args.holdings} holdings, warehouse latency {args.latency:g}s")
+    print(f"  warehouse query       {warehouse_ms:10.2f} ms")
+    print(f"  replica read          {replica_ms:10.2f} ms")
+    print(f"  incremental sync      {sync_ms:10.2f} ms")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
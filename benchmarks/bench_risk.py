@@ -0,0 +1,144 @@
+"""
+Portfolio risk panel: analytics.risk.portfolio_risk on a synthetic one-year
+returns panel with gaps, against a reference built from the full covariance
+matrix and per-holding loops, and the panel's report cache (a repeat for
+unchanged holdings and prices vs a holding changing).
+
+    python -m benchmarks.bench_risk
+    python -m benchmarks.bench_risk --holdings 2000 --days 1260
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from analytics.risk import fill_holes, portfolio_risk
+from benchmarks.providers import SyntheticPriceFetcher, synthetic_tickers
+from callbacks.portfolio import run_risk_analysis
+from services.price_store import PriceHistoryStore
+from services.returns_matrix import ReturnsMatrixStore
+
+BUDGET_MS = 100
+
+
+def make_panel(n_days: int, n_holdings: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0004, 0.01, n_days)
+    betas = rng.uniform(0.3, 1.8, n_holdings)
+    returns = market[:, None] * betas + rng.normal(0, 0.015, (n_days, n_holdings))
+    returns[rng.random(returns.shape) < 0.02] = np.nan
+    index = pd.bdate_range(end="2024-12-31", periods=n_days)
+    panel = pd.DataFrame(returns, index=index, columns=synthetic_tickers(n_holdings))
+    weights = rng.lognormal(0, 1, n_holdings)
+    return panel, weights / weights.sum(), pd.Series(market, index=index)
+
+
+def reference(panel: pd.DataFrame, weights: np.ndarray, benchmark: pd.Series):
+    """The textbook way: covariance matrix, then a loop per holding."""
+    R = fill_holes(panel.to_numpy())
+    cov = np.cov(R, rowvar=False)
+    sigma = np.sqrt(weights @ cov @ weights)
+    marginal = np.array([cov[i] @ weights / sigma for i in range(len(weights))])
+    b = benchmark.to_numpy()
+    betas = np.array(
+        [np.cov(R[:, i], b)[0, 1] / np.var(b, ddof=1) for i in range(R.shape[1])]
+    )
+    p = R @ weights
+    cutoff = np.quantile(p, 0.05)
+    return {
+        "volatility": sigma,
+        "marginal": marginal,
+        "component": weights * marginal,
+        "beta": betas,
+        "historical_var": -cutoff,
+        "historical_cvar": -p[p <= cutoff].mean(),
+        "parametric_var": -norm.ppf(0.05, p.mean(), sigma),
+        "parametric_cvar": -(p.mean() - sigma * norm.pdf(norm.ppf(0.05)) / 0.05),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--holdings", type=int, default=500)
+    parser.add_argument("--days", type=int, default=252)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    panel, weights, benchmark = make_panel(args.days, args.holdings)
+    report = portfolio_risk(panel, weights, benchmark)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        portfolio_risk(panel, weights, benchmark)
+        timings.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    expected = reference(panel, weights, benchmark)
+    reference_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{args.holdings} holdings x {args.days} days, 2% of returns missing")
+    print(
+        f"  portfolio_risk      median {np.median(timings):7.1f} ms  "
+        f"(budget {BUDGET_MS} ms)"
+    )
+    print(f"  covariance + loops         {reference_ms:7.1f} ms\n")
+    print(
+        f"  VaR {report.historical_var:.4f} hist / {report.parametric_var:.4f} "
+        f"param, CVaR {report.historical_cvar:.4f} / {report.parametric_cvar:.4f}, "
+        f"vol {report.annualized_volatility:.2%} a year, beta {report.beta:.3f}"
+    )
+    for name in ["historical_var", "historical_cvar", "parametric_var"]:
+        assert np.isclose(getattr(report, name), expected[name]), name
+    assert np.isclose(report.parametric_cvar, expected["parametric_cvar"])
+    assert np.isclose(report.volatility, expected["volatility"])
+    for column in ["marginal", "component", "beta"]:
+        assert np.allclose(report.holdings[column], expected[column]), column
+    assert np.isclose(report.holdings["component"].sum(), report.volatility)
+    assert np.median(timings) < BUDGET_MS
+    print("  matches the reference; components sum to volatility\n")
+
+    # The panel end to end, its returns sliced from a built returns matrix as
+    # in production, with the report cache.
+    tickers = synthetic_tickers(args.holdings)
+    holdings = pd.DataFrame({"ticker": tickers, "market_value": weights * 1_000_000})
+    end_date = date(2024, 12, 31)
+    with tempfile.TemporaryDirectory() as workdir:
+        stores = (
+            PriceHistoryStore(
+                root=os.path.join(workdir, "prices"),
+                fetcher=SyntheticPriceFetcher(),
+                environment="bench",
+            ),
+            ReturnsMatrixStore(
+                root=os.path.join(workdir, "returns"), environment="bench"
+            ),
+        )
+        stores[1].build(
+            tickers + ["SPY"], date(2023, 1, 1), end_date, price_store=stores[0]
+        )
+
+        def timed_run() -> float:
+            start = time.perf_counter()
+            run_risk_analysis(holdings, end_date, stores[1])
+            return (time.perf_counter() - start) * 1000
+
+        run_risk_analysis(holdings, end_date, stores[1])  # load the matrix
+        holdings.loc[0, "market_value"] += 1
+        computed_ms = timed_run()
+        cached_ms = timed_run()
+        holdings.loc[0, "market_value"] += 1
+        changed_ms = timed_run()
+    print(f"  panel, new holdings             {computed_ms:7.1f} ms")
+    print(f"  panel, same holdings and prices {cached_ms:7.1f} ms (cached report)")
+    print(f"  panel, one holding changed      {changed_ms:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Rolling factor regression: analytics.rolling.rolling_ols vs statsmodels.
+
+Checks that betas, t-stats and R^2 match RollingOLS for every window and
+times both over ~11 years of synthetic daily data.
+
+    python -m benchmarks.bench_rolling_ols
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+from statsmodels.regression.rolling import RollingOLS
+
+from analytics.rolling import rolling_ols
+
+WINDOWS = [20, 60, 120, 252]
+FACTORS = ["Mkt-RF", "SMB", "HML", "RMW", "CMA"]
+
+
+def make_data(n_days: int = 252 * 11, seed: int = 0) -> tuple[pd.Series, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2014-01-01", periods=n_days)
+    factors = pd.DataFrame(
+        rng.normal(0, 1, (n_days, len(FACTORS))), index=index, columns=FACTORS
+    )
+    betas = rng.normal(0, 0.5, len(FACTORS))
+    endog = pd.Series(
+        factors.to_numpy() @ betas + rng.normal(0.01, 0.8, n_days),
+        index=index,
+        name="Active Returns",
+    )
+    return endog, sm.add_constant(factors)
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    endog, exog = make_data()
+    print(f"{len(endog)} days x {exog.shape[1]} regressors, windows={WINDOWS}")
+
+    results = rolling_ols(endog, exog, WINDOWS)
+    for window in WINDOWS:
+        expected = RollingOLS(endog, exog, window=window).fit()
+        result = results[window]
+        np.testing.assert_allclose(result.params, expected.params, rtol=1e-7, atol=1e-10)
+        np.testing.assert_allclose(result.tvalues, expected.tvalues, rtol=1e-6, atol=1e-8)
+        np.testing.assert_allclose(result.rsquared, expected.rsquared, rtol=1e-6, atol=1e-9)
+    print("parity with statsmodels RollingOLS: ok")
+
+    statsmodels_time = best_of(
+        lambda: [RollingOLS(endog, exog, window=w).fit() for w in WINDOWS]
+    )
+    engine_time = best_of(lambda: rolling_ols(endog, exog, WINDOWS))
+    single_time = best_of(lambda: rolling_ols(endog, exog, 60))
+    print(f"statsmodels RollingOLS, all windows: {statsmodels_time * 1000:8.1f} ms")
+    print(f"rolling_ols, all windows:            {engine_time * 1000:8.1f} ms")
+    print(f"rolling_ols, window=60:              {single_time * 1000:8.1f} ms")
+    print(f"speedup: {statsmodels_time / engine_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Worker boot cost: how long `import app` takes, which packages it spends
+that time in, and what the libraries the pages load lazily would add if
+they were imported at boot. Every measurement runs in a fresh interpreter
+with -X importtime.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --label before-lazy-imports
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import Counter
+
+from benchmarks.results import git_revision, save_results
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use rather than at boot. Each one is reported as the cost
+# it would add to boot, and flagged if something imports it at boot again.
+DEFERRED_MODULES = [
+    "openbb",
+    "sklearn.decomposition",
+    "statsmodels.api",
+    "pandas_datareader.data",
+    "snowflake.connector",
+]
+
+
+def import_times(module: str) -> tuple[float, list[tuple[str, int, int]]]:
+    """
+    Import module in a fresh interpreter under -X importtime, with the
+    background warm-ups switched off so only the boot path is measured.
+    Returns the import's wall time in ms and (module, self_us,
+    cumulative_us) for every import it triggered.
+    """
+    statement = (
+        "import time; started = time.perf_counter(); "
+        f"import {module}; print((time.perf_counter() - started) * 1000)"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=REPO_ROOT,
+        env={**os.environ, "DISABLE_WARMUP": "1", "RETURNS_CHECK_SECONDS": "0"},
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    wall_ms = float(completed.stdout.split()[-1])
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return wall_ms, modules
+
+
+def by_package(modules: list[tuple[str, int, int]]) -> Counter:
+    packages: Counter = Counter()
+    for name, self_us, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    return packages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--label", help="results file name suffix (default: git revision)"
+    )
+    args = parser.parse_args()
+
+    # The first run warms the OS file cache; report the best of the rest.
+    runs = [import_times("app") for _ in range(args.repeat + 1)][1:]
+    wall_ms, modules = min(runs, key=lambda run: run[0])
+    packages = by_package(modules)
+    loaded = {name for name, _, _ in modules}
+
+    print(f"import app: {wall_ms:.0f} ms")
+    print(f"\nTop {args.top} packages by import time at boot:")
+    for package, self_us in packages.most_common(args.top):
+        print(f"  {package:28s} {self_us / 1000:8.1f} ms")
+
+    print("\nDeferred modules (cost if imported on their own):")
+    deferred = {}
+    for module in DEFERRED_MODULES:
+        try:
+            _, module_times = import_times(module)
+        except RuntimeError:
+            print(f"  {module:28s} not installed")
+            continue
+        cumulative_us = next(c for name, _, c in module_times if name == module)
+        at_boot = module in loaded
+        deferred[module] = {
+            "cumulative_ms": cumulative_us / 1000,
+            "at_boot": at_boot,
+        }
+        flag = "  LOADED AT BOOT" if at_boot else ""
+        print(f"  {module:28s} {cumulative_us / 1000:8.1f} ms{flag}")
+
+    label = args.label or git_revision()
+    path = save_results(
+        f"startup-{label}",
+        {
+            "label": label,
+            "wall_ms": wall_ms,
+            "import_ms": sum(packages.values()) / 1000,
+            "packages_ms": {
+                package: self_us / 1000
+                for package, self_us in packages.most_common(args.top)
+            },
+            "deferred": deferred,
+        },
+    )
+    print(f"\nWrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Checks that navigating between pages and opening or closing the sidebar
+fire no server callbacks of ours: every callback driven by the URL or the
+sidebar toggle must be clientside. The only server request left on
+navigation is Dash's own page router fetching the new page's layout.
+
+Also checks the callbacks a page fires as it loads, those triggered by a
+page initializer: the children of a component no callback writes (such
+as portfolio-page-load-callback-initializer or pca-inputs-card) only
+change when the page renders. They must be clientside or background
+jobs, so loading a page never waits on a web worker thread, unless they
+are listed in LOCAL_PAGE_LOADS: server callbacks that only read local
+data, for which forking a job would cost more than the work.
+
+    python -m benchmarks.check_navigation
+"""
+
+import logging
+import sys
+
+# Dash's page router, which renders the page for the new URL.
+PAGES_ROUTER_OUTPUT = "_pages_content.children"
+
+NAVIGATION_INPUTS = {
+    "url.pathname",
+    "_pages_location.pathname",
+    "sidebar-toggle.n_clicks",
+}
+
+# Page-load server callbacks allowed in the web worker, by their first
+# output, with what keeps them cheap.
+LOCAL_PAGE_LOADS = {
+    "portfolio-risk-summary.children": "replica and returns matrix reads, report cache",
+}
+
+
+def main() -> None:
+    logging.disable(logging.INFO)
+    from app import app
+
+    client = app.server.test_client()
+    # The page router is registered on the first request.
+    client.get("/")
+    dependencies = client.get("/_dash-dependencies").get_json()
+
+    written = {
+        output.split("@")[0]
+        for dependency in dependencies
+        for output in _outputs(dependency["output"])
+    }
+
+    ok = True
+    for dependency in dependencies:
+        inputs = {f"{i['id']}.{i['property']}" for i in dependency["inputs"]}
+        triggers = inputs & NAVIGATION_INPUTS
+        if not dependency.get("prevent_initial_call"):
+            triggers |= {
+                i for i in inputs if i.endswith(".children") and i not in written
+            }
+        if not triggers:
+            continue
+        output = dependency["output"]
+        clientside = dependency.get("clientside_function") is not None
+        if clientside:
+            status = "clientside"
+        elif PAGES_ROUTER_OUTPUT in output:
+            status = "server (Dash page router)"
+        elif triggers & NAVIGATION_INPUTS:
+            status = "SERVER"
+            ok = False
+        elif dependency.get("background"):
+            status = "background job"
+        elif _outputs(output)[0] in LOCAL_PAGE_LOADS:
+            status = f"server ({LOCAL_PAGE_LOADS[_outputs(output)[0]]})"
+        else:
+            status = "SERVER"
+            ok = False
+        print(f"{', '.join(sorted(triggers)):40s} -> {output[:60]:60s} {status}")
+
+    # The header title lookup table must know every registered page.
+    layout = app.layout() if callable(app.layout) else app.layout
+    store = _find(layout, "page-titles")
+    titles = store.data if store is not None else {}
+    from dash import page_registry
+
+    missing = [p["path"] for p in page_registry.values() if p["path"] not in titles]
+    if missing:
+        print(f"page-titles is missing {', '.join(missing)}")
+        ok = False
+
+    print(
+        "navigation and page loads fire no unlisted server callbacks"
+        if ok
+        else "FAILED"
+    )
+    if not ok:
+        sys.exit(1)
+
+
+def _outputs(output: str) -> list[str]:
+    """The id.property outputs of a dependency ("..a.b...c.d.." if several)."""
+    if output.startswith(".."):
+        return output[2:-2].split("...")
+    return [output]
+
+
+def _find(component, component_id: str):
+    if getattr(component, "id", None) == component_id:
+        return component
+    children = getattr(component, "children", None)
+    if not isinstance(children, (list, tuple)):
+        children = [children]
+    for child in children:
+        if hasattr(child, "to_plotly_json"):
+            found = _find(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+if __name__ == "__main__":
+    main()
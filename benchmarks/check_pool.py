@@ -0,0 +1,186 @@
+"""
+Checks SnowflakeConnectionPool against the fake connector: concurrent
+checkouts never open more than max_size sessions, a closed idle session is
+replaced, an idle session that fails the SELECT 1 probe is replaced, a
+checkout with every session busy raises PoolTimeoutError, and sessions that
+fail with OperationalError or whose connect fails give their slot back.
+
+    python -m benchmarks.check_pool
+"""
+
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.providers import (
+    FakeSnowflakeConnect,
+    FakeSnowflakeConnection,
+    FakeSnowflakeCursor,
+    synthetic_holdings,
+)
+
+MAX_SIZE, THREADS, LATENCY = 4, 16, 0.05
+
+
+class ProbedCursor(FakeSnowflakeCursor):
+    def execute(self, sql: str, params=None) -> FakeSnowflakeCursor:
+        if self.connection.broken:
+            raise RuntimeError("session expired")
+        return super().execute(sql, params)
+
+
+class ProbedConnection(FakeSnowflakeConnection):
+    """A session that can go stale without reporting itself closed."""
+
+    broken = False
+
+    def cursor(self) -> FakeSnowflakeCursor:
+        return ProbedCursor(self)
+
+
+class ProbedConnect(FakeSnowflakeConnect):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.failing = False
+
+    def __call__(self) -> FakeSnowflakeConnection:
+        if self.failing:
+            raise ConnectionError("could not reach Snowflake")
+        connection = ProbedConnection(self.result, self.latency)
+        self.connections.append(connection)
+        return connection
+
+
+def check(label: str, ok: bool) -> bool:
+    print(f"  {label:58s} {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main() -> None:
+    logging.disable(logging.WARNING)
+    # Imported here so the other benchmarks still run where the Snowflake
+    # connector isn't installed.
+    from services.snow import (
+        OperationalError,
+        PoolTimeoutError,
+        SnowflakeConnectionPool,
+    )
+
+    connect = ProbedConnect(synthetic_holdings(10), latency=LATENCY)
+    pool = SnowflakeConnectionPool(connect, max_size=MAX_SIZE, wait_timeout=5)
+
+    in_use = 0
+    peak = 0
+    counter_lock = threading.Lock()
+
+    def query(_) -> int:
+        nonlocal in_use, peak
+        with pool.connection() as conn:
+            with counter_lock:
+                in_use += 1
+                peak = max(peak, in_use)
+            with conn.cursor() as cursor:
+                cursor.execute("select 1")
+            with counter_lock:
+                in_use -= 1
+            return id(conn)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as threads:
+        sessions = set(threads.map(query, range(THREADS * 4)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{THREADS * 4} queries from {THREADS} threads, {LATENCY * 1000:.0f} ms "
+        f"each, pool of {MAX_SIZE}: {elapsed:.2f}s"
+    )
+    stats = pool.metrics()
+    ok = check(
+        f"concurrent checkouts open at most {MAX_SIZE} sessions",
+        len(connect.connections) == MAX_SIZE
+        and len(sessions) == MAX_SIZE
+        and peak == MAX_SIZE
+        and stats["peak_in_use"] == MAX_SIZE,
+    )
+    ok &= check(
+        "every session is back idle afterwards",
+        stats["idle"] == MAX_SIZE and stats["in_use"] == 0,
+    )
+
+    # Idle sessions are handed out last-in first-out.
+    for conn, _ in pool._idle:
+        conn.closed = True
+    conn = pool.checkout()
+    pool.checkin(conn)
+    ok &= check(
+        "closed idle session is replaced",
+        not conn.closed
+        and pool.metrics()["replaced"] == 1
+        and len(connect.connections) == MAX_SIZE + 1,
+    )
+
+    pool.probe_after = 0.0
+    conn.broken = True
+    replacement = pool.checkout()
+    pool.checkin(replacement)
+    ok &= check(
+        "idle session failing the SELECT 1 probe is replaced",
+        replacement is not conn
+        and conn.closed
+        and pool.metrics()["replaced"] == 2,
+    )
+    pool.probe_after = 60.0
+
+    held = [pool.checkout() for _ in range(MAX_SIZE)]
+    start = time.monotonic()
+    try:
+        pool.checkout(timeout=0.2)
+        timed_out = False
+    except PoolTimeoutError:
+        timed_out = time.monotonic() - start >= 0.2
+    ok &= check(
+        "checkout with every session busy raises PoolTimeoutError",
+        timed_out and pool.metrics()["timeouts"] == 1,
+    )
+
+    # A waiter gets the session as soon as one is checked in.
+    waiter = ThreadPoolExecutor(max_workers=1).submit(pool.checkout, 5)
+    time.sleep(0.1)
+    released = held.pop()
+    pool.checkin(released)
+    held.append(waiter.result(timeout=1))
+    ok &= check(
+        "waiting checkout is handed the checked-in session", held[-1] is released
+    )
+    for conn in held:
+        pool.checkin(conn)
+
+    size = pool.metrics()["size"]
+    try:
+        with pool.connection():
+            raise OperationalError("connection reset")
+    except OperationalError:
+        pass
+    ok &= check(
+        "session failing with OperationalError is discarded",
+        pool.metrics()["size"] == size - 1,
+    )
+
+    pool.close_all()
+    connect.failing = True
+    try:
+        pool.checkout(timeout=0.2)
+    except ConnectionError:
+        pass
+    connect.failing = False
+    ok &= check(
+        "failed connect gives its slot back",
+        pool.metrics()["size"] == 0 and pool.checkout(timeout=0.2) is not None,
+    )
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Stand-in data providers for running the analysis pipelines offline.
+
+Each one produces data in the shape the real provider returns, so it can be
+plugged in where the app takes a provider:
+
+    PriceHistoryStore(fetcher=SyntheticPriceFetcher())
+    FactorStore(fixture_dir=write_factor_fixtures(directory))
+    SnowflakeConnector("bench", connect=FakeSnowflakeConnect(synthetic_holdings(500)))
+    SnowflakeConnector("bench", connect=FakeWarehouse(n_holdings=500))
+
+All data is derived from a seed (and the ticker symbol), so repeated runs
+and different versions of the code see the same numbers.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from datetime import date
+from functools import lru_cache
+from typing import Any, Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from services.factors import FACTOR_DATASETS
+
+
+def synthetic_tickers(n: int) -> list[str]:
+    return [f"T{i:04d}" for i in range(n)]
+
+
+@lru_cache(maxsize=8)
+def _business_days(end_date: date) -> pd.DatetimeIndex:
+    # Building the index from 1990 is most of a call's cost; calls for the
+    # same end date share it.
+    return pd.bdate_range("1990-01-01", end_date)
+
+
+class SyntheticPriceFetcher:
+    """
+    PriceFetcher returning geometric random-walk closes on business days.
+    A ticker's path depends only on its symbol and the seed, so fetching a
+    range in pieces gives the same closes as fetching it at once. latency
+    seconds are slept per call to stand in for the provider round trip;
+    slow maps tickers to a longer latency, and calls including a ticker in
+    failing raise, like an invalid symbol does.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        latency: float = 0.0,
+        slow: dict[str, float] | None = None,
+        failing: set[str] | None = None,
+    ) -> None:
+        self.seed = seed
+        self.latency = latency
+        self.slow = slow or {}
+        self.failing = failing or set()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(
+        self, tickers: list[str], start_date: date, end_date: date
+    ) -> pd.DataFrame:
+        with self._lock:
+            self.calls += 1
+        latency = max([self.latency] + [self.slow.get(t, 0.0) for t in tickers])
+        if latency:
+            time.sleep(latency)
+        bad = self.failing.intersection(tickers)
+        if bad:
+            raise ValueError(f"No results found for {sorted(bad)}")
+        # Anchor every path at a fixed origin so overlapping requests agree.
+        days = _business_days(end_date)
+        in_range = days >= pd.Timestamp(start_date)
+        frames = []
+        for ticker in tickers:
+            rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+            log_returns = rng.normal(0.0003, 0.015, len(days))
+            closes = 50 * np.exp(np.cumsum(log_returns))
+            frames.append(
+                pd.DataFrame(
+                    {"close": closes[in_range], "symbol": ticker},
+                    index=pd.DatetimeIndex(days[in_range], name="date"),
+                )
+            )
+        return pd.concat(frames)
+
+
+def synthetic_factors(
+    columns: list[str],
+    start: str = "1990-01-01",
+    end: date | None = None,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Daily factor returns in percent, like the Ken French files."""
+    index = pd.bdate_range(start, end or date.today(), name="Date")
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0.0, 0.6, (len(index), len(columns)))
+    frame = pd.DataFrame(values.round(2), index=index, columns=columns)
+    if "RF" in frame.columns:
+        frame["RF"] = 0.01
+    return frame
+
+
+def write_factor_fixtures(directory: str, seed: int = 0) -> str:
+    """
+    Write a synthetic CSV for every dataset in FACTOR_DATASETS, laid out
+    the way FactorStore reads fixtures, and return the directory.
+    """
+    columns = {
+        "F-F_Research_Data_Factors_daily": ["Mkt-RF", "SMB", "HML", "RF"],
+        "F-F_Research_Data_5_Factors_2x3_daily": [
+            "Mkt-RF",
+            "SMB",
+            "HML",
+            "RMW",
+            "CMA",
+            "RF",
+        ],
+        "F-F_Momentum_Factor_daily": ["Mom"],
+    }
+    os.makedirs(directory, exist_ok=True)
+    names = dict.fromkeys(name for names in FACTOR_DATASETS.values() for name in names)
+    # A seed per dataset, so e.g. the momentum factor isn't a copy of Mkt-RF.
+    for i, name in enumerate(names):
+        synthetic_factors(columns[name], seed=seed + i).to_csv(
+            os.path.join(directory, f"{name}.csv")
+        )
+    return directory
+
+
+def synthetic_holdings(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Rows shaped like sql/user_portfolios.sql, column names upper case."""
+    rng = np.random.default_rng(seed)
+    shares = rng.integers(1, 500, n_rows).astype(float)
+    cost = rng.uniform(5, 500, n_rows).round(2)
+    price = (cost * rng.lognormal(0.05, 0.3, n_rows)).round(2)
+    as_of = pd.Timestamp("2024-01-02")
+    return pd.DataFrame(
+        {
+            "TICKER": synthetic_tickers(n_rows),
+            "NUM_SHARES": shares,
+            "AVG_COST": cost,
+            "PRICE_DATE": as_of,
+            "PRICE": price,
+            "MARKET_VALUE": shares * price,
+            "TOTAL_COST": shares * cost,
+            "UNREALIZED_GAIN_LOSS": shares * (price - cost),
+            "USER_NAME": "bench",
+            "BROKER_NAME": rng.choice(["Schwab", "Fidelity", "Vanguard"], n_rows),
+            "PORTFOLIO_NAME": rng.choice(["Taxable", "IRA", "Roth"], n_rows),
+            "PORTFOLIO_AS_OF_DATE": as_of,
+            "PORTFOLIO_LAST_UPDATED_DATE": as_of,
+        }
+    )
+
+
+class FakeSnowflakeCursor:
+    def __init__(self, connection: "FakeSnowflakeConnection") -> None:
+        self.connection = connection
+
+    def __enter__(self) -> "FakeSnowflakeCursor":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+    def execute(self, sql: str, params: Any = None) -> "FakeSnowflakeCursor":
+        self.connection.executed += 1
+        if self.connection.latency:
+            time.sleep(self.connection.latency)
+        return self
+
+    def fetch_pandas_all(self) -> pd.DataFrame:
+        return self.connection.result.copy()
+
+    def fetch_arrow_all(self, force_return_table: bool = False) -> pa.Table:
+        return pa.Table.from_pandas(self.connection.result, preserve_index=False)
+
+    def fetch_arrow_batches(self) -> Iterator[pa.Table]:
+        table = self.fetch_arrow_all()
+        for batch in table.to_batches(max_chunksize=10_000):
+            yield pa.Table.from_batches([batch])
+
+
+class FakeSnowflakeConnection:
+    """Answers every query with the same result frame after latency seconds."""
+
+    def __init__(self, result: pd.DataFrame, latency: float = 0.0) -> None:
+        self.result = result
+        self.latency = latency
+        self.executed = 0
+        self.closed = False
+
+    def cursor(self) -> FakeSnowflakeCursor:
+        return FakeSnowflakeCursor(self)
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeSnowflakeConnect:
+    """Zero-arg connect factory for SnowflakeConnector(connect=...)."""
+
+    def __init__(self, result: pd.DataFrame, latency: float = 0.0) -> None:
+        self.result = result
+        self.latency = latency
+        self.connections: list[FakeSnowflakeConnection] = []
+
+    def __call__(self) -> FakeSnowflakeConnection:
+        connection = FakeSnowflakeConnection(self.result, self.latency)
+        self.connections.append(connection)
+        return connection
+
+
+
+class FakeWarehouse:
+    """
+    Zero-arg connect factory backed by holdings and a daily close timeseries
+    held in memory, answering the portfolio queries (sql/user_portfolios.sql,
+    most_recent_stock_prices.sql and the replica sync queries) the way the
+    warehouse would, with upper-case column names. Holdings and closes can
+    be changed between queries to exercise incremental syncs.
+
+    Queries started with execute_async run for `latency` seconds without
+    holding a thread, like the real warehouse; the next `async_failures`
+    of them fail.
+    """
+
+    def __init__(
+        self, n_holdings: int, n_users: int = 1, days: int = 250, seed: int = 0
+    ) -> None:
+        rng = np.random.default_rng(seed)
+        self.updated_at = pd.Timestamp("2024-01-02 09:00")
+        tickers = synthetic_tickers(n_holdings)
+        brokers = ["Schwab", "Fidelity", "Vanguard"]
+        self.holdings = pd.DataFrame(
+            {
+                "user_id": rng.integers(1, n_users + 1, n_holdings),
+                "user_name": "bench",
+                "broker_name": rng.choice(brokers, n_holdings),
+                "portfolio_name": "Taxable",
+                "portfolio_id": rng.integers(1, 4, n_holdings),
+                "ticker": tickers,
+                "num_shares": rng.integers(1, 500, n_holdings).astype(float),
+                "avg_cost": rng.uniform(5, 500, n_holdings).round(2),
+                "as_of": self.updated_at.normalize(),
+                "last_updated": self.updated_at
+                - pd.to_timedelta(rng.integers(0, 90 * 24 * 60, n_holdings), "min"),
+            }
+        )
+        dates = pd.bdate_range(end="2024-01-02", periods=days)
+        self.prices = pd.DataFrame(
+            {
+                "date": np.repeat(dates, n_holdings),
+                "ticker": np.tile(tickers, days),
+                "value": rng.uniform(5, 500, days * n_holdings).round(2),
+            }
+        )
+        self.queries: list[str] = []
+        self.latency = 0.0
+        self.connections: list[FakeSnowflakeConnection] = []
+        self.async_failures = 0
+        self.aborted: list[str] = []
+        self._async_queries: dict[str, dict[str, Any]] = {}
+        self._async_lock = threading.Lock()
+
+    def __call__(self) -> FakeSnowflakeConnection:
+        connection = FakeWarehouseConnection(self)
+        self.connections.append(connection)
+        return connection
+
+    def update_holding(self, ticker: str, num_shares: float) -> None:
+        self.updated_at += pd.Timedelta(minutes=1)
+        row = self.holdings["ticker"] == ticker
+        self.holdings.loc[row, ["num_shares", "last_updated"]] = [
+            num_shares,
+            self.updated_at,
+        ]
+
+    def add_holding(self, ticker: str, num_shares: float, price: float) -> None:
+        self.updated_at += pd.Timedelta(minutes=1)
+        row = self.holdings.iloc[[0]].assign(
+            ticker=ticker, num_shares=num_shares, last_updated=self.updated_at
+        )
+        self.holdings = pd.concat([self.holdings, row], ignore_index=True)
+        close = {"date": self.prices["date"].min(), "ticker": ticker, "value": price}
+        self.prices = pd.concat([self.prices, pd.DataFrame([close])])
+
+    def remove_holding(self, ticker: str) -> None:
+        self.holdings = self.holdings[self.holdings["ticker"] != ticker]
+
+    def add_closes(self, day: str, tickers: list[str], value: float) -> None:
+        closes = pd.DataFrame({"date": pd.Timestamp(day), "ticker": tickers})
+        self.prices = pd.concat([self.prices, closes.assign(value=value)])
+
+    def answer(self, sql: str, params: dict[str, Any] | None) -> pd.DataFrame:
+        self.queries.append(sql)
+        params = params or {}
+        since = params.get("since")
+        held = self.prices[self.prices["ticker"].isin(self.holdings["ticker"])]
+        if "holdings.last_updated >= %(since)s" in sql:
+            result = self.holdings
+            if since is not None:
+                result = result[result["last_updated"] >= pd.Timestamp(since)]
+        elif sql.startswith("SELECT holdings.portfolio_id"):
+            result = self.holdings[["portfolio_id", "ticker"]]
+        elif "date > %(since)s" in sql:
+            if since is not None:
+                held = held[held["date"] > pd.Timestamp(since)]
+            result = self._latest(held)
+        elif "with user_portfolio as" in sql:
+            latest = self._latest(held).rename(
+                columns={"date": "price_date", "value": "price"}
+            )
+            holdings = self.holdings
+            if "user_id" in params:
+                holdings = holdings[holdings["user_id"] == params["user_id"]]
+            elif params.get("user_ids") is not None:
+                user_ids = json.loads(params["user_ids"])
+                holdings = holdings[holdings["user_id"].isin(user_ids)]
+            result = holdings.merge(latest, on="ticker")
+            result = pd.DataFrame(
+                {
+                    "user_id": result["user_id"],
+                    "ticker": result["ticker"],
+                    "num_shares": result["num_shares"],
+                    "avg_cost": result["avg_cost"],
+                    "price_date": result["price_date"],
+                    "price": result["price"],
+                    "market_value": result["num_shares"] * result["price"],
+                    "total_cost": result["num_shares"] * result["avg_cost"],
+                    "unrealized_gain_loss": result["num_shares"]
+                    * (result["price"] - result["avg_cost"]),
+                    "user_name": result["user_name"],
+                    "broker_name": result["broker_name"],
+                    "portfolio_name": result["portfolio_name"],
+                    "portfolio_as_of_date": result["as_of"],
+                    "portfolio_last_updated_date": result["last_updated"],
+                }
+            )
+            if "user_ids" not in params:
+                result = result.drop(columns="user_id")
+        else:
+            tickers = re.findall(r"'([^']+)'", sql.split("ticker IN", 1)[1])
+            result = self._latest(self.prices[self.prices["ticker"].isin(tickers)])
+        return result.reset_index(drop=True).rename(columns=str.upper)
+
+    def start_async(self, sql: str, params: dict[str, Any] | None) -> str:
+        with self._async_lock:
+            sfqid = f"fake-{len(self._async_queries) + 1}"
+            failed = self.async_failures > 0
+            self.async_failures -= failed
+            self._async_queries[sfqid] = {
+                "done_at": time.monotonic() + self.latency,
+                "result": None if failed else self.answer(sql, params),
+                "status": "FAILED_WITH_ERROR" if failed else "SUCCESS",
+            }
+        return sfqid
+
+    def async_status(self, sfqid: str) -> str:
+        with self._async_lock:
+            query = self._async_queries[sfqid]
+            if query["status"] == "SUCCESS" and time.monotonic() < query["done_at"]:
+                return "RUNNING"
+            return query["status"]
+
+    def async_result(self, sfqid: str) -> pd.DataFrame:
+        status = self.async_status(sfqid)
+        if status != "SUCCESS":
+            raise RuntimeError(f"Query {sfqid} ended with status {status}")
+        return self._async_queries[sfqid]["result"]
+
+    def abort(self, sfqid: str) -> bool:
+        with self._async_lock:
+            self._async_queries[sfqid]["status"] = "ABORTED"
+            self.aborted.append(sfqid)
+        return True
+
+    @staticmethod
+    def _latest(prices: pd.DataFrame) -> pd.DataFrame:
+        latest = prices.sort_values("date").groupby("ticker").tail(1)
+        return latest[["date", "ticker", "value"]]
+
+
+class FakeWarehouseCursor(FakeSnowflakeCursor):
+    def execute(self, sql: str, params: Any = None) -> "FakeSnowflakeCursor":
+        warehouse = self.connection.warehouse
+        self.connection.result = warehouse.answer(sql, params)
+        self.connection.latency = warehouse.latency
+        return super().execute(sql, params)
+
+    def execute_async(self, sql: str, params: Any = None) -> dict[str, str]:
+        self.sfqid = self.connection.warehouse.start_async(sql, params)
+        return {"queryId": self.sfqid}
+
+    def get_results_from_sfqid(self, sfqid: str) -> None:
+        self.connection.result = self.connection.warehouse.async_result(sfqid)
+
+    def abort_query(self, sfqid: str) -> bool:
+        return self.connection.warehouse.abort(sfqid)
+
+
+class FakeWarehouseConnection(FakeSnowflakeConnection):
+    def __init__(self, warehouse: FakeWarehouse) -> None:
+        super().__init__(pd.DataFrame(), warehouse.latency)
+        self.warehouse = warehouse
+
+    def cursor(self) -> FakeSnowflakeCursor:
+        return FakeWarehouseCursor(self)
+
+    def get_query_status(self, sfqid: str) -> str:
+        return self.warehouse.async_status(sfqid)
+
+    def is_still_running(self, status: str) -> bool:
+        return status in ("QUEUED", "RUNNING", "RESUMING_WAREHOUSE")
@@ -0,0 +1,37 @@
+"""Where benchmark runs are saved, so runs from different commits can be compared."""
+
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Any
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(name: str, output: dict[str, Any]) -> str:
+    """Write output, stamped with the revision and run time, to RESULTS_DIR."""
+    output = {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        **output,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{name}.json")
+    with open(path, "w") as file:
+        json.dump(output, file, indent=2)
+    return path
@@ -0,0 +1,494 @@
+"""
+Offline benchmarks for the PCA, Fama-French and portfolio pipelines.
+
+Every pipeline runs against the stand-in providers in benchmarks.providers,
+so no OpenBB, Ken French or Snowflake access is needed. Each case times the
+end-to-end callback body and its inner stages, sweeping ticker count and
+date range. Results are written to benchmarks/results/<label>.json (label
+defaults to the current commit) and can be compared with an earlier run:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --quick --label before
+    python -m benchmarks.suite --quick --compare benchmarks/results/before.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+from analytics.pca import fit_pca
+from benchmarks.providers import (
+    FakeSnowflakeConnect,
+    SyntheticPriceFetcher,
+    synthetic_holdings,
+    synthetic_tickers,
+    write_factor_fixtures,
+)
+from benchmarks.results import git_revision, save_results
+from callbacks.fama_french import (
+    COMPARE_ALL,
+    MODEL_FACTORS,
+    factor_regression,
+    rolling_coeffs_traces,
+    rolling_factor_bands,
+    rolling_factor_regression,
+    run_factor_analysis,
+)
+from callbacks.pca import patch_charts, run_pca_analysis
+from services.factors import FactorStore
+from services.pca_cache import PCAFitCache
+from services.price_store import PriceHistoryStore
+from services.returns_matrix import ReturnsMatrixStore, get_daily_returns
+from utils.grid import GridRowSource
+
+SWEEPS = {
+    "full": {
+        "tickers": [10, 50, 250],
+        "years": [1, 5, 10],
+        "holdings": [100, 1000, 10000],
+    },
+    "quick": {"tickers": [10, 50], "years": [1, 5], "holdings": [100, 1000]},
+}
+
+# A stage is flagged by --compare when its median grows by more than this
+# ratio and by more than REGRESSION_MIN_MS (sub-millisecond stages are noise).
+REGRESSION_RATIO = 1.25
+REGRESSION_MIN_MS = 1.0
+
+N_COMPONENTS = 3
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "max_ms": max(timings),
+        "runs": repeat,
+    }
+
+
+def date_range(years: int) -> tuple[date, date]:
+    end_date = date.today() - timedelta(days=1)
+    return end_date - timedelta(days=365 * years), end_date
+
+
+class Suite:
+    def __init__(self, workdir: str, repeat: int) -> None:
+        self.workdir = workdir
+        self.repeat = repeat
+        self.results: list[dict[str, Any]] = []
+        self.cold_runs = 0
+        self.factor_store = FactorStore(
+            root=os.path.join(workdir, "factors"),
+            fixture_dir=write_factor_fixtures(os.path.join(workdir, "fixtures")),
+            environment="bench",
+        )
+        # Never built, so the price store path is what gets timed.
+        self.no_matrix = self.returns_store("none")
+        # Keeps nothing, so every end-to-end PCA run fetches and fits.
+        self.no_pca_cache = PCAFitCache(max_bytes=0)
+
+    def record(
+        self, pipeline: str, stage: str, fn: Callable[[], Any], **case: Any
+    ) -> None:
+        timing = measure(fn, self.repeat)
+        self.results.append({"pipeline": pipeline, "stage": stage, **case, **timing})
+        params = " ".join(f"{key}={value}" for key, value in case.items())
+        print(
+            f"{pipeline:10s} {stage:18s} {params:28s} "
+            f"{timing['median_ms']:10.2f} ms"
+        )
+
+    def price_store(self, name: str) -> PriceHistoryStore:
+        return PriceHistoryStore(
+            root=os.path.join(self.workdir, "prices", name),
+            fetcher=SyntheticPriceFetcher(),
+            environment="bench",
+        )
+
+    def returns_store(self, name: str) -> ReturnsMatrixStore:
+        return ReturnsMatrixStore(
+            root=os.path.join(self.workdir, "returns", name), environment="bench"
+        )
+
+    def cold_fetch(self, tickers: list[str], start_date: date, end_date: date) -> None:
+        """First request for a range: provider call, Parquet writes, reads."""
+        self.cold_runs += 1
+        self.price_store(f"cold-{self.cold_runs}").get_closes(
+            tickers, start_date, end_date
+        )
+
+    def run_pca(self, n_tickers: int, years: int) -> None:
+        case = {"tickers": n_tickers, "years": years}
+        tickers = synthetic_tickers(n_tickers)
+        start_date, end_date = date_range(years)
+        store = self.price_store("pca")
+        store.get_closes(tickers, start_date, end_date)
+
+        prices = store.get_closes(tickers, start_date, end_date)
+        returns = prices.pct_change(fill_method=None).iloc[1:]
+        pca = fit_pca(returns, N_COMPONENTS)
+        exposures = pd.DataFrame(
+            pca.components_.T,
+            index=pca.columns,
+            columns=[f"f{i + 1}" for i in range(pca.n_components)],
+        )
+
+        self.record(
+            "pca",
+            "fetch_cold",
+            lambda: self.cold_fetch(tickers, start_date, end_date),
+            **case,
+        )
+        self.record(
+            "pca",
+            "fetch_warm",
+            lambda: store.get_closes(tickers, start_date, end_date),
+            **case,
+        )
+        self.record(
+            "pca",
+            "pct_change",
+            lambda: prices.pct_change(fill_method=None).iloc[1:],
+            **case,
+        )
+        matrix_store = self.returns_store(f"pca-{n_tickers}-{years}")
+        matrix_store.build(tickers, start_date, end_date, price_store=store)
+        self.record(
+            "pca",
+            "returns_fetch",
+            lambda: get_daily_returns(
+                tickers, start_date, end_date, store, self.no_matrix
+            ),
+            **case,
+        )
+        self.record(
+            "pca",
+            "returns_matrix",
+            lambda: get_daily_returns(
+                tickers, start_date, end_date, store, matrix_store
+            ),
+            **case,
+        )
+        self.record("pca", "fit", lambda: fit_pca(returns, N_COMPONENTS), **case)
+        self.record(
+            "pca",
+            "figures",
+            lambda: [
+                to_json_plotly(patch.to_plotly_json())
+                for patch in patch_charts(
+                    pca.explained_variance_ratio_,
+                    np.cumsum(pca.explained_variance_ratio_),
+                    exposures,
+                    exposures.index,
+                    pca.n_components,
+                )
+            ],
+            **case,
+        )
+        self.record(
+            "pca",
+            "end_to_end",
+            lambda: run_pca_analysis(
+                tickers,
+                N_COMPONENTS,
+                start_date,
+                end_date,
+                price_store=store,
+                returns_store=self.no_matrix,
+                pca_cache=self.no_pca_cache,
+            ),
+            **case,
+        )
+        self.record(
+            "pca",
+            "end_to_end_matrix",
+            lambda: run_pca_analysis(
+                tickers,
+                N_COMPONENTS,
+                start_date,
+                end_date,
+                price_store=store,
+                returns_store=matrix_store,
+                pca_cache=self.no_pca_cache,
+            ),
+            **case,
+        )
+        # Changing the components dropdown: the fit is sliced from the cache.
+        fit_cache = PCAFitCache()
+        run_pca_analysis(
+            tickers,
+            N_COMPONENTS,
+            start_date,
+            end_date,
+            price_store=store,
+            pca_cache=fit_cache,
+        )
+        self.record(
+            "pca",
+            "components_cached",
+            lambda: run_pca_analysis(
+                tickers,
+                N_COMPONENTS - 1,
+                start_date,
+                end_date,
+                price_store=store,
+                pca_cache=fit_cache,
+            ),
+            **case,
+        )
+
+    def run_fama_french(self, n_tickers: int, years: int, model: str = "FF5") -> None:
+        case = {"tickers": n_tickers, "years": years}
+        tickers = synthetic_tickers(n_tickers)
+        weights = [1 / n_tickers] * n_tickers
+        start_date, end_date = date_range(years)
+        store = self.price_store("fama-french")
+        store.get_closes(tickers + ["SPY"], start_date, end_date)
+        factors = MODEL_FACTORS[model]
+
+        prices = store.get_closes(tickers, start_date, end_date)
+        benchmark = store.get_closes(["SPY"], start_date, end_date)["SPY"]
+
+        def active_returns() -> pd.Series:
+            stock_returns = prices.pct_change().dropna()
+            active = (stock_returns * weights).sum(axis=1) - benchmark.pct_change()
+            return active.dropna().rename("Active Returns")
+
+        def merged() -> pd.DataFrame:
+            factors_daily = self.factor_store.for_model(model, start_date, end_date)
+            return pd.merge(
+                active, factors_daily, left_index=True, right_index=True, how="inner"
+            )
+
+        active = active_returns()
+        data = merged()
+        coeffs = rolling_factor_regression(data, factors).params.dropna()
+
+        self.record(
+            "ff",
+            "fetch_warm",
+            lambda: store.get_closes(tickers, start_date, end_date),
+            **case,
+        )
+        self.record("ff", "active_returns", active_returns, **case)
+        self.record("ff", "factors_merge", merged, **case)
+        self.record(
+            "ff",
+            "rolling_fit",
+            lambda: rolling_factor_regression(data, factors),
+            **case,
+        )
+        self.record(
+            "ff",
+            "bootstrap",
+            lambda: rolling_factor_bands(data, factors, resamples=500),
+            **case,
+        )
+        self.record(
+            "ff",
+            "ols_summary",
+            lambda: factor_regression(data, factors).summary().as_text(),
+            **case,
+        )
+        self.record(
+            "ff",
+            "figures",
+            lambda: to_json_plotly(rolling_coeffs_traces(coeffs)),
+            **case,
+        )
+        self.record(
+            "ff",
+            "end_to_end",
+            lambda: run_factor_analysis(
+                tickers,
+                weights,
+                model,
+                start_date,
+                end_date,
+                price_store=store,
+                factor_store=self.factor_store,
+                returns_store=self.no_matrix,
+            ),
+            **case,
+        )
+        self.record(
+            "ff",
+            "compare_all",
+            lambda: run_factor_analysis(
+                tickers,
+                weights,
+                COMPARE_ALL,
+                start_date,
+                end_date,
+                price_store=store,
+                factor_store=self.factor_store,
+                returns_store=self.no_matrix,
+            ),
+            **case,
+        )
+
+    def run_portfolio(self, n_rows: int) -> None:
+        # Imported here so the price and factor benchmarks still run where
+        # the Snowflake connector isn't installed.
+        from services.snow import SnowflakeConnector
+
+        case = {"rows": n_rows}
+        connect = FakeSnowflakeConnect(synthetic_holdings(n_rows))
+        db = SnowflakeConnector("bench", connect=connect)
+        # The connector is a process-wide singleton; point it at this
+        # case's fake and drop connections serving the previous one.
+        db.pool.close_all()
+        db.pool.connect = connect
+
+        def cold_query() -> pd.DataFrame:
+            db.invalidate_cache("sql/user_portfolios.sql")
+            return db.get_user_portfolios(1)
+
+        def load() -> pd.DataFrame:
+            return db.get_user_portfolios(1).sort_values(
+                by="market_value", ascending=False
+            )
+
+        first_block = {"startRow": 0, "endRow": 100}
+        sorted_filtered = {
+            "startRow": 0,
+            "endRow": 100,
+            "sortModel": [{"colId": "unrealized_gain_loss", "sort": "desc"}],
+            "filterModel": {
+                "broker_name": {
+                    "filterType": "text",
+                    "type": "equals",
+                    "filter": "Schwab",
+                }
+            },
+        }
+        warm_rows = GridRowSource()
+        warm_rows.get_rows("portfolio", load, sorted_filtered)
+
+        self.record("portfolio", "query_cold", cold_query, **case)
+        self.record(
+            "portfolio", "query_warm", lambda: db.get_user_portfolios(1), **case
+        )
+        self.record(
+            "portfolio",
+            "grid_first_block",
+            lambda: GridRowSource().get_rows("portfolio", load, first_block),
+            **case,
+        )
+        self.record(
+            "portfolio",
+            "grid_sort_filter",
+            lambda: GridRowSource().get_rows("portfolio", load, sorted_filtered),
+            **case,
+        )
+        self.record(
+            "portfolio",
+            "grid_cached_view",
+            lambda: warm_rows.get_rows("portfolio", load, sorted_filtered),
+            **case,
+        )
+
+
+def result_key(result: dict[str, Any]) -> tuple:
+    return tuple(
+        (key, result.get(key))
+        for key in ("pipeline", "stage", "tickers", "years", "rows")
+    )
+
+
+def compare(results: list[dict[str, Any]], baseline_path: str) -> int:
+    with open(baseline_path, "r") as file:
+        baseline = {result_key(r): r for r in json.load(file)["results"]}
+    regressions = 0
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get(result_key(result))
+        if before is None:
+            continue
+        ratio = (
+            result["median_ms"] / before["median_ms"] if before["median_ms"] else 1.0
+        )
+        slower_ms = result["median_ms"] - before["median_ms"]
+        if ratio > REGRESSION_RATIO and slower_ms > REGRESSION_MIN_MS:
+            regressions += 1
+            flag = "  REGRESSION"
+        else:
+            flag = ""
+        case = " ".join(
+            f"{key}={value}"
+            for key, value in result_key(result)[2:]
+            if value is not None
+        )
+        print(
+            f"{result['pipeline']:10s} {result['stage']:16s} {case:28s} "
+            f"{before['median_ms']:10.2f} -> {result['median_ms']:10.2f} ms "
+            f"({ratio:5.2f}x){flag}"
+        )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="smaller sweep")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--pipelines", default="pca,ff,portfolio", help="comma separated subset"
+    )
+    parser.add_argument("--label", help="results file name (default: git revision)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    # Keep the per-request INFO lines from the stores out of the report.
+    logging.disable(logging.INFO)
+    sweep = SWEEPS["quick" if args.quick else "full"]
+    pipelines = set(args.pipelines.split(","))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        suite = Suite(workdir, args.repeat)
+        for n_tickers in sweep["tickers"]:
+            for years in sweep["years"]:
+                if "pca" in pipelines:
+                    suite.run_pca(n_tickers, years)
+                if "ff" in pipelines:
+                    suite.run_fama_french(n_tickers, years)
+        if "portfolio" in pipelines:
+            for n_rows in sweep["holdings"]:
+                suite.run_portfolio(n_rows)
+
+    label = args.label or git_revision()
+    path = save_results(
+        label,
+        {
+            "label": label,
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sweep": "quick" if args.quick else "full",
+            "repeat": args.repeat,
+            "results": suite.results,
+        },
+    )
+    print(f"\nWrote {path}")
+
+    if args.compare and compare(suite.results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,314 @@
-from dash import callback, Output, Input, State, no_update
-from datetime import datetime
+from dash import callback, Output, Input, State, Patch, no_update
+from datetime import date, datetime
 import numpy as np
-from typing import cast
+import os
+from typing import TYPE_CHECKING, Callable
 import pandas as pd
 import plotly.graph_objs as go
-import plotly.io as pio
-from sklearn.decomposition import PCA
-from openbb import obb
+from plotly.colors import qualitative
 import dash_bootstrap_components as dbc
-from pandas_datareader import data as pdr
-from pandas_datareader.famafrench import get_available_datasets
-import statsmodels.api as sm
-from statsmodels.regression.rolling import RollingOLS
-from statsmodels.regression.rolling import RollingRegressionResults
+from analytics.bootstrap import RollingBands, bootstrap_rolling_ols
+from analytics.factor_models import comparison_table, fit_nested_models
+from analytics.rolling import RollingOLSResult, rolling_ols
+from services.factors import FACTOR_DATASETS, FactorStore, get_factor_store
+from services.jobs import get_analysis_slots, get_single_flight
+from services.price_store import PriceFetchError, PriceHistoryStore, failed_tickers
+from services.returns_matrix import ReturnsMatrixStore, get_daily_returns
+from utils.downsample import downsample_series
+from utils.metrics import get_metrics, timed
 from utils.utils import is_float
 
+if TYPE_CHECKING:
+    from statsmodels.regression.linear_model import RegressionResultsWrapper
 
-obb.user.preferences.output_type = "dataframe"  # type: ignore
-
-pio.templates.default = "plotly"
+# statsmodels (and the scipy stack under it) is imported by the functions
+# that fit models, so booting a worker doesn't pay for it; the page preloads
+# it in the background when it is first served.
 
 page_prefix = "fama-french-"
 
 
+def rolling_coeffs_figure() -> go.Figure:
+    """
+    Empty rolling coefficient chart. The page renders it once and each
+    submit only patches in the traces, so the layout is never resent.
+    """
+    return go.Figure(
+        layout=go.Layout(
+            xaxis=dict(title="Date"),
+            yaxis=dict(title="Coefficient"),
+        )
+    )
+
+
+def rolling_coeffs_traces(
+    coeffs_df: pd.DataFrame, bands: RollingBands | None = None
+) -> list[go.Scatter]:
+    """
+    One line per coefficient, downsampled to roughly the chart's width,
+    each with its bootstrap band (if given) shaded behind it at the same
+    dates.
+    """
+    traces = []
+    colors = qualitative.Plotly
+    for i, col in enumerate(coeffs_df.columns):
+        series = downsample_series(coeffs_df[col])
+        color = colors[i % len(colors)]
+        if bands is not None:
+            for edge, fill in [(bands.lower, "none"), (bands.upper, "tonexty")]:
+                traces.append(
+                    go.Scatter(
+                        x=series.index,
+                        y=edge[col].reindex(series.index).to_numpy(),
+                        mode="lines",
+                        line=dict(width=0, color=color),
+                        fill=fill,
+                        opacity=0.2,
+                        legendgroup=col,
+                        showlegend=False,
+                        hoverinfo="skip",
+                    )
+                )
+        traces.append(
+            go.Scatter(
+                x=series.index,
+                y=series.to_numpy(),
+                mode="lines",
+                line=dict(color=color),
+                name=col,
+                legendgroup=col,
+            )
+        )
+    return traces
+
+
+# Factors each model regresses active returns on when it is fitted alone.
+# Active returns are already net of SPY, so the multi-factor models leave
+# the market factor out; CAPM has nothing else to regress on.
+MODEL_FACTORS = {
+    "CAPM": ["Mkt-RF"],
+    "FF3": ["SMB", "HML"],
+    "FF5": ["SMB", "HML", "RMW", "CMA"],
+    "Carhart": ["SMB", "HML", "Mom"],
+}
+
+# Factors for Compare all. Every model keeps Mkt-RF there so the models are
+# nested (CAPM within FF3, FF3 within FF5 and Carhart) and CAPM's alpha is
+# comparable with the others'.
+COMPARISON_FACTORS = {
+    model: list(dict.fromkeys(["Mkt-RF", *factors]))
+    for model, factors in MODEL_FACTORS.items()
+}
+
+# Dropdown value that fits every model in MODEL_FACTORS side by side.
+COMPARE_ALL = "Compare all"
+
+
+def factor_regression(data, factors) -> "RegressionResultsWrapper":
+    import statsmodels.api as sm
+
+    Y = (
+        data["Active Returns"] * 100  # - data["RF"]
+    )  # Convert returns to % for consistency
+    X = data[factors]
+    X = sm.add_constant(X)
+    model = sm.OLS(Y, X).fit()
+    return model
+
+
+def rolling_factor_regression(
+    data: pd.DataFrame, factors: list[str]
+) -> RollingOLSResult:
+    import statsmodels.api as sm
+
+    exog = sm.add_constant(data[factors])
+    return rolling_ols(data["Active Returns"] * 100, exog, windows=60)[60]
+
+
+def rolling_factor_bands(
+    data: pd.DataFrame, factors: list[str], resamples: int
+) -> RollingBands:
+    """90% block-bootstrap bands around rolling_factor_regression's betas."""
+    import statsmodels.api as sm
+
+    exog = sm.add_constant(data[factors])
+    return bootstrap_rolling_ols(
+        data["Active Returns"] * 100, exog, window=60, resamples=resamples
+    )
+
+
+def portfolio_active_returns(
+    tickers: list[str],
+    weights: list[float],
+    start_date: date,
+    end_date: date,
+    price_store: PriceHistoryStore | None = None,
+    returns_store: ReturnsMatrixStore | None = None,
+) -> pd.Series:
+    """
+    Daily returns of the weighted portfolio less those of SPY. A ticker
+    listed more than once holds the sum of its weights.
+    """
+    metrics = get_metrics()
+    holdings = pd.Series(weights, index=tickers, dtype="float64")
+    holdings = holdings.groupby(level=0, sort=False).sum()
+    with metrics.timer("ff.fetch"):
+        stock_returns = get_daily_returns(
+            list(holdings.index), start_date, end_date, price_store, returns_store
+        )
+    # Every holding is needed for the portfolio's returns, so a ticker that
+    # could not be fetched, or has no prices in the range, fails the request
+    # instead of being left out.
+    failed = list(failed_tickers(stock_returns))
+    failed += [
+        ticker
+        for ticker in holdings.index
+        if ticker not in stock_returns.columns and ticker not in failed
+    ]
+    if failed:
+        raise PriceFetchError(f"Could not fetch prices for {', '.join(failed)}.")
+    stock_returns = stock_returns[holdings.index].dropna()
+
+    portfolio_returns = stock_returns @ holdings
+    portfolio_returns.name = "Portfolio"
+    if "SPY" in holdings.index:
+        benchmark_returns = stock_returns["SPY"]
+    else:
+        with metrics.timer("ff.fetch"):
+            benchmark_returns = get_daily_returns(
+                ["SPY"], start_date, end_date, price_store, returns_store
+            )["SPY"].dropna()
+
+    active_returns = (portfolio_returns - benchmark_returns).dropna()
+    active_returns.name = "Active Returns"
+    return active_returns
+
+
+def run_factor_analysis(
+    tickers: list[str],
+    weights: list[float],
+    model: str,
+    start_date: date,
+    end_date: date,
+    set_progress: Callable[[str], None] = lambda _: None,
+    price_store: PriceHistoryStore | None = None,
+    factor_store: FactorStore | None = None,
+    returns_store: ReturnsMatrixStore | None = None,
+    with_bands: bool = False,
+) -> tuple[str, pd.DataFrame, RollingBands | None]:
+    """
+    Body of update_tables once the inputs are validated. Returns the full
+    period OLS summary, the rolling 60 day coefficients and, if with_bands,
+    their bootstrap bands (None otherwise, or if BOOTSTRAP_RESAMPLES is 0).
+    The bands take a few times longer than the fit, so the page asks for
+    them with a checkbox. Kept outside the callback so the benchmarks can
+    run it against stand-in providers.
+    """
+    if model == COMPARE_ALL:
+        return run_model_comparison(
+            tickers,
+            weights,
+            start_date,
+            end_date,
+            set_progress,
+            price_store,
+            factor_store,
+            returns_store,
+        )
+    factors = MODEL_FACTORS[model]
+    metrics = get_metrics()
+
+    set_progress("Fetching prices...")
+    active_returns = portfolio_active_returns(
+        tickers, weights, start_date, end_date, price_store, returns_store
+    )
+
+    set_progress("Loading factors...")
+    with metrics.timer("ff.factors"):
+        factors_daily = (factor_store or get_factor_store()).for_model(
+            model, start_date, end_date
+        )
+    data = pd.merge(
+        active_returns,
+        factors_daily,
+        left_index=True,
+        right_index=True,
+        how="inner",
+    )
+
+    set_progress("Fitting factor model...")
+    with metrics.timer("ff.fit"):
+        model_results = rolling_factor_regression(data, factors)
+        ols_model_results = factor_regression(data, factors)
+        model_summary = ols_model_results.summary().as_text()
+
+    coeffs_df = model_results.params.dropna()
+    coeffs_df.index = pd.to_datetime(coeffs_df.index)
+
+    bands = None
+    resamples = int(os.getenv("BOOTSTRAP_RESAMPLES", "500"))
+    if with_bands and resamples > 0:
+        set_progress("Bootstrapping confidence bands...")
+        with metrics.timer("ff.bootstrap"):
+            bands = rolling_factor_bands(data, factors, resamples)
+        for frame in [bands.lower, bands.upper]:
+            frame.index = pd.to_datetime(frame.index)
+    return model_summary, coeffs_df, bands
+
+
+def run_model_comparison(
+    tickers: list[str],
+    weights: list[float],
+    start_date: date,
+    end_date: date,
+    set_progress: Callable[[str], None] = lambda _: None,
+    price_store: PriceHistoryStore | None = None,
+    factor_store: FactorStore | None = None,
+    returns_store: ReturnsMatrixStore | None = None,
+) -> tuple[str, pd.DataFrame, None]:
+    """
+    Fit every model in COMPARISON_FACTORS from one fetch of prices and factors.
+    Returns a side-by-side table of alphas, betas, R^2 and information
+    criteria, and each model's rolling 60 day alpha for the chart.
+    """
+    metrics = get_metrics()
+
+    set_progress("Fetching prices...")
+    active_returns = portfolio_active_returns(
+        tickers, weights, start_date, end_date, price_store, returns_store
+    )
+
+    set_progress("Loading factors...")
+    store = factor_store or get_factor_store()
+    with metrics.timer("ff.factors"):
+        factors_daily = store.for_models(
+            list(COMPARISON_FACTORS), start_date, end_date
+        )
+    # Each model's factors, as (dataset, factor) columns of factors_daily.
+    models = {}
+    for model, factors in COMPARISON_FACTORS.items():
+        datasets = FACTOR_DATASETS[model]
+        models[model] = [
+            next((name, f) for name in datasets if (name, f) in factors_daily)
+            for f in factors
+        ]
+
+    set_progress("Fitting factor models...")
+    with metrics.timer("ff.fit"):
+        fits = fit_nested_models(active_returns * 100, factors_daily, models)
+        summary = comparison_table(fits).to_string()
+
+    alphas = pd.DataFrame(
+        {
+            f"{model} alpha": fit.rolling_params["const"]
+            for model, fit in fits.items()
+            if fit.rolling_params is not None
+        }
+    ).dropna()
+    alphas.index = pd.to_datetime(alphas.index)
+    return summary, alphas, None
+
+
 def register_callbacks():
     @callback(
         [
@@ -40,18 +326,29 @@ def register_callbacks():
             State(page_prefix + "ticker-input", "value"),
             State(page_prefix + "weights-input", "value"),
             State(page_prefix + "model-dropdown", "value"),
+            State(page_prefix + "bands-checklist", "value"),
             State(page_prefix + "date-picker", "start_date"),
             State(page_prefix + "date-picker", "end_date"),
         ],
         prevent_initial_call=True,
+        background=True,
+        progress=Output(page_prefix + "progress-text", "children"),
+        running=[
+            (Output(page_prefix + "submit-button", "disabled"), True, False),
+            (Output(page_prefix + "cancel-button", "disabled"), False, True),
+        ],
+        cancel=Input(page_prefix + "cancel-button", "n_clicks"),
     )
+    @timed("job.update_tables")
     def update_tables(
+        set_progress,
         n_clicks,
         ticker_input_submit,
         weights_input_submit,
         tickers,
         weights,
         model,
+        bands_option,
         start_date,
         end_date,
     ):
@@ -60,9 +357,9 @@ def register_callbacks():
             and ticker_input_submit is None
             and weights_input_submit is None
         ):
-            return "", {}, no_update, no_update
+            return "", no_update, no_update, no_update
         if tickers is None or weights is None:
-            return "",{}, "Please enter valid ticker symbols and weights.", True
+            return "", no_update, "Please enter valid ticker symbols and weights.", True
         tickers = [
             ticker.strip().upper()  # Remove whitespace and convert to uppercase
             for ticker in tickers.split(",")
@@ -78,116 +375,58 @@ def register_callbacks():
         if len(tickers) != len(weights):
             return (
                 "",
-                {},
+                no_update,
                 "The number of tickers and weights must match.",
                 True,
             )
         if sum(weights) != 1:
             return (
                 "",
-                {},
+                no_update,
                 "The weights must sum to 1.",
                 True,
             )
         start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
         end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
 
-        stock_prices = obb.equity.price.historical(  # type: ignore
-            symbol=tickers, start_date=start_date, end_date=end_date
-        )
+        if model not in MODEL_FACTORS and model != COMPARE_ALL:
+            return "", no_update, "Invalid model selected.", True
 
-        stock_prices = cast(pd.DataFrame, stock_prices)
-        stock_prices = stock_prices.pivot(columns="symbol", values="close")
-        stock_prices.index = pd.to_datetime(stock_prices.index)
-        stock_returns = stock_prices.pct_change().dropna()
-
-        portfolio_returns = (stock_returns * weights).sum(axis=1)
-        portfolio_returns.name = "Portfolio"
-        if 'SPY' in tickers:
-            benchmark_returns = stock_returns.pop('SPY')
-        else:
-            benchmark_prices = obb.equity.price.historical(  # type: ignore
-                symbol=tickers, start_date=start_date, end_date=end_date
-            )   
-            benchmark_prices = cast(pd.DataFrame, benchmark_prices)
-            benchmark_prices = benchmark_prices.pivot(columns="symbol", values="close")
-            benchmark_prices.index = pd.to_datetime(benchmark_prices.index)
-            benchmark_returns = benchmark_prices.pct_change().dropna().pop('SPY')
-
-        
-        active_returns = (portfolio_returns - benchmark_returns).dropna()
-        active_returns.name = "Active Returns"
-        
-        ff3_factors_daily = pdr.get_data_famafrench(
-            "F-F_Research_Data_Factors_daily", start=start_date
-        )[0]
-        ff5_factors_daily = pdr.get_data_famafrench(
-            "F-F_Research_Data_5_Factors_2x3_daily", start=start_date
-        )[0]
-            
-        # Align factors with daily portfolio returns
-        if model == "FF3":
-
-            data = pd.merge(
-                active_returns,
-                ff3_factors_daily,
-                left_index=True,
-                right_index=True,
-                how="inner",
-            )
-            factors = [
-                # "Mkt-RF", 
-                "SMB", "HML"]
-        elif model == "FF5":
-            data = pd.merge(
-                active_returns,
-                ff5_factors_daily,
-                left_index=True,
-                right_index=True,
-                how="inner",
-            )
-            factors = [
-                # "Mkt-RF", 
-                "SMB", "HML", "RMW", "CMA"
-                ]
-        else:
-            return "", {},"Invalid model selected.", True
-
-        def factor_regression(
-            data, factors
-        ) -> sm.regression.linear_model.RegressionResultsWrapper:
-            Y = (
-                data["Active Returns"] * 100 # - data["RF"]
-            )  # Convert returns to % for consistency
-            X = data[factors]
-            X = sm.add_constant(X)
-            model = sm.OLS(Y, X).fit()
-            return model
-        def rolling_factor_regression(data: pd.DataFrame, factors: list[str]) -> RollingRegressionResults:
-            exog = sm.add_constant(data[factors])    
-            rols = RollingOLS(data['Active Returns'] * 100, exog, window=60)
-            model = rols.fit()
-            return model
+        with_bands = "bands" in (bands_option or [])
 
-        model_results = rolling_factor_regression(data, factors)
-        ols_model_results = factor_regression(data, factors)
-        model_summary = ols_model_results.summary().as_text()
-
-        coeffs_df = model_results.params
-        coeffs_df = coeffs_df.dropna()
-
-        coeffs_df = cast(pd.DataFrame, coeffs_df)
-        coeffs_df.index = pd.to_datetime(coeffs_df.index)
-        
-        fig = go.Figure()
-        for col in coeffs_df.columns:
-            fig.add_trace(
-                go.Scatter(
-                    x=coeffs_df.index,
-                    y=coeffs_df[col],
-                    mode="lines",
-                    name=col,
+        def run() -> tuple[str, pd.DataFrame, RollingBands | None]:
+            with get_analysis_slots().slot(
+                on_wait=lambda: set_progress("Waiting for a free worker...")
+            ):
+                return run_factor_analysis(
+                    tickers,
+                    weights,
+                    model,
+                    start_date,
+                    end_date,
+                    set_progress,
+                    with_bands=with_bands,
                 )
+
+        # Identical requests in flight at the same time share one run.
+        key = get_single_flight().make_key(
+            "fama_french",
+            holdings=sorted(zip(tickers, weights)),
+            model=model,
+            with_bands=with_bands,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        try:
+            model_summary, coeffs_df, bands = get_single_flight().do(
+                key,
+                run,
+                on_wait=lambda: set_progress("Waiting for the same analysis..."),
             )
+        except PriceFetchError as e:
+            return "", no_update, str(e), True
+
+        fig = Patch()
+        fig["data"] = rolling_coeffs_traces(coeffs_df, bands)
 
         return model_summary, fig, no_update, no_update
@@ -1,20 +1,64 @@
-from dash import callback, Output, Input, State, no_update
-from datetime import datetime
+from dash import callback, Output, Input, State, Patch, no_update
+from datetime import date, datetime
 import numpy as np
-from typing import cast
+from typing import TYPE_CHECKING, Callable
 import pandas as pd
 import plotly.graph_objs as go
-import plotly.io as pio
-from sklearn.decomposition import PCA
-from openbb import obb
 import dash_bootstrap_components as dbc
+from services.jobs import get_analysis_slots, get_single_flight
+from services.pca_cache import PCAFitCache, get_pca_cache
+from services.price_store import PriceFetchError, PriceHistoryStore, failed_tickers
+from services.returns_matrix import ReturnsMatrixStore, get_daily_returns
+from utils.metrics import get_metrics, timed
 
-obb.user.preferences.output_type = "dataframe"  # type: ignore
-
-pio.templates.default = "plotly"
+if TYPE_CHECKING:
+    from analytics.pca import PCAResult
 
 page_prefix = "pca-"
 
+# The components dropdown's largest value. Every fit is made at this count
+# and sliced for smaller ones, so changing the dropdown never refits.
+MAX_COMPONENTS = 10
+# Seconds a fit missing tickers whose fetch failed is cached for: long
+# enough for the components dropdown, short enough that a transient
+# provider error isn't repeated on every submit for the cache's full ttl.
+FAILED_FIT_TTL = 60.0
+
+
+def chart_traces(
+    bar_chart_data: np.ndarray,
+    line_chart_data: np.ndarray,
+    scatter_plot_data: pd.DataFrame,
+    scatter_plot_labels,
+    n_components,
+) -> tuple[dict, dict, dict]:
+    """
+    The data-dependent trace properties of the bar chart, line chart, and
+    scatter plot.
+    """
+    components = ["PC" + str(i + 1) for i in range(n_components)]
+    if scatter_plot_data.empty:
+        x, y = [], []
+    else:
+        x = scatter_plot_data["f1"].tolist()
+        y = (
+            scatter_plot_data["f2"].tolist()
+            if n_components > 1
+            else [0.0] * len(scatter_plot_data)
+        )
+    return (
+        dict(x=components, y=list(bar_chart_data)),
+        dict(x=components, y=list(line_chart_data)),
+        dict(
+            x=x,
+            y=y,
+            text=list(scatter_plot_labels),
+            # Labels overlap into noise for big universes; keep them on
+            # hover only.
+            mode="markers+text" if len(scatter_plot_labels) <= 50 else "markers",
+        ),
+    )
+
 
 def create_charts(
     bar_chart_data: np.ndarray,
@@ -25,18 +69,19 @@ def create_charts(
 ):
     """
     Create the bar chart, line chart, and scatter plot based on the PCA analysis.
+
+    Each figure always holds exactly one trace, so later submits can patch
+    that trace's data (see patch_charts) instead of resending the figure.
     """
+    bar_trace, line_trace, scatter_trace = chart_traces(
+        bar_chart_data,
+        line_chart_data,
+        scatter_plot_data,
+        scatter_plot_labels,
+        n_components,
+    )
     bar_chart = go.Figure(
-        data=(
-            [
-                go.Bar(
-                    x=["PC" + str(i + 1) for i in range(n_components)],
-                    y=bar_chart_data,
-                )
-            ]
-            if len(bar_chart_data)
-            else []
-        ),
+        data=[go.Bar(**bar_trace)],
         layout=go.Layout(
             title="Explained Variance by Components",
             xaxis=dict(title="Principal Components"),
@@ -44,17 +89,7 @@ def create_charts(
         ),
     )
     line_chart = go.Figure(
-        data=(
-            [
-                go.Scatter(
-                    x=["PC" + str(i + 1) for i in range(n_components)],
-                    y=line_chart_data,
-                    mode="lines+markers",
-                )
-            ]
-            if len(line_chart_data)
-            else []
-        ),
+        data=[go.Scatter(mode="lines+markers", **line_trace)],
         layout=go.Layout(
             title="Cumulative Explained Variance",
             xaxis=dict(title="Principal Components"),
@@ -62,23 +97,7 @@ def create_charts(
         ),
     )
     scatter_plot = go.Figure(
-        data=(
-            [
-                go.Scatter(
-                    x=scatter_plot_data["f1"],
-                    y=(
-                        scatter_plot_data["f2"]
-                        if n_components > 1
-                        else np.zeros(len(scatter_plot_data))
-                    ),
-                    mode="markers+text",
-                    text=scatter_plot_labels,
-                    textposition="top center",
-                )
-            ]
-            if not scatter_plot_data.empty
-            else []
-        ),
+        data=[go.Scatter(textposition="top center", **scatter_trace)],
         layout=go.Layout(
             title="Scatter Plot of First Two Factors",
             xaxis=dict(title="Factor 1"),
@@ -93,35 +112,151 @@ def create_charts(
     return bar_chart, line_chart, scatter_plot
 
 
-def register_callbacks():
+def empty_charts() -> tuple[go.Figure, go.Figure, go.Figure]:
     """
-    Register callbacks for PCA analysis page.
+    The charts before any submit. The page renders them in its layout, so
+    loading it doesn't take a server round trip to draw empty figures.
     """
+    return create_charts(np.empty((0, 0)), np.empty((0)), pd.DataFrame(), [], 0)
 
-    @callback(
-        Output(page_prefix + "bar-chart", "figure"),
-        Output(page_prefix + "line-plot", "figure"),
-        Output(page_prefix + "scatter-plot", "figure"),
-        Input(page_prefix + "inputs-card", "children"),
-    )
-    def initialize_graphs(_):
-        """
-        Initialize the graphs with empty data.
-        """
-        bar_chart, line_chart, scatter_plot = create_charts(
-            np.empty((0, 0)),
-            np.empty((0)),
-            pd.DataFrame(),
-            [],
-            0,
+
+def patch_charts(
+    bar_chart_data: np.ndarray,
+    line_chart_data: np.ndarray,
+    scatter_plot_data: pd.DataFrame,
+    scatter_plot_labels,
+    n_components,
+) -> tuple[Patch, Patch, Patch]:
+    """
+    Partial updates for the figures built by create_charts. Only the trace
+    data changes between submits, so the layout is not resent.
+    """
+    patches = []
+    for trace in chart_traces(
+        bar_chart_data,
+        line_chart_data,
+        scatter_plot_data,
+        scatter_plot_labels,
+        n_components,
+    ):
+        patch = Patch()
+        for key, value in trace.items():
+            patch["data"][0][key] = value
+        patches.append(patch)
+    return tuple(patches)
+
+
+def fit_returns_pca(
+    tickers: list[str],
+    start_date: date,
+    end_date: date,
+    set_progress: Callable[[str], None] = lambda _: None,
+    price_store: PriceHistoryStore | None = None,
+    returns_store: ReturnsMatrixStore | None = None,
+    pca_cache: PCAFitCache | None = None,
+) -> tuple["PCAResult", list[str]]:
+    """
+    The PCA of the tickers' daily returns at MAX_COMPONENTS, and the tickers
+    left out because their prices could not be fetched. Served from the
+    fit cache when the same tickers and dates were fitted before; a fit
+    with failed tickers is kept for FAILED_FIT_TTL so they are retried soon.
+    """
+    # Deferred: sklearn pulls in scipy, which dominates boot time.
+    from analytics.pca import fit_pca
+
+    cache = pca_cache or get_pca_cache()
+    key = cache.make_key(tickers, start_date, end_date)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    metrics = get_metrics()
+    set_progress("Fetching prices...")
+    # Keep days where only some tickers traded; fit_pca fills the gaps
+    # instead of dropping the whole row.
+    with metrics.timer("pca.fetch"):
+        daily_returns = get_daily_returns(
+            sorted(set(tickers)), start_date, end_date, price_store, returns_store
         )
-        return bar_chart, line_chart, scatter_plot
+    failed = list(failed_tickers(daily_returns))
+
+    set_progress("Fitting PCA...")
+    with metrics.timer("pca.fit"):
+        pca = fit_pca(daily_returns, MAX_COMPONENTS)
+    cache.put(key, pca, failed, ttl=FAILED_FIT_TTL if failed else None)
+    return pca, failed
+
+
+def component_patches(
+    pca: "PCAResult", n_components: int
+) -> tuple[Patch, Patch, Patch]:
+    """Chart patches for the first n_components of a fit."""
+    pca = pca.top(n_components)
+    # Tickers with too little history are left out of the fit, which
+    # can leave fewer components than were asked for.
+    n_components = pca.n_components
+    explained_var_ratio = pca.explained_variance_ratio_
+
+    cumulative_var_ratio = np.cumsum(explained_var_ratio)
+
+    factor_exposures = pd.DataFrame(
+        index=["f" + str(i + 1) for i in range(n_components)],
+        columns=pca.columns,
+        data=pca.components_,
+    ).T
+    labels = factor_exposures.index
+
+    with get_metrics().timer("pca.figures"):
+        return patch_charts(
+            explained_var_ratio,
+            cumulative_var_ratio,
+            factor_exposures,
+            labels,
+            n_components,
+        )
+
+
+def run_pca_analysis(
+    tickers: list[str],
+    n_components: int,
+    start_date: date,
+    end_date: date,
+    set_progress: Callable[[str], None] = lambda _: None,
+    price_store: PriceHistoryStore | None = None,
+    returns_store: ReturnsMatrixStore | None = None,
+    pca_cache: PCAFitCache | None = None,
+) -> tuple[Patch, Patch, Patch, list[str]]:
+    """
+    Body of update_graphs once the inputs are validated: load returns, fit
+    the PCA (or take it from the cache) and build the chart patches. Also
+    returns the tickers left out because their prices could not be fetched.
+    Kept outside the callback so the benchmarks can run it against a
+    stand-in price provider.
+    """
+    pca, failed = fit_returns_pca(
+        tickers,
+        start_date,
+        end_date,
+        set_progress,
+        price_store,
+        returns_store,
+        pca_cache,
+    )
+    bar_chart, line_chart, scatter_plot = component_patches(pca, n_components)
+    return bar_chart, line_chart, scatter_plot, failed
+
+
+def register_callbacks():
+    """
+    Register callbacks for PCA analysis page.
+    """
 
     @callback(
         [
             Output(page_prefix + "bar-chart", "figure", allow_duplicate=True),
             Output(page_prefix + "line-plot", "figure", allow_duplicate=True),
             Output(page_prefix + "scatter-plot", "figure", allow_duplicate=True),
+            Output(page_prefix + "fit-key", "data"),
             Output("toast-message", "children", allow_duplicate=True),
             Output("toast-message", "is_open", allow_duplicate=True),
         ],
@@ -136,15 +271,36 @@ def register_callbacks():
             State(page_prefix + "date-picker", "end_date"),
         ],
         prevent_initial_call=True,
+        background=True,
+        progress=Output(page_prefix + "progress-text", "children"),
+        running=[
+            (Output(page_prefix + "submit-button", "disabled"), True, False),
+            (Output(page_prefix + "cancel-button", "disabled"), False, True),
+        ],
+        cancel=Input(page_prefix + "cancel-button", "n_clicks"),
     )
+    @timed("job.update_graphs")
     def update_graphs(
-        n_clicks, ticker_input_submit, tickers, n_components, start_date, end_date
+        set_progress,
+        n_clicks,
+        ticker_input_submit,
+        tickers,
+        n_components,
+        start_date,
+        end_date,
     ):
         if n_clicks is None and ticker_input_submit is None:
-            return {}, {}, {}, no_update, no_update
+            return no_update, no_update, no_update, no_update, no_update, no_update
         # Clean and validate ticker symbols
         if not tickers:
-            return ({}, {}, {}, "Please enter at least one valid ticker symbol.", True)
+            return (
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                "Please enter at least one valid ticker symbol.",
+                True,
+            )
         tickers = [
             ticker.strip().upper()  # Remove whitespace and convert to uppercase
             for ticker in tickers.split(",")
@@ -152,45 +308,100 @@ def register_callbacks():
         ]
 
         if not tickers:
-            return {}, {}, {}, "Please enter at least one valid ticker symbol.", True
+            return (
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                "Please enter at least one valid ticker symbol.",
+                True,
+            )
 
         if len(tickers) < n_components:
-            return {}, {}, {}, "Number of componets exceeds number of tickers.", True
+            return (
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                "Number of componets exceeds number of tickers.",
+                True,
+            )
 
         start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
         end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-        data = obb.equity.price.historical(  # type: ignore
-            tickers, start_date=start_date, end_date=end_date, provider="yfinance"
-        )
-        data = cast(pd.DataFrame, data)
 
-        data = data.pivot(columns="symbol", values="close")
-        daily_returns = data.pct_change().dropna()
+        def run() -> tuple["PCAResult", list[str]]:
+            with get_analysis_slots().slot(
+                on_wait=lambda: set_progress("Waiting for a free worker...")
+            ):
+                return fit_returns_pca(tickers, start_date, end_date, set_progress)
 
-        pca = PCA(n_components=n_components)
-        pca.fit(daily_returns)
-        explained_var_ratio = pca.explained_variance_ratio_
-
-        cumulative_var_ratio = np.cumsum(explained_var_ratio)
-
-        X = np.asarray(daily_returns)
-        factor_returns = pd.DataFrame(
-            columns=["f" + str(i + 1) for i in range(n_components)],
-            index=daily_returns.index,
-            data=X.dot(pca.components_.T),
-        )
-        factor_exposures = pd.DataFrame(
-            index=["f" + str(i + 1) for i in range(n_components)],
-            columns=daily_returns.columns,
-            data=pca.components_,
-        ).T
-        labels = factor_exposures.index
-
-        bar_chart, line_chart, scatter_plot = create_charts(
-            explained_var_ratio,
-            cumulative_var_ratio,
-            factor_exposures,
-            labels,
-            n_components,
+        # Identical fits in flight at the same time share one run. Fits are
+        # made at MAX_COMPONENTS whatever was asked for, so the component
+        # count is left out of the key and applied to the shared fit.
+        key = get_single_flight().make_key(
+            "pca",
+            tickers=sorted(set(tickers)),
+            start_date=start_date,
+            end_date=end_date,
         )
+        try:
+            pca, failed = get_single_flight().do(
+                key,
+                run,
+                on_wait=lambda: set_progress("Waiting for the same analysis..."),
+            )
+        except PriceFetchError as e:
+            return no_update, no_update, no_update, no_update, str(e), True
+        bar_chart, line_chart, scatter_plot = component_patches(pca, n_components)
+        fit_key = get_pca_cache().make_key(tickers, start_date, end_date)
+        if failed:
+            return (
+                bar_chart,
+                line_chart,
+                scatter_plot,
+                fit_key,
+                f"Could not fetch prices for {', '.join(failed)}; left out.",
+                True,
+            )
+        return bar_chart, line_chart, scatter_plot, fit_key, no_update, False
+
+    @callback(
+        Output(page_prefix + "bar-chart", "figure", allow_duplicate=True),
+        Output(page_prefix + "line-plot", "figure", allow_duplicate=True),
+        Output(page_prefix + "scatter-plot", "figure", allow_duplicate=True),
+        Output("toast-message", "children", allow_duplicate=True),
+        Output("toast-message", "is_open", allow_duplicate=True),
+        Input(page_prefix + "components-dropdown", "value"),
+        State(page_prefix + "fit-key", "data"),
+        prevent_initial_call=True,
+    )
+    @timed("job.update_components")
+    def update_components(n_components, fit_key):
+        """
+        Re-slice the submitted fit when the component count changes. This
+        runs in the web worker, not as a background job: it only reads the
+        fit cache, without fetching prices or fitting.
+        """
+        if fit_key is None:
+            return no_update, no_update, no_update, no_update, no_update
+        cached = get_pca_cache().get(fit_key)
+        if cached is None:
+            return (
+                no_update,
+                no_update,
+                no_update,
+                "The analysis has expired; submit it again to refit.",
+                True,
+            )
+        pca, _ = cached
+        if len(pca.columns) < n_components:
+            return (
+                no_update,
+                no_update,
+                no_update,
+                "Number of componets exceeds number of tickers.",
+                True,
+            )
+        bar_chart, line_chart, scatter_plot = component_patches(pca, n_components)
         return bar_chart, line_chart, scatter_plot, no_update, False
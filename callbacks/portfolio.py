@@ -1,14 +1,204 @@
-from dash import callback, Output, Input
-from services.snow import SnowflakeConnector
+from dash import callback, Output, Input, no_update
+from datetime import date, timedelta
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+import dash_bootstrap_components as dbc
+from analytics.risk import RiskReport, portfolio_risk
+from services.replica import get_portfolio_replica
+from services.returns_matrix import ReturnsMatrixStore, get_returns_store
+from utils.grid import GridRowSource
+from utils.metrics import get_metrics, timed
+
+portfolio_rows = GridRowSource()
+
+# Returns history the risk panel is computed over.
+RISK_LOOKBACK = timedelta(days=365)
+BENCHMARK = "SPY"
+# Holdings shown in the risk contribution chart.
+TOP_CONTRIBUTORS = 20
+
+# Risk reports by a fingerprint of the holdings and the returns they were
+# computed from, so a report is reused until either changes.
+MAX_RISK_REPORTS = 32
+_risk_reports: OrderedDict[str, RiskReport] = OrderedDict()
+_risk_reports_lock = threading.Lock()
+
+
+class RiskUnavailable(Exception):
+    """The risk panel can't be computed yet; the message says why."""
+
+
+def load_user_portfolio(user_id: int) -> pd.DataFrame:
+    # The Snowflake connector is heavy to import; load it with the first
+    # request for the page instead of at boot.
+    from services.replica import start_replica_sync
+    from services.snow import SnowflakeConnector
+
+    db = SnowflakeConnector("dev")
+    start_replica_sync(db)
+    data = db.get_user_portfolios(user_id)
+    return data.sort_values(by="market_value", ascending=False)
+
+
+def load_replica_portfolio(user_id: int) -> pd.DataFrame:
+    """
+    The user's holdings from the local replica, never the warehouse, so
+    the risk panel stays a local read. The portfolio table's first load
+    starts the replica's sync.
+    """
+    replica = get_portfolio_replica()
+    if not replica.is_fresh():
+        raise RiskUnavailable(
+            "The risk panel is not available yet; the holdings are still syncing."
+        )
+    return replica.get_user_portfolios(user_id)
+
+
+def risk_fingerprint(market_values: pd.Series, returns: pd.DataFrame) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\0".join(market_values.index).encode())
+    digest.update(market_values.to_numpy(dtype=np.float64).tobytes())
+    digest.update("\0".join(returns.columns).encode())
+    digest.update(returns.index.to_numpy().tobytes())
+    digest.update(np.ascontiguousarray(returns.to_numpy()).tobytes())
+    return digest.hexdigest()
+
+
+def run_risk_analysis(
+    holdings: pd.DataFrame,
+    end_date: date,
+    returns_store: ReturnsMatrixStore | None = None,
+) -> tuple[RiskReport, float, list[str]]:
+    """
+    Risk of a user's holdings (rows of sql/user_portfolios.sql) over the
+    year to end_date, weighted by market value. Returns the report, the
+    market value it covers and the tickers left out because they are not
+    in the returns matrix.
+
+    Returns come from the returns matrix only: fetching prices for a large
+    portfolio would take far longer than a page load should. Raises
+    RiskUnavailable when the matrix isn't built yet or nothing is left to
+    compute risk from.
+    """
+    metrics = get_metrics()
+    start_date = end_date - RISK_LOOKBACK
+    matrix = (returns_store or get_returns_store()).get()
+    if matrix is None or not matrix.covers([BENCHMARK], start_date, end_date):
+        raise RiskUnavailable(
+            "The risk panel is not available yet; the returns matrix is still "
+            "being built."
+        )
+    market_values = holdings.groupby("ticker")["market_value"].sum()
+    if market_values.empty:
+        raise RiskUnavailable("The portfolio has no holdings to compute risk for.")
+    missing = [t for t in market_values.index if t not in matrix.columns]
+    market_values = market_values.drop(missing)
+    if market_values.empty:
+        raise RiskUnavailable("None of the holdings are in the returns universe.")
+    with metrics.timer("risk.fetch"):
+        returns = matrix.returns(
+            list(dict.fromkeys([*market_values.index, BENCHMARK])),
+            start_date,
+            end_date,
+        )
+    benchmark = returns[BENCHMARK]
+    returns = returns[market_values.index]
+    if (benchmark.notna() & returns.notna().any(axis=1)).sum() < 2:
+        raise RiskUnavailable("Fewer than two days of returns to compute risk from.")
+
+    key = risk_fingerprint(market_values, returns)
+    with _risk_reports_lock:
+        report = _risk_reports.get(key)
+        if report is not None:
+            _risk_reports.move_to_end(key)
+    if report is None:
+        with metrics.timer("risk.compute"):
+            weights = market_values.to_numpy() / market_values.sum()
+            report = portfolio_risk(returns, weights, benchmark)
+        with _risk_reports_lock:
+            _risk_reports[key] = report
+            while len(_risk_reports) > MAX_RISK_REPORTS:
+                _risk_reports.popitem(last=False)
+    return report, float(market_values.sum()), missing
+
+
+def risk_summary(report: RiskReport, market_value: float) -> pd.DataFrame:
+    level = f"{report.level:.0%}"
+    rows = [
+        (f"Historical VaR ({level}, 1 day)", report.historical_var),
+        (f"Historical CVaR ({level}, 1 day)", report.historical_cvar),
+        (f"Parametric VaR ({level}, 1 day)", report.parametric_var),
+        (f"Parametric CVaR ({level}, 1 day)", report.parametric_cvar),
+        ("Realized volatility (1 day)", report.volatility),
+    ]
+    summary = pd.DataFrame(
+        {
+            "Measure": [name for name, _ in rows],
+            "Value": [f"{value:.2%}" for _, value in rows],
+            "Amount": [f"${value * market_value:,.0f}" for _, value in rows],
+        }
+    )
+    extra = pd.DataFrame(
+        {
+            "Measure": ["Realized volatility (annualized)", f"Beta to {BENCHMARK}"],
+            "Value": [f"{report.annualized_volatility:.2%}", f"{report.beta:.2f}"],
+            "Amount": ["", ""],
+        }
+    )
+    return pd.concat([summary, extra], ignore_index=True)
+
+
+def risk_contributions_figure(report: RiskReport) -> go.Figure:
+    top = report.holdings["contribution"].nlargest(TOP_CONTRIBUTORS)
+    return go.Figure(
+        data=[go.Bar(x=top.index, y=top.to_numpy(), name="Share of volatility")],
+        layout=go.Layout(
+            title=f"Top {len(top)} contributors to portfolio volatility",
+            yaxis=dict(title="Share of volatility", tickformat=".0%"),
+        ),
+    )
 
 
 def register_callbacks():
     @callback(
-        Output("user-portfolio-table", "rowData"),
+        Output("user-portfolio-table", "getRowsResponse"),
+        Input("user-portfolio-table", "getRowsRequest"),
+    )
+    def get_portfolio_table_rows(request):
+        if request is None:
+            return no_update
+        return portfolio_rows.get_rows(
+            ("user_portfolios", 1), lambda: load_user_portfolio(1), request
+        )
+
+    # Runs in the web worker on page load: it only reads the local replica
+    # and the memory-mapped returns matrix, and a report for unchanged
+    # holdings and prices comes from _risk_reports. Forking a background
+    # job would cost more than that and start with an empty report cache.
+    @callback(
+        Output("portfolio-risk-summary", "children"),
+        Output("portfolio-risk-contributions", "figure"),
         Input("portfolio-page-load-callback-initializer", "children"),
     )
-    def set_portfolio_table_data(_):
-        db = SnowflakeConnector("dev")
-        data = db.get_user_portfolios(1)
-        data.sort_values(by="market_value", ascending=False, inplace=True)
-        return data.to_dict("records")
+    @timed("job.update_risk_panel")
+    def update_risk_panel(_):
+        try:
+            report, market_value, missing = run_risk_analysis(
+                load_replica_portfolio(1), date.today()
+            )
+        except RiskUnavailable as e:
+            return str(e), no_update
+        children = [
+            dbc.Table.from_dataframe(
+                risk_summary(report, market_value), size="sm", striped=True
+            )
+        ]
+        if missing:
+            children.append(
+                f"Left out, not in the returns universe: {', '.join(missing)}."
+            )
+        return children, risk_contributions_figure(report)
@@ -8,20 +8,44 @@ def base_ag_grid(
         column_defs: list[dict[str, Any]],
         style: dict[str, Any],
         dash_grid_options: Any = {},
-        selected_rows = None
+        selected_rows = None,
+        row_model_type: str = "clientSide",
+        block_size: int = 100,
     ) -> dag.AgGrid:
+    """
+    With row_model_type="infinite" the grid ignores row_data and asks the
+    server for rows block by block through getRowsRequest; a callback
+    answers on getRowsResponse (see utils.grid.GridRowSource). Sorting and
+    filtering are then done server side.
+    """
+    if row_model_type == "infinite":
+        rows = dict(rowModelType="infinite")
+        grid_options = {
+            "rowBuffer": 0,
+            "cacheBlockSize": block_size,
+            "maxBlocksInCache": 10,
+            "infiniteInitialRowCount": block_size,
+        }
+    else:
+        rows = dict(rowData=row_data.to_dict('records'))
+        grid_options = {}
     return dag.AgGrid(
         id=id,
         columnSize='responsiveSizeToFit',
         columnDefs=column_defs,
-        rowData=row_data.to_dict('records'),
         enableEnterpriseModules=False,
         style={**style},
-        dashGridOptions={**dash_grid_options, "enableCellTextSelection": True},
+        dashGridOptions={
+            **grid_options,
+            **dash_grid_options,
+            "enableCellTextSelection": True,
+        },
         selectedRows=[] if selected_rows is None else selected_rows,
         defaultColDef=dict(
             autoHeight=True,
             resizable=True,
-            sortable=True
-        )
-    )
\ No newline at end of file
+            sortable=True,
+            filter=row_model_type == "infinite",
+        ),
+        **rows,
+    )
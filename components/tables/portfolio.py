@@ -2,27 +2,31 @@ from pandas import DataFrame
 from components.base_ag_grid import base_ag_grid
 
 portfolio_table_columns = [
-    {"field": "ticker", "headerName": "Ticker"},
-    {"field": "num_shares", "headerName": "# Shares"},
+    {"field": "ticker", "headerName": "Ticker", "filter": "agTextColumnFilter"},
+    {"field": "num_shares", "headerName": "# Shares", "filter": "agNumberColumnFilter"},
     {
         "field": "price",
         "headerName": "Last Px",
         "valueFormatter": {"function": "d3.format('($,.2f')(params.value)"},
+        "filter": "agNumberColumnFilter",
     },
     {
         "field": "avg_cost",
         "headerName": "Avg Cost",
         "valueFormatter": {"function": "d3.format('($,.2f')(params.value)"},
+        "filter": "agNumberColumnFilter",
     },
     {
         "field": "market_value",
         "headerName": "Mkt Value",
         "valueFormatter": {"function": "d3.format('($,.2f')(params.value)"},
+        "filter": "agNumberColumnFilter",
     },
     {
         "field": "unrealized_gain_loss",
         "headerName": "Unrlzd G/L",
         "valueFormatter": {"function": "d3.format('($,.2f')(params.value)"},
+        "filter": "agNumberColumnFilter",
     },
 ]
 
@@ -33,4 +37,5 @@ def generate_user_portfolio_table():
         row_data=DataFrame([]),
         column_defs=portfolio_table_columns,
         style={"height": "90%", "border": None},
+        row_model_type="infinite",
     )
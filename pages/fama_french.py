@@ -2,8 +2,15 @@ import dash
 from dash import html, dcc
 from datetime import datetime, timedelta
 
-from callbacks.fama_french import register_callbacks, page_prefix
+from callbacks.fama_french import (
+    COMPARE_ALL,
+    MODEL_FACTORS,
+    register_callbacks,
+    page_prefix,
+    rolling_coeffs_figure,
+)
 from components.base_card import base_card
+from utils.warmup import preload
 import dash_bootstrap_components as dbc
 
 # from components.base_card import base_card
@@ -41,16 +48,20 @@ model_field = [
         id=page_prefix + "model-dropdown",
         options=[
             {"label": str(i), "value": i}
-            for i in [
-                # 'CAPM',
-                "FF3",
-                "FF5",
-            ]
+            for i in [*MODEL_FACTORS, COMPARE_ALL]
         ],
         value="FF3",
         clearable=False,
         style={"height": "40px", "width": "300px", "fontSize": "14px"},
     ),
+    # Off by default: bootstrapping the bands takes several times as long
+    # as the fit itself.
+    dcc.Checklist(
+        id=page_prefix + "bands-checklist",
+        options=[{"label": " Bootstrap confidence bands (slower)", "value": "bands"}],
+        value=[],
+        style={"fontSize": "14px"},
+    ),
 ]
 
 date_picker_field = [
@@ -70,12 +81,25 @@ field_list = [
     date_picker_field,
 ]
 
-submit = [html.Button("Submit", id=page_prefix + "submit-button")]
+submit = [
+    html.Button("Submit", id=page_prefix + "submit-button"),
+    html.Button(
+        "Cancel",
+        id=page_prefix + "cancel-button",
+        disabled=True,
+        style={"marginLeft": "10px"},
+    ),
+    html.Span(
+        id=page_prefix + "progress-text",
+        style={"marginLeft": "10px", "fontSize": "14px"},
+    ),
+]
 
 register_callbacks()
 
 
 def layout():
+    preload("statsmodels.api", "pandas_datareader.data")
     return html.Div(
         children=[
             base_card(
@@ -140,7 +164,10 @@ def layout():
                     "minHeight": "400px",
                 },
                 children=[
-                    dcc.Graph(id=page_prefix + "rolling-coeffs-chart"),
+                    dcc.Graph(
+                        id=page_prefix + "rolling-coeffs-chart",
+                        figure=rolling_coeffs_figure(),
+                    ),
                     html.P('Rolling 60 day window',style={'fontSize': '12px', 'marginBottom': '0px'}),
                 ]
             ),
@@ -3,8 +3,9 @@ import dash
 from dash import html, dcc
 
 
-from callbacks.pca import register_callbacks, page_prefix
+from callbacks.pca import MAX_COMPONENTS, empty_charts, register_callbacks, page_prefix
 from components.base_card import base_card
+from utils.warmup import preload
 
 import dash_bootstrap_components as dbc
 
@@ -24,7 +25,7 @@ components_field = [
     html.Label("Select Number of Components:"),
     dcc.Dropdown(
         id=page_prefix + "components-dropdown",
-        options=[{"label": str(i), "value": i} for i in range(1, 6)],
+        options=[{"label": str(i), "value": i} for i in range(1, MAX_COMPONENTS + 1)],
         value=2,
         clearable=False,
         style={"height": "40px", "width": "300px", "fontSize": "14px"},
@@ -45,7 +46,19 @@ field_list = [
     components_field,
     date_picker_field,
 ]
-submit = [html.Button("Submit", id=page_prefix + "submit-button")]
+submit = [
+    html.Button("Submit", id=page_prefix + "submit-button"),
+    html.Button(
+        "Cancel",
+        id=page_prefix + "cancel-button",
+        disabled=True,
+        style={"marginLeft": "10px"},
+    ),
+    html.Span(
+        id=page_prefix + "progress-text",
+        style={"marginLeft": "10px", "fontSize": "14px"},
+    ),
+]
 
 chart_list = [
     "bar-chart",
@@ -57,9 +70,14 @@ register_callbacks()
 
 
 def layout():
-
+    # Start importing the analytics stack while the user fills in the form.
+    preload("analytics.pca")
+    figures = dict(zip(chart_list, empty_charts()))
     return html.Div(
         children=[
+            # Cache key of the last submitted fit, which the components
+            # dropdown slices without refitting.
+            dcc.Store(id=page_prefix + "fit-key"),
             base_card(
                 id=page_prefix + "inputs-card",
                 card_style={
@@ -102,7 +120,9 @@ def layout():
                         style={
                             "borderRadius": "10px",
                         },
-                        children=dcc.Graph(id=page_prefix + chart),
+                        children=dcc.Graph(
+                            id=page_prefix + chart, figure=figures[chart]
+                        ),
                     )
                     for chart in chart_list
                 ],
@@ -1,5 +1,5 @@
 import dash
-from dash import html
+from dash import dcc, html
 from callbacks.portfolio import register_callbacks
 from components.base_card import base_card
 from components.tables.portfolio import generate_user_portfolio_table
@@ -31,5 +31,19 @@ layout = html.Div(
                 )
             ],
         ),
+        html.Div(
+            children=base_card(
+                id="portfolio-risk-card",
+                children=[
+                    html.H4("Risk"),
+                    dcc.Loading(
+                        children=[
+                            html.Div(id="portfolio-risk-summary"),
+                            dcc.Graph(id="portfolio-risk-contributions"),
+                        ]
+                    ),
+                ],
+            )
+        ),
     ],
 )
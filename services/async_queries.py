@@ -0,0 +1,278 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+from pandas import DataFrame
+
+from utils.metrics import get_metrics
+from utils.utils import Logger
+
+if TYPE_CHECKING:
+    from services.snow import SnowflakeConnectionPool
+
+
+class _AsyncQuery:
+    def __init__(
+        self,
+        sql: str,
+        params: dict[str, Any] | None,
+        future: Future,
+        max_retries: int,
+        retry_delay: float,
+        deadline: float | None,
+        poll_interval: float,
+    ) -> None:
+        self.sql = sql
+        self.params = params
+        self.future = future
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.deadline = deadline
+        self.poll_interval = poll_interval
+        self.attempt = 1
+        self.sfqid: str | None = None
+        # queued -> submitting -> running -> fetching, back to queued on retry.
+        self.state = "queued"
+        self.next_action = time.monotonic()
+        self.started = time.monotonic()
+
+
+class AsyncQueryRunner(Logger):
+    """
+    Runs queries with execute_async, so no thread waits on the warehouse
+    while they execute.
+
+    submit() returns a Future straight away. A poller thread submits the
+    query, then checks on every running query with get_query_status over
+    one pooled connection, backing off from poll_interval to
+    max_poll_interval, and hands finished ones to a few worker threads that
+    fetch the result with get_results_from_sfqid. A pooled connection is
+    only held to submit, to poll and to fetch, so far more queries can be in
+    flight than the pool has connections.
+
+    A failed query is resubmitted after retry_delay by the poller (nothing
+    sleeps), up to max_retries attempts. Cancelling the future, or passing
+    its timeout, aborts the query in the warehouse.
+    """
+
+    def __init__(
+        self,
+        pool: "SnowflakeConnectionPool",
+        poll_interval: float = 0.1,
+        max_poll_interval: float = 2.0,
+        workers: int = 4,
+    ) -> None:
+        super().__init__("AsyncQueryRunner")
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._queries: list[_AsyncQuery] = []
+        self._pid: int | None = None
+        self._thread: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "timed_out": 0,
+            "retries": 0,
+            "peak_in_flight": 0,
+        }
+
+    def submit(
+        self,
+        sql: str,
+        params: dict[str, Any] | None = None,
+        max_retries: int = 3,
+        retry_delay: float = 2.0,
+        timeout: float | None = None,
+    ) -> "Future[DataFrame]":
+        future: Future[DataFrame] = Future()
+        query = _AsyncQuery(
+            sql,
+            params,
+            future,
+            max_retries,
+            retry_delay,
+            None if timeout is None else time.monotonic() + timeout,
+            self.poll_interval,
+        )
+        # Wake the poller when the caller cancels, so the abort goes out now.
+        future.add_done_callback(lambda _: self._wake())
+        with self._cond:
+            self._ensure_started()
+            self._queries.append(query)
+            self._stats["submitted"] += 1
+            self._stats["peak_in_flight"] = max(
+                self._stats["peak_in_flight"], len(self._queries)
+            )
+            self._cond.notify()
+        return future
+
+    def metrics(self) -> dict[str, float]:
+        with self._cond:
+            return dict(self._stats, in_flight=len(self._queries))
+
+    def _ensure_started(self) -> None:
+        # Background callbacks run in forked processes, which inherit this
+        # object but not its threads.
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._queries = []
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="snowflake-async"
+            )
+            self._thread = threading.Thread(
+                target=self._poll_forever, name="snowflake-poller", daemon=True
+            )
+            self._thread.start()
+
+    def _wake(self) -> None:
+        with self._cond:
+            self._cond.notify()
+
+    def _poll_forever(self) -> None:
+        while True:
+            to_poll = self._next_round()
+            if to_poll:
+                try:
+                    self._poll(to_poll)
+                except Exception as e:
+                    self.logger.warning(f"Polling Snowflake queries failed. Error {e}")
+                    with self._cond:
+                        for query in to_poll:
+                            self._back_off(query)
+
+    def _next_round(self) -> list[_AsyncQuery]:
+        """Wait until some query needs attention; return those to poll."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                to_poll = []
+                for query in list(self._queries):
+                    if query.future.cancelled():
+                        self._drop(query, "cancelled")
+                    elif query.deadline is not None and now >= query.deadline:
+                        self._drop(query, "timed_out")
+                        error = TimeoutError(f"Query {query.sfqid} timed out.")
+                        if query.future.set_running_or_notify_cancel():
+                            query.future.set_exception(error)
+                    elif query.next_action > now:
+                        continue
+                    elif query.state == "queued":
+                        query.state = "submitting"
+                        self._executor.submit(self._start, query)
+                    elif query.state == "running":
+                        to_poll.append(query)
+                if to_poll:
+                    return to_poll
+                wake_times = [
+                    q.next_action
+                    for q in self._queries
+                    if q.state in ("queued", "running")
+                ] + [q.deadline for q in self._queries if q.deadline is not None]
+                wake_at = min(wake_times, default=None)
+                self._cond.wait(None if wake_at is None else max(wake_at - now, 0))
+
+    def _poll(self, queries: list[_AsyncQuery]) -> None:
+        with self.pool.connection() as conn:
+            running = [
+                conn.is_still_running(conn.get_query_status(query.sfqid))
+                for query in queries
+            ]
+        with self._cond:
+            for query, still_running in zip(queries, running):
+                if query not in self._queries:
+                    continue
+                if still_running:
+                    self._back_off(query)
+                else:
+                    # Finished or failed; fetching raises the query's error.
+                    query.state = "fetching"
+                    self._executor.submit(self._fetch, query)
+
+    def _back_off(self, query: _AsyncQuery) -> None:
+        query.poll_interval = min(query.poll_interval * 1.5, self.max_poll_interval)
+        query.next_action = time.monotonic() + query.poll_interval
+
+    def _start(self, query: _AsyncQuery) -> None:
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute_async(query.sql, query.params)
+                sfqid = cursor.sfqid
+        except Exception as e:
+            self._failed(query, e)
+            return
+        with self._cond:
+            query.sfqid = sfqid
+            query.state = "running"
+            query.poll_interval = self.poll_interval
+            query.next_action = time.monotonic() + query.poll_interval
+            if query not in self._queries:
+                # Cancelled while it was being submitted.
+                self._executor.submit(self._abort, sfqid)
+            self._cond.notify()
+
+    def _fetch(self, query: _AsyncQuery) -> None:
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.get_results_from_sfqid(query.sfqid)
+                data: DataFrame = cursor.fetch_pandas_all()
+                data.columns = data.columns.str.lower()
+        except Exception as e:
+            self._failed(query, e)
+            return
+        with self._cond:
+            if query not in self._queries:
+                return
+            self._queries.remove(query)
+            self._stats["completed"] += 1
+        get_metrics().observe("snowflake.query_async", time.monotonic() - query.started)
+        if query.future.set_running_or_notify_cancel():
+            query.future.set_result(data)
+
+    def _failed(self, query: _AsyncQuery, error: Exception) -> None:
+        self.logger.error(
+            f"Async query {query.sfqid} failed on attempt {query.attempt}. "
+            f"Error {error}"
+        )
+        with self._cond:
+            if query not in self._queries:
+                return
+            if query.attempt < query.max_retries:
+                self.logger.info(f"Resubmitting in {query.retry_delay} seconds..")
+                query.attempt += 1
+                query.sfqid = None
+                query.state = "queued"
+                query.next_action = time.monotonic() + query.retry_delay
+                self._stats["retries"] += 1
+                self._cond.notify()
+                return
+            self._queries.remove(query)
+            self._stats["failed"] += 1
+        self.logger.error("Max retries reached. Raising exception.")
+        get_metrics().observe(
+            "snowflake.query_async", time.monotonic() - query.started, error=True
+        )
+        if query.future.set_running_or_notify_cancel():
+            query.future.set_exception(error)
+
+    def _drop(self, query: _AsyncQuery, reason: str) -> None:
+        """Forget a query the caller gave up on and abort it if it's running."""
+        self._queries.remove(query)
+        self._stats[reason] += 1
+        if query.sfqid is not None and query.state in ("running", "fetching"):
+            self._executor.submit(self._abort, query.sfqid)
+
+    def _abort(self, sfqid: str) -> None:
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.abort_query(sfqid)
+            self.logger.info(f"Aborted query {sfqid}")
+        except Exception as e:
+            self.logger.warning(f"Aborting query {sfqid} failed. Error {e}")
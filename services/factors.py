@@ -0,0 +1,240 @@
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils.metrics import get_metrics
+from utils.utils import BaseClass, ENVIRONMENT, file_lock, get_cache_dir
+
+
+# Ken French daily datasets backing each factor model. A model's factors are
+# taken from the first of its datasets that has them.
+FACTOR_DATASETS = {
+    "CAPM": ["F-F_Research_Data_Factors_daily"],
+    "FF3": ["F-F_Research_Data_Factors_daily"],
+    "FF5": ["F-F_Research_Data_5_Factors_2x3_daily"],
+    "Carhart": ["F-F_Research_Data_Factors_daily", "F-F_Momentum_Factor_daily"],
+}
+
+
+class FactorDataset:
+    """
+    One Ken French dataset held as a single float array (date x factor),
+    usually memory-mapped from the on-disk snapshot. Date slices are views
+    into that array, so slicing never copies factor values.
+    """
+
+    def __init__(
+        self, name: str, dates: np.ndarray, values: np.ndarray, columns: list[str]
+    ) -> None:
+        self.name = name
+        self.dates = dates
+        self.values = values
+        self.columns = pd.Index(columns)
+        self.index = pd.DatetimeIndex(dates, name="Date")
+
+    def slice(self, start_date: date, end_date: date | None = None) -> pd.DataFrame:
+        start = np.searchsorted(self.dates, np.datetime64(start_date, "D"), "left")
+        end = (
+            len(self.dates)
+            if end_date is None
+            else np.searchsorted(self.dates, np.datetime64(end_date, "D"), "right")
+        )
+        return pd.DataFrame(
+            self.values[start:end],
+            index=self.index[start:end],
+            columns=self.columns,
+            copy=False,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.dates.nbytes
+
+
+class FactorStore(BaseClass):
+    """
+    Loads each Ken French dataset at most once per refresh window.
+
+    Datasets are downloaded in full on first use, written to a snapshot under
+    the cache directory and memory-mapped from there, so worker processes
+    share the pages and a restart inside the window does not download again.
+    With fixture_dir set (or FACTOR_FIXTURE_DIR), datasets are read from
+    <fixture_dir>/<dataset>.csv instead of the network.
+    """
+
+    def __init__(
+        self,
+        root: str | None = None,
+        refresh_seconds: float = 24 * 60 * 60,
+        fixture_dir: str | None = None,
+        environment: str = ENVIRONMENT,
+    ) -> None:
+        super().__init__("FactorStore", environment)
+        self.root = root or get_cache_dir("factors")
+        self.refresh_seconds = refresh_seconds
+        self.fixture_dir = fixture_dir or os.getenv("FACTOR_FIXTURE_DIR")
+        self._datasets: dict[str, tuple[float, FactorDataset]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> FactorDataset:
+        with self._lock:
+            loaded = self._datasets.get(name)
+            if loaded is not None and self._is_fresh(loaded[0]):
+                return loaded[1]
+
+            loaded_at, dataset = self._load_snapshot(name)
+            if dataset is None or not self._is_fresh(loaded_at):
+                loaded_at, dataset = self._refresh(name, loaded_at, dataset)
+            assert dataset is not None
+            self._datasets[name] = (loaded_at, dataset)
+            return dataset
+
+    def for_model(
+        self, model: str, start_date: date, end_date: date | None = None
+    ) -> pd.DataFrame:
+        """The model's datasets over the date range, joined on the dates."""
+        frame = None
+        for name in FACTOR_DATASETS[model]:
+            sliced = self.get(name).slice(start_date, end_date)
+            if frame is None:
+                frame = sliced
+            else:
+                extra = sliced.columns.difference(frame.columns, sort=False)
+                frame = frame.join(sliced[extra], how="inner")
+        return frame
+
+    def for_models(
+        self, models: list[str], start_date: date, end_date: date | None = None
+    ) -> pd.DataFrame:
+        """
+        Every dataset the models use over the date range, joined on the
+        dates, with (dataset, factor) columns: the same factor can differ
+        between datasets (SMB is built differently for FF3 and FF5).
+        """
+        names = list(dict.fromkeys(n for m in models for n in FACTOR_DATASETS[m]))
+        return pd.concat(
+            {name: self.get(name).slice(start_date, end_date) for name in names},
+            axis=1,
+            join="inner",
+        )
+
+    def invalidate(self, name: str | None = None) -> None:
+        with self._lock:
+            names = [name] if name else list(self._datasets)
+            for dataset_name in names:
+                self._datasets.pop(dataset_name, None)
+                meta_path = os.path.join(self._snapshot_dir(dataset_name), "meta.json")
+                if os.path.exists(meta_path):
+                    os.remove(meta_path)
+
+    def _refresh(
+        self, name: str, loaded_at: float, dataset: FactorDataset | None
+    ) -> tuple[float, FactorDataset | None]:
+        # One refresh at a time per dataset, whichever process started it;
+        # the others wait and take its snapshot instead of downloading too.
+        path = self._snapshot_dir(name)
+        os.makedirs(path, exist_ok=True)
+        with file_lock(os.path.join(path, "refresh.lock")):
+            loaded_at, dataset = self._load_snapshot(name)
+            if dataset is not None and self._is_fresh(loaded_at):
+                return loaded_at, dataset
+            try:
+                self._write_snapshot(name, self._download(name))
+                return self._load_snapshot(name)
+            except Exception as e:
+                if dataset is None:
+                    raise
+                self.logger.warning(
+                    f"Refreshing {name} failed, serving snapshot from "
+                    f"{time.ctime(loaded_at)}. Error {e}"
+                )
+                return loaded_at, dataset
+
+    def _is_fresh(self, loaded_at: float) -> bool:
+        return time.time() - loaded_at < self.refresh_seconds
+
+    def _download(self, name: str) -> pd.DataFrame:
+        if self.fixture_dir:
+            path = os.path.join(self.fixture_dir, f"{name}.csv")
+            self.logger.info(f"Loading {name} from fixture {path}")
+            return pd.read_csv(path, index_col=0, parse_dates=True)
+        from pandas_datareader import data as pdr
+
+        self.logger.info(f"Downloading {name} from Ken French data library")
+        with get_metrics().timer("provider.factors"):
+            return pdr.get_data_famafrench(name, start="1926-01-01")[0]
+
+    def _snapshot_dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _write_snapshot(self, name: str, frame: pd.DataFrame) -> None:
+        # Each refresh goes into a new version directory and meta.json is
+        # switched over last, so processes that still have the previous
+        # arrays memory-mapped keep reading a complete, unchanged file. The
+        # version being replaced is kept too: a reader may have read the old
+        # meta.json and not opened its arrays yet. Called under the refresh
+        # lock, so no other writer is adding versions meanwhile.
+        path = self._snapshot_dir(name)
+        previous = self._read_version(name)
+        loaded_at = time.time()
+        version = f"v{int(loaded_at * 1000)}"
+        os.makedirs(os.path.join(path, version), exist_ok=True)
+        frame = frame.sort_index()
+        np.save(
+            os.path.join(path, version, "dates.npy"),
+            pd.DatetimeIndex(frame.index).values.astype("datetime64[D]"),
+        )
+        np.save(
+            os.path.join(path, version, "values.npy"),
+            np.ascontiguousarray(frame.to_numpy(dtype="float64")),
+        )
+        meta = {
+            "columns": [str(column).strip() for column in frame.columns],
+            "loaded_at": loaded_at,
+            "version": version,
+        }
+        tmp_path = os.path.join(path, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+        for entry in os.listdir(path):
+            if entry.startswith("v") and entry not in (version, previous):
+                shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+    def _read_version(self, name: str) -> str | None:
+        try:
+            with open(os.path.join(self._snapshot_dir(name), "meta.json")) as file:
+                return json.load(file)["version"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+    def _load_snapshot(self, name: str) -> tuple[float, FactorDataset | None]:
+        path = self._snapshot_dir(name)
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return 0.0, None
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+        version_path = os.path.join(path, meta["version"])
+        dates = np.load(os.path.join(version_path, "dates.npy"))
+        values = np.load(os.path.join(version_path, "values.npy"), mmap_mode="r")
+        return meta["loaded_at"], FactorDataset(name, dates, values, meta["columns"])
+
+
+_default_store: FactorStore | None = None
+_default_store_lock = threading.Lock()
+
+
+def get_factor_store() -> FactorStore:
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = FactorStore()
+        return _default_store
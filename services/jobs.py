@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TypeVar
+
+import diskcache
+import psutil
+from dash import DiskcacheManager
+
+from utils.metrics import get_metrics
+from utils.utils import get_cache_dir
+
+T = TypeVar("T")
+
+_background_manager: DiskcacheManager | None = None
+_analysis_slots: "JobSlots | None" = None
+_single_flight: "SingleFlight | None" = None
+_lock = threading.Lock()
+
+
+def get_background_manager() -> DiskcacheManager:
+    """
+    Manager for the analysis callbacks. Each job runs in its own process and
+    hands its progress and result back to the web worker through a disk
+    cache, so the worker only enqueues jobs and answers polls.
+    """
+    global _background_manager
+    with _lock:
+        if _background_manager is None:
+            _background_manager = DiskcacheManager(
+                diskcache.Cache(get_cache_dir("callbacks")), expire=60 * 60
+            )
+        return _background_manager
+
+
+class JobSlots:
+    """
+    Cross-process cap on how many analysis jobs run at once.
+
+    Each slot is a disk-cache key holding the pid of the job that owns it,
+    claimed with an atomic add. Cancelled jobs are killed rather than
+    unwound, so a slot whose owner is no longer alive is reclaimed by the
+    next job that comes looking for one.
+    """
+
+    def __init__(
+        self, cache: diskcache.Cache, name: str, max_jobs: int, poll: float = 0.25
+    ) -> None:
+        self.cache = cache
+        self.name = name
+        self.max_jobs = max_jobs
+        self.poll = poll
+
+    def _key(self, slot: int) -> str:
+        return f"{self.name}-slot-{slot}"
+
+    def try_acquire(self) -> int | None:
+        pid = os.getpid()
+        for slot in range(self.max_jobs):
+            key = self._key(slot)
+            if self.cache.add(key, pid):
+                return slot
+            with self.cache.transact():
+                owner = self.cache.get(key)
+                if owner is not None and not psutil.pid_exists(owner):
+                    self.cache.set(key, pid)
+                    return slot
+        return None
+
+    def release(self, slot: int) -> None:
+        with self.cache.transact():
+            if self.cache.get(self._key(slot)) == os.getpid():
+                self.cache.delete(self._key(slot))
+
+    def in_use(self) -> int:
+        return sum(
+            1
+            for slot in range(self.max_jobs)
+            if self.cache.get(self._key(slot)) is not None
+        )
+
+    @contextmanager
+    def slot(self, on_wait: Callable[[], None] | None = None) -> Iterator[int]:
+        slot = self.try_acquire()
+        if slot is None and on_wait is not None:
+            on_wait()
+        while slot is None:
+            time.sleep(self.poll)
+            slot = self.try_acquire()
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+
+def get_analysis_slots() -> JobSlots:
+    global _analysis_slots
+    with _lock:
+        if _analysis_slots is None:
+            _analysis_slots = JobSlots(
+                diskcache.Cache(get_cache_dir("jobs")),
+                "analysis",
+                max_jobs=int(os.getenv("MAX_ANALYSIS_JOBS", "2")),
+            )
+        return _analysis_slots
+
+
+class SingleFlight:
+    """
+    Coalesces identical analyses that are in flight at the same time.
+
+    The first job for a key claims it in the disk cache (an atomic add
+    holding its pid) and runs the work; jobs and threads arriving with the
+    same key while it runs wait for it and take its result, or its error,
+    from the cache. Results stay result_ttl seconds so jobs that were a
+    poll behind still find them. A claim whose owner is no longer alive
+    (a cancelled job is killed) is taken over by the next waiter.
+    """
+
+    def __init__(
+        self,
+        cache: diskcache.Cache,
+        name: str,
+        result_ttl: float = 30.0,
+        poll: float = 0.1,
+    ) -> None:
+        self.cache = cache
+        self.name = name
+        self.result_ttl = result_ttl
+        self.poll = poll
+
+    @staticmethod
+    def make_key(kind: str, **inputs: Any) -> str:
+        payload = json.dumps([kind, inputs], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], T],
+        on_wait: Callable[[], None] | None = None,
+    ) -> T:
+        claim, result_key = f"{self.name}-claim-{key}", f"{self.name}-result-{key}"
+        waited_since = None
+        while True:
+            claimed = self._try_claim(claim)
+            # Checked after claiming: a leader publishes before it lets go of
+            # the claim, so a result found here is never one we just missed.
+            result = self.cache.get(result_key)
+            if result is not None:
+                if claimed:
+                    self.cache.delete(claim)
+                if waited_since is not None:
+                    get_metrics().observe(
+                        "singleflight.wait", time.perf_counter() - waited_since
+                    )
+                outcome, value = result
+                if outcome == "error":
+                    raise value
+                return value
+            if claimed:
+                break
+            if waited_since is None:
+                waited_since = time.perf_counter()
+                if on_wait is not None:
+                    on_wait()
+            time.sleep(self.poll)
+
+        try:
+            value = fn()
+        except Exception as e:
+            self._publish(result_key, ("error", e))
+            raise
+        else:
+            self._publish(result_key, ("ok", value))
+        finally:
+            self.cache.delete(claim)
+        return value
+
+    def _try_claim(self, claim: str) -> bool:
+        pid = os.getpid()
+        if self.cache.add(claim, pid):
+            return True
+        with self.cache.transact():
+            owner = self.cache.get(claim)
+            if owner is None or not psutil.pid_exists(owner):
+                self.cache.set(claim, pid)
+                return True
+        return False
+
+    def _publish(self, result_key: str, result: tuple[str, Any]) -> None:
+        try:
+            self.cache.set(result_key, result, expire=self.result_ttl)
+        except Exception:
+            # Unpicklable results (or errors) aren't shared; waiters find no
+            # result once the claim is gone and run the work themselves.
+            pass
+
+
+def get_single_flight() -> SingleFlight:
+    global _single_flight
+    with _lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight(
+                diskcache.Cache(get_cache_dir("jobs")), "analysis"
+            )
+        return _single_flight
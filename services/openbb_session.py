@@ -0,0 +1,32 @@
+import os
+import threading
+from typing import Any
+
+from utils.warmup import warm_up
+
+
+_obb: Any = None
+_lock = threading.Lock()
+
+
+def get_obb() -> Any:
+    """
+    The OpenBB client, imported and logged in on first use. Importing
+    openbb takes seconds, so the app starts this from a background thread
+    at boot (login_in_background) rather than on import or a request.
+    """
+    global _obb
+    with _lock:
+        if _obb is None:
+            from openbb import obb
+
+            obb.user.preferences.output_type = "dataframe"  # type: ignore
+            obb.account.login(  # type: ignore
+                pat=os.getenv("OPENBB_PERSONAL_ACCESS_TOKEN"), remember_me=True
+            )
+            _obb = obb
+        return _obb
+
+
+def login_in_background() -> None:
+    warm_up("openbb", get_obb)
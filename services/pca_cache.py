@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import TYPE_CHECKING
+
+import diskcache
+
+from utils.metrics import get_metrics
+from utils.utils import Logger, get_cache_dir
+
+if TYPE_CHECKING:
+    from analytics.pca import PCAResult
+
+
+class _Entry:
+    def __init__(
+        self, fit: "PCAResult", failed: list[str], nbytes: int, expires_at: float
+    ) -> None:
+        self.fit = fit
+        self.failed = failed
+        self.nbytes = nbytes
+        # Wall clock time the fit expires, set when it was first stored in
+        # whichever process.
+        self.expires_at = expires_at
+
+
+class PCAFitCache(Logger):
+    """
+    PCA fits keyed on the normalized ticker set and date range, each fitted
+    once at the page's largest component count and sliced with
+    PCAResult.top for smaller ones.
+
+    Fits are kept in two levels. The first is an in-process LRU bounded by
+    max_bytes, counted from each fit's arrays. The second is a disk cache
+    under directory that all processes share. The submit callback fits in a
+    background job's process, and the dropdown callback reads the fit in the
+    web worker, so the fit has to outlive the job. Entries expire ttl
+    seconds after the fit was stored, so a range ending today picks up the
+    nightly prices; a fit promoted from disk keeps its original expiry.
+    put can give a shorter ttl, as for fits missing tickers whose fetch
+    failed.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 2**20,
+        directory: str | None = None,
+        disk_bytes: int = 256 * 2**20,
+        ttl: float = 60 * 60,
+    ) -> None:
+        super().__init__("PCAFitCache")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = (
+            None
+            if directory is None
+            else diskcache.Cache(
+                directory,
+                size_limit=disk_bytes,
+                eviction_policy="least-recently-used",
+            )
+        )
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(tickers: list[str], start_date: date, end_date: date) -> str:
+        payload = json.dumps(
+            [sorted(set(tickers)), start_date.isoformat(), end_date.isoformat()]
+        )
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> tuple["PCAResult", list[str]] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.time() < entry.expires_at:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry.fit, entry.failed
+                del self._entries[key]
+                self._nbytes -= entry.nbytes
+        cached = None
+        if self.disk is not None:
+            try:
+                cached = self.disk.get(key)
+            except Exception as e:
+                self.logger.warning(f"Reading PCA fit {key} failed. Error {e}")
+        with self._lock:
+            if cached is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+        fit, failed, expires_at = cached
+        self._remember(key, fit, failed, expires_at)
+        return fit, failed
+
+    def put(
+        self,
+        key: str,
+        fit: "PCAResult",
+        failed: list[str],
+        ttl: float | None = None,
+    ) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        expires_at = time.time() + ttl
+        self._remember(key, fit, failed, expires_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, (fit, failed, expires_at), expire=ttl)
+            except Exception as e:
+                self.logger.warning(f"Writing PCA fit {key} failed. Error {e}")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), nbytes=self._nbytes)
+
+    def _remember(
+        self, key: str, fit: "PCAResult", failed: list[str], expires_at: float
+    ) -> None:
+        nbytes = fit.nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous.nbytes
+            self._entries[key] = _Entry(fit, failed, nbytes, expires_at)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+                self._stats["evictions"] += 1
+
+
+_default_cache: PCAFitCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_pca_cache() -> PCAFitCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PCAFitCache(
+                max_bytes=int(float(os.getenv("PCA_CACHE_MB", "64")) * 2**20),
+                directory=get_cache_dir("pca"),
+            )
+            get_metrics().add_collector("pca_cache", _default_cache.stats)
+        return _default_cache
@@ -0,0 +1,376 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+from typing import Callable, cast
+
+import pandas as pd
+
+from services.openbb_session import get_obb
+from utils.metrics import get_metrics
+from utils.utils import BaseClass, ENVIRONMENT, file_lock, get_cache_dir
+
+
+# (tickers, start_date, end_date) -> long-format frame indexed by date with
+# "close" and, for multi-ticker calls, "symbol" columns (the shape
+# obb.equity.price.historical returns).
+PriceFetcher = Callable[[list[str], date, date], pd.DataFrame]
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_SYMBOL_TIMEOUT = 20.0
+
+
+class PriceFetchError(Exception):
+    pass
+
+
+def failed_tickers(closes: pd.DataFrame) -> dict[str, str]:
+    """
+    Tickers get_closes left out of closes because the provider call for
+    them failed or timed out, with the reason.
+    """
+    return closes.attrs.get("failed", {})
+
+
+def obb_fetcher(provider: str = "yfinance") -> PriceFetcher:
+    def fetch(tickers: list[str], start_date: date, end_date: date) -> pd.DataFrame:
+        data = get_obb().equity.price.historical(  # type: ignore
+            tickers, start_date=start_date, end_date=end_date, provider=provider
+        )
+        return cast(pd.DataFrame, data)
+
+    return fetch
+
+
+class PriceHistoryStore(BaseClass):
+    """
+    On-disk cache of daily closes in front of the price provider.
+
+    Each ticker is kept in its own Parquet file, and a coverage manifest
+    records the contiguous date range that has already been requested from
+    the provider for it. A request only goes to the provider for the tickers
+    it has never seen and for the date gaps on either side of the covered
+    range, so overlapping requests are served from disk.
+
+    Missing tickers are fetched one symbol per provider call, up to
+    max_workers at a time, so a request takes about as long as its slowest
+    symbol. A symbol that errors or runs past symbol_timeout is left out of
+    the result (see failed_tickers) instead of failing the whole request.
+
+    Analyses run in several threads and background job processes at once.
+    Fetches hold no lock. Merging fetched rows into a ticker's file holds a
+    file lock for that ticker, and updating the manifest holds a file lock
+    for the manifest, which is re-read under it. A ticker's coverage is only
+    extended after its rows are written, so the manifest never claims a
+    range the file doesn't hold.
+    """
+
+    def __init__(
+        self,
+        root: str | None = None,
+        fetcher: PriceFetcher | None = None,
+        environment: str = ENVIRONMENT,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        symbol_timeout: float = DEFAULT_SYMBOL_TIMEOUT,
+    ) -> None:
+        super().__init__("PriceHistoryStore", environment)
+        self.root = root or get_cache_dir("prices")
+        os.makedirs(self.root, exist_ok=True)
+        self.fetcher = fetcher or obb_fetcher()
+        self.max_workers = max_workers
+        self.symbol_timeout = symbol_timeout
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "ticker_hits": 0,
+            "ticker_partial_hits": 0,
+            "ticker_misses": 0,
+            "provider_calls": 0,
+            "provider_failures": 0,
+            "rows_fetched": 0,
+            "rows_served": 0,
+        }
+
+    def get_closes(
+        self, tickers: list[str], start_date: date, end_date: date
+    ) -> pd.DataFrame:
+        """
+        Daily closes between start_date and end_date (inclusive) as a
+        date x ticker frame, columns in the order requested. Tickers the
+        provider has no data for are left out, as they were with the pivot
+        the callbacks used to do. Tickers left out because their fetch
+        failed are listed by failed_tickers(result); if every ticker
+        failed, PriceFetchError is raised.
+        """
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        coverage = self._read_coverage()
+        gaps = {
+            ticker: self._gaps(coverage.get(ticker), start_date, end_date)
+            for ticker in tickers
+        }
+        with self._lock:
+            self._record_lookups(coverage, gaps)
+
+        failed: dict[str, str] = {}
+        filled: dict[str, list[tuple[date, date]]] = {}
+        for (gap_start, gap_end), group in self._group_by_gap(gaps).items():
+            gap_failed, gap_filled = self._fill_gap(group, gap_start, gap_end)
+            failed.update(gap_failed)
+            for ticker, covered in gap_filled.items():
+                filled.setdefault(ticker, []).append(covered)
+        if filled:
+            with file_lock(self._coverage_path() + ".lock"):
+                coverage = self._read_coverage()
+                for ticker, ranges in filled.items():
+                    for covered_start, covered_end in ranges:
+                        self._extend_coverage(
+                            coverage, ticker, covered_start, covered_end
+                        )
+                self._write_coverage(coverage)
+
+        closes = {}
+        for ticker in tickers:
+            history = self._read(ticker)
+            history = history.loc[
+                pd.Timestamp(start_date) : pd.Timestamp(end_date)  # type: ignore
+            ]
+            if not history.empty:
+                closes[ticker] = history
+        with self._lock:
+            self._stats["rows_served"] += sum(len(close) for close in closes.values())
+
+        # A ticker whose gap failed but that has older closes in the range is
+        # still served from those, as before.
+        failed = {
+            ticker: reason for ticker, reason in failed.items() if ticker not in closes
+        }
+        if failed and not closes:
+            reasons = "; ".join(f"{ticker}: {why}" for ticker, why in failed.items())
+            raise PriceFetchError(f"Could not fetch prices. {reasons}")
+        if not closes:
+            result = pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+        else:
+            result = pd.DataFrame(closes)
+            result.index.name = "date"
+        result.attrs["failed"] = failed
+        return result
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            stats: dict[str, float] = dict(self._stats)
+        lookups = (
+            stats["ticker_hits"] + stats["ticker_partial_hits"] + stats["ticker_misses"]
+        )
+        stats["hit_rate"] = stats["ticker_hits"] / lookups if lookups else 0.0
+        return stats
+
+    def _gaps(
+        self, covered: list[str] | None, start_date: date, end_date: date
+    ) -> list[tuple[date, date]]:
+        if covered is None:
+            return [(start_date, end_date)]
+        covered_start, covered_end = (date.fromisoformat(d) for d in covered)
+        gaps = []
+        if start_date < covered_start:
+            gaps.append((start_date, covered_start - timedelta(days=1)))
+        if end_date > covered_end:
+            gaps.append((covered_end + timedelta(days=1), end_date))
+        # Weekend-only gaps can't hold any closes, so there is nothing to fetch.
+        return [gap for gap in gaps if len(pd.bdate_range(*gap))]
+
+    def _record_lookups(
+        self, coverage: dict[str, list[str]], gaps: dict[str, list[tuple[date, date]]]
+    ) -> None:
+        self._stats["requests"] += 1
+        hits = sum(1 for ticker_gaps in gaps.values() if not ticker_gaps)
+        misses = sum(1 for ticker in gaps if ticker not in coverage)
+        partial = len(gaps) - hits - misses
+        self._stats["ticker_hits"] += hits
+        self._stats["ticker_partial_hits"] += partial
+        self._stats["ticker_misses"] += misses
+        self.logger.info(
+            f"Price lookup for {len(gaps)} tickers: hits={hits} partial={partial} "
+            f"misses={misses}"
+        )
+
+    def _group_by_gap(
+        self, gaps: dict[str, list[tuple[date, date]]]
+    ) -> dict[tuple[date, date], list[str]]:
+        """Tickers missing the same range share one provider call."""
+        groups: dict[tuple[date, date], list[str]] = {}
+        for ticker, ticker_gaps in gaps.items():
+            for gap in ticker_gaps:
+                groups.setdefault(gap, []).append(ticker)
+        return groups
+
+    def _fill_gap(
+        self, tickers: list[str], gap_start: date, gap_end: date
+    ) -> tuple[dict[str, str], dict[str, tuple[date, date]]]:
+        """
+        Fetch the gap for every ticker and merge it into their files.
+        Returns the tickers whose fetch failed, with the reason, and the
+        range now covered for the others. Coverage isn't extended for failed
+        tickers, so the gap is retried on the next request.
+        """
+        with get_metrics().timer("provider.prices"):
+            fetched, failed = self._fetch_symbols(tickers, gap_start, gap_end)
+        for ticker, reason in failed.items():
+            self.logger.warning(
+                f"Could not fill {gap_start} - {gap_end} for {ticker}. {reason}"
+            )
+
+        with self._lock:
+            self._stats["provider_calls"] += len(tickers)
+            self._stats["provider_failures"] += len(failed)
+            self._stats["rows_fetched"] += sum(len(rows) for rows in fetched.values())
+        # Today's close may still move, so coverage stops at yesterday and the
+        # tail keeps being refreshed until the day is over.
+        covered_end = min(gap_end, date.today() - timedelta(days=1))
+        filled = {}
+        for ticker, rows in fetched.items():
+            if not rows.empty:
+                with file_lock(self._path(ticker) + ".lock"):
+                    history = pd.concat([self._read(ticker), rows])
+                    history = history[
+                        ~history.index.duplicated(keep="last")
+                    ].sort_index()
+                    self._write(ticker, history)
+            if covered_end >= gap_start:
+                filled[ticker] = (gap_start, covered_end)
+        return failed, filled
+
+    def _fetch_symbols(
+        self, tickers: list[str], start_date: date, end_date: date
+    ) -> tuple[dict[str, pd.Series], dict[str, str]]:
+        """
+        One provider call per ticker on a bounded thread pool. Each call
+        gets symbol_timeout seconds from when it starts running; one that
+        overruns is reported as failed and left to finish in the
+        background. Returns closes for the tickers that came back and the
+        reason for those that didn't.
+        """
+        started: dict[str, float] = {}
+
+        def fetch(ticker: str) -> pd.Series:
+            started[ticker] = time.monotonic()
+            rows = self._normalize(self.fetcher([ticker], start_date, end_date), ticker)
+            return rows.loc[rows["symbol"] == ticker, "close"]
+
+        fetched: dict[str, pd.Series] = {}
+        failed: dict[str, str] = {}
+        # A fresh pool per fill: pool threads don't survive the fork into a
+        # background callback process, and a timed-out call must not hold up
+        # the shutdown.
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(tickers)),
+            thread_name_prefix="price-fetch",
+        )
+        futures: dict[Future, str] = {
+            executor.submit(fetch, ticker): ticker for ticker in tickers
+        }
+        pending = set(futures)
+        try:
+            while pending:
+                deadlines = [
+                    started[futures[future]] + self.symbol_timeout
+                    for future in pending
+                    if futures[future] in started
+                ]
+                timeout = (
+                    max(0.0, min(deadlines) - time.monotonic())
+                    if deadlines
+                    else self.symbol_timeout
+                )
+                done, pending = wait(pending, timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ticker = futures[future]
+                    try:
+                        fetched[ticker] = future.result()
+                    except Exception as e:
+                        failed[ticker] = f"Error {e}"
+                now = time.monotonic()
+                for future in list(pending):
+                    ticker = futures[future]
+                    if now - started.get(ticker, now) >= self.symbol_timeout:
+                        failed[ticker] = f"Timed out after {self.symbol_timeout:g}s"
+                        pending.discard(future)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return fetched, failed
+
+    def _normalize(self, fetched: pd.DataFrame, ticker: str) -> pd.DataFrame:
+        fetched = fetched.copy()
+        if "symbol" not in fetched.columns:
+            # Single-ticker responses come back without a symbol column.
+            fetched["symbol"] = ticker
+        fetched.index = pd.to_datetime(fetched.index)
+        fetched.index.name = "date"
+        fetched["symbol"] = fetched["symbol"].str.upper()
+        return fetched[["symbol", "close"]]
+
+    def _extend_coverage(
+        self, coverage: dict[str, list[str]], ticker: str, start: date, end: date
+    ) -> None:
+        if ticker in coverage:
+            covered_start, covered_end = (date.fromisoformat(d) for d in coverage[ticker])
+            # Coverage is one contiguous range. A fill that doesn't touch it
+            # (another process got there first from an older manifest) is
+            # left out rather than claiming the business days in between.
+            between = pd.bdate_range(
+                min(end, covered_end) + timedelta(days=1),
+                max(start, covered_start) - timedelta(days=1),
+            )
+            if len(between):
+                return
+            start, end = min(start, covered_start), max(end, covered_end)
+        coverage[ticker] = [start.isoformat(), end.isoformat()]
+
+    def _path(self, ticker: str) -> str:
+        return os.path.join(self.root, f"{ticker}.parquet")
+
+    def _read(self, ticker: str) -> pd.Series:
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return pd.Series(
+                dtype="float64", name="close", index=pd.DatetimeIndex([], name="date")
+            )
+        return pd.read_parquet(path)["close"]
+
+    def _write(self, ticker: str, history: pd.Series) -> None:
+        path = self._path(ticker)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        history.rename("close").to_frame().to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _coverage_path(self) -> str:
+        return os.path.join(self.root, "_coverage.json")
+
+    def _read_coverage(self) -> dict[str, list[str]]:
+        # Re-read on every request so other processes' fills are picked up.
+        path = self._coverage_path()
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as file:
+            return json.load(file)
+
+    def _write_coverage(self, coverage: dict[str, list[str]]) -> None:
+        path = self._coverage_path()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(coverage, file)
+        os.replace(tmp_path, path)
+
+
+_default_store: PriceHistoryStore | None = None
+_default_store_lock = threading.Lock()
+
+
+def get_price_store() -> PriceHistoryStore:
+    """Process-wide store shared by the PCA and Fama-French callbacks."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = PriceHistoryStore()
+        return _default_store
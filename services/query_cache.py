@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from pandas import DataFrame
+
+from utils.utils import Logger
+
+
+class _Entry:
+    def __init__(self, template: str, value: DataFrame) -> None:
+        self.template = template
+        self.value = value
+        self.stored_at = time.monotonic()
+
+
+class QueryResultCache(Logger):
+    """
+    Size-bounded LRU of query results keyed on the rendered SQL and its
+    parameters, with a TTL per SQL template.
+
+    Within its TTL an entry is served as is. For stale_ttl seconds after
+    that it is still served, but a background refresh is started so the
+    next caller gets fresh data without waiting on the warehouse. Older
+    entries are reloaded inline. Callers get copies, so sorting a result in
+    place does not change the cached frame.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        default_ttl: float = 5 * 60,
+        ttls: dict[str, float] | None = None,
+        stale_ttl: float = 60 * 60,
+    ) -> None:
+        super().__init__("QueryResultCache")
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.stale_ttl = stale_ttl
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._refreshing: set[str] = set()
+        self._hooks: list[Callable[[str | None], None]] = []
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0}
+
+    @staticmethod
+    def make_key(sql: str, params: Any = None) -> str:
+        payload = json.dumps([sql, params], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get_or_load(
+        self,
+        template: str,
+        sql: str,
+        params: Any,
+        loader: Callable[[], DataFrame],
+    ) -> DataFrame:
+        key = self.make_key(sql, params)
+        ttl = self.ttls.get(template, self.default_ttl)
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry.stored_at if entry else None
+            if entry is not None and age is not None and age < ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                if age < ttl:
+                    self._stats["hits"] += 1
+                else:
+                    self._stats["stale_hits"] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(
+                            target=self._refresh,
+                            args=(key, template, loader),
+                            daemon=True,
+                        ).start()
+                return entry.value.copy()
+            self._stats["misses"] += 1
+
+        value = loader()
+        self._store(key, template, value)
+        return value.copy()
+
+    def get(self, template: str, sql: str, params: Any) -> DataFrame | None:
+        """
+        The cached result if it is within its TTL, else None. For callers
+        that load misses themselves, e.g. asynchronously, and put() them.
+        """
+        key = self.make_key(sql, params)
+        ttl = self.ttls.get(template, self.default_ttl)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.stored_at < ttl:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry.value.copy()
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, template: str, sql: str, params: Any, value: DataFrame) -> None:
+        self._store(self.make_key(sql, params), template, value)
+
+    def invalidate(self, template: str | None = None) -> int:
+        """Drop every entry for template, or everything when template is None."""
+        with self._lock:
+            keys = [
+                key
+                for key, entry in self._entries.items()
+                if template is None or entry.template == template
+            ]
+            for key in keys:
+                del self._entries[key]
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook(template)
+        self.logger.info(
+            f"Invalidated {len(keys)} cached results for {template or 'all templates'}"
+        )
+        return len(keys)
+
+    def on_invalidate(self, hook: Callable[[str | None], None]) -> None:
+        """Register a callable to run (with the template) after each invalidation."""
+        with self._lock:
+            self._hooks.append(hook)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+    def _store(self, key: str, template: str, value: DataFrame) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(template, value.copy())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, key: str, template: str, loader: Callable[[], DataFrame]) -> None:
+        try:
+            self._store(key, template, loader())
+            with self._lock:
+                self._stats["refreshes"] += 1
+        except Exception as e:
+            self.logger.error(f"Background refresh for {template} failed. Error {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -0,0 +1,379 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any
+
+import pandas as pd
+
+from utils.utils import BaseClass, ENVIRONMENT, get_cache_dir
+
+if TYPE_CHECKING:
+    from services.snow import SnowflakeConnector
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS holdings (
+    portfolio_id INTEGER NOT NULL,
+    ticker TEXT NOT NULL,
+    user_id INTEGER,
+    user_name TEXT,
+    broker_name TEXT,
+    portfolio_name TEXT,
+    num_shares REAL,
+    avg_cost REAL,
+    as_of TEXT,
+    last_updated TEXT,
+    PRIMARY KEY (portfolio_id, ticker)
+);
+CREATE INDEX IF NOT EXISTS holdings_user ON holdings (user_id);
+CREATE TABLE IF NOT EXISTS latest_prices (
+    ticker TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value REAL
+);
+"""
+
+HOLDING_COLUMNS = [
+    "portfolio_id",
+    "ticker",
+    "user_id",
+    "user_name",
+    "broker_name",
+    "portfolio_name",
+    "num_shares",
+    "avg_cost",
+    "as_of",
+    "last_updated",
+]
+
+UPSERT_HOLDING = f"""
+INSERT INTO holdings ({", ".join(HOLDING_COLUMNS)})
+VALUES ({", ".join("?" for _ in HOLDING_COLUMNS)})
+ON CONFLICT (portfolio_id, ticker) DO UPDATE SET
+{", ".join(f"{c} = excluded.{c}" for c in HOLDING_COLUMNS[2:])}
+"""
+
+# A price only replaces the stored one if it is at least as recent.
+UPSERT_PRICE = """
+INSERT INTO latest_prices (ticker, date, value) VALUES (?, ?, ?)
+ON CONFLICT (ticker) DO UPDATE SET date = excluded.date, value = excluded.value
+WHERE excluded.date >= latest_prices.date
+"""
+
+# Same columns as sql/user_portfolios_bulk.sql.
+USER_PORTFOLIOS = """
+SELECT h.user_id
+    , h.ticker
+    , h.num_shares
+    , h.avg_cost
+    , p.date AS price_date
+    , p.value AS price
+    , h.num_shares * p.value AS market_value
+    , h.num_shares * h.avg_cost AS total_cost
+    , (h.num_shares * p.value) - (h.num_shares * h.avg_cost) AS unrealized_gain_loss
+    , h.user_name
+    , h.broker_name
+    , h.portfolio_name
+    , h.as_of AS portfolio_as_of_date
+    , h.last_updated AS portfolio_last_updated_date
+FROM holdings AS h
+JOIN latest_prices AS p
+    ON h.ticker = p.ticker
+WHERE h.user_id IN ({user_ids})
+"""
+
+DATE_COLUMNS = ["price_date", "portfolio_as_of_date", "portfolio_last_updated_date"]
+
+
+def _to_text(value: Any) -> str | None:
+    """Dates and timestamps are stored as ISO text, which sorts by time."""
+    if value is None or pd.isna(value):
+        return None
+    return pd.Timestamp(value).isoformat()
+
+
+def _to_number(value: Any) -> float | None:
+    if value is None or pd.isna(value):
+        return None
+    return float(value)
+
+
+class PortfolioReplica(BaseClass):
+    """
+    Local SQLite copy of the portfolio holdings and of the latest close for
+    every held ticker, so the portfolio page is served without scanning the
+    warehouse's price timeseries.
+
+    sync() pulls holdings whose last_updated is at or after the newest one
+    already copied, and closes newer than the oldest latest close held (so
+    a ticker whose data lags the others still gets its update), looking
+    back at most max_price_lag past the newest close so a ticker that
+    stopped trading doesn't drag every pull back to its last close.
+    Tickers that are newly held get their latest close looked up directly.
+    Rows deleted in the warehouse don't show up in an incremental pull, so
+    each sync also pulls the current (portfolio_id, ticker) keys and drops
+    holdings missing from them, and closes of tickers no longer held.
+    Everything is reloaded in full every full_sync_seconds. Reads are only
+    served while the last sync is less than max_staleness seconds old.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_staleness: float = 30 * 60,
+        full_sync_seconds: float = 24 * 60 * 60,
+        max_price_lag: timedelta = timedelta(days=7),
+        environment: str = ENVIRONMENT,
+    ) -> None:
+        super().__init__("PortfolioReplica", environment)
+        self.path = path or os.path.join(get_cache_dir("replica"), "portfolio.db")
+        self.max_staleness = max_staleness
+        self.full_sync_seconds = full_sync_seconds
+        self.max_price_lag = max_price_lag
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+
+    def is_fresh(self) -> bool:
+        synced_at = self._state("synced_at")
+        return synced_at is not None and time.time() - synced_at < self.max_staleness
+
+    def get_user_portfolios(self, user_id: int) -> pd.DataFrame:
+        return self._read_portfolios([user_id]).drop(columns="user_id")
+
+    def get_user_portfolios_bulk(
+        self, user_ids: list[int] | None = None
+    ) -> dict[int, pd.DataFrame]:
+        if user_ids is None:
+            with closing(self._connect()) as conn:
+                rows = conn.execute("SELECT DISTINCT user_id FROM holdings").fetchall()
+            user_ids = [user_id for (user_id,) in rows]
+        data = self._read_portfolios(user_ids)
+        columns = data.columns.drop("user_id")
+        portfolios = {
+            int(user_id): frame[columns].reset_index(drop=True)
+            for user_id, frame in data.groupby("user_id")
+        }
+        for user_id in user_ids:
+            portfolios.setdefault(user_id, data.loc[[], columns])
+        return portfolios
+
+    def get_most_recent_prices(self, ticker_list: list[str]) -> pd.DataFrame | None:
+        """Latest closes for ticker_list, or None if any ticker isn't held."""
+        placeholders = ", ".join("?" for _ in ticker_list)
+        with closing(self._connect()) as conn:
+            data = pd.read_sql_query(
+                "SELECT date, ticker, value FROM latest_prices "
+                f"WHERE ticker IN ({placeholders})",
+                conn,
+                params=list(ticker_list),
+            )
+        if set(data["ticker"]) != set(ticker_list):
+            return None
+        data["date"] = pd.to_datetime(data["date"])
+        return data
+
+    def _read_portfolios(self, user_ids: list[int]) -> pd.DataFrame:
+        sql = USER_PORTFOLIOS.format(user_ids=", ".join("?" for _ in user_ids))
+        with closing(self._connect()) as conn:
+            data = pd.read_sql_query(sql, conn, params=list(user_ids))
+        for column in DATE_COLUMNS:
+            data[column] = pd.to_datetime(data[column])
+        return data
+
+    def sync(self, db: "SnowflakeConnector") -> dict[str, int]:
+        """Bring the replica up to date with the warehouse."""
+        started = time.time()
+        last_full_sync = self._state("full_synced_at")
+        full = (
+            last_full_sync is None
+            or started - last_full_sync >= self.full_sync_seconds
+        )
+
+        since = None if full else self._holdings_watermark()
+        holdings = db.get_holdings_changes(since)
+        keys = None if full else db.get_holding_keys()
+        deleted = 0
+        with closing(self._connect()) as conn, conn:
+            if full:
+                conn.execute("DELETE FROM holdings")
+            else:
+                deleted = self._delete_missing(conn, keys)
+            conn.executemany(
+                UPSERT_HOLDING,
+                [
+                    (
+                        int(row.portfolio_id),
+                        row.ticker,
+                        int(row.user_id),
+                        row.user_name,
+                        row.broker_name,
+                        row.portfolio_name,
+                        _to_number(row.num_shares),
+                        _to_number(row.avg_cost),
+                        _to_text(row.as_of),
+                        _to_text(row.last_updated),
+                    )
+                    for row in holdings.itertuples(index=False)
+                ],
+            )
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "DELETE FROM latest_prices "
+                "WHERE ticker NOT IN (SELECT ticker FROM holdings)"
+            )
+        prices = db.get_latest_price_changes(
+            None if full else self._prices_watermark()
+        )
+        unpriced = self._unpriced_tickers(set(prices["ticker"]))
+        if unpriced:
+            prices = pd.concat([prices, db.get_most_recent_prices(unpriced)])
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                UPSERT_PRICE,
+                [
+                    (row.ticker, _to_text(row.date), _to_number(row.value))
+                    for row in prices.itertuples(index=False)
+                ],
+            )
+            self._set_state(conn, "synced_at", started)
+            if full:
+                self._set_state(conn, "full_synced_at", started)
+
+        counts = {
+            "full": int(full),
+            "holdings": len(holdings),
+            "deleted": deleted,
+            "prices": len(prices),
+            "new_tickers": len(unpriced),
+        }
+        self.logger.info(
+            f"Synced portfolio replica in {time.time() - started:.2f}s: {counts}"
+        )
+        return counts
+
+    def _holdings_watermark(self) -> datetime | None:
+        with closing(self._connect()) as conn:
+            (watermark,) = conn.execute(
+                "SELECT MAX(last_updated) FROM holdings"
+            ).fetchone()
+        return datetime.fromisoformat(watermark) if watermark else None
+
+    def _prices_watermark(self) -> datetime | None:
+        with closing(self._connect()) as conn:
+            oldest, newest = conn.execute(
+                "SELECT MIN(date), MAX(date) FROM latest_prices"
+            ).fetchone()
+        if not oldest:
+            return None
+        return max(
+            datetime.fromisoformat(oldest),
+            datetime.fromisoformat(newest) - self.max_price_lag,
+        )
+
+    def _delete_missing(self, conn: sqlite3.Connection, keys: pd.DataFrame) -> int:
+        """Delete holdings whose (portfolio_id, ticker) isn't in keys."""
+        conn.execute(
+            "CREATE TEMP TABLE current_keys "
+            "(portfolio_id INTEGER, ticker TEXT, PRIMARY KEY (portfolio_id, ticker))"
+        )
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO current_keys VALUES (?, ?)",
+                [
+                    (int(row.portfolio_id), row.ticker)
+                    for row in keys.itertuples(index=False)
+                ],
+            )
+            return conn.execute(
+                "DELETE FROM holdings WHERE NOT EXISTS (SELECT 1 FROM current_keys "
+                "AS k WHERE k.portfolio_id = holdings.portfolio_id "
+                "AND k.ticker = holdings.ticker)"
+            ).rowcount
+        finally:
+            conn.execute("DROP TABLE current_keys")
+
+    def _unpriced_tickers(self, incoming: set[str]) -> list[str]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT h.ticker FROM holdings AS h "
+                "LEFT JOIN latest_prices AS p ON h.ticker = p.ticker "
+                "WHERE p.ticker IS NULL"
+            ).fetchall()
+        return sorted(ticker for (ticker,) in rows if ticker not in incoming)
+
+    def _state(self, name: str) -> float | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT value FROM sync_state WHERE name = ?", (name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, conn: sqlite3.Connection, name: str, value: float) -> None:
+        conn.execute(
+            "INSERT INTO sync_state (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (name, value),
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per call: callbacks read from several threads while
+        # the sync thread writes. WAL lets those reads run during a sync.
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+
+_default_replica: PortfolioReplica | None = None
+_sync_thread: threading.Thread | None = None
+_lock = threading.Lock()
+
+
+def get_portfolio_replica() -> PortfolioReplica:
+    global _default_replica
+    with _lock:
+        if _default_replica is None:
+            _default_replica = PortfolioReplica()
+        return _default_replica
+
+
+def start_replica_sync(
+    db: "SnowflakeConnector", interval: float | None = None
+) -> None:
+    """
+    Keep the replica synced from a daemon thread in this process, every
+    interval seconds (REPLICA_SYNC_SECONDS, default 300). Heroku dynos
+    don't share a filesystem, so the web worker keeps its own copy.
+    """
+    global _sync_thread
+    interval = interval or float(os.getenv("REPLICA_SYNC_SECONDS", "300"))
+    replica = get_portfolio_replica()
+
+    def run() -> None:
+        while True:
+            try:
+                replica.sync(db)
+            except Exception as e:
+                replica.logger.error(f"Portfolio replica sync failed. Error {e}")
+            time.sleep(interval)
+
+    with _lock:
+        if _sync_thread is None or not _sync_thread.is_alive():
+            _sync_thread = threading.Thread(
+                target=run, name="replica-sync", daemon=True
+            )
+            _sync_thread.start()
+
+
+if __name__ == "__main__":
+    # One-off sync: python -m services.replica
+    from services.snow import SnowflakeConnector
+
+    get_portfolio_replica().sync(SnowflakeConnector(ENVIRONMENT))
@@ -0,0 +1,332 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from services.price_store import PriceHistoryStore, failed_tickers, get_price_store
+from utils.metrics import get_metrics
+from utils.utils import BaseClass, ENVIRONMENT, file_lock, get_cache_dir
+
+
+DEFAULT_UNIVERSE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "config",
+    "universe.txt",
+)
+HISTORY_START = date(2010, 1, 1)
+
+
+def load_universe(path: str | None = None) -> list[str]:
+    """Tickers in the universe file, one per line; # starts a comment."""
+    path = path or os.getenv("RETURNS_UNIVERSE", DEFAULT_UNIVERSE_PATH)
+    tickers = []
+    with open(path, "r") as file:
+        for line in file:
+            ticker = line.split("#", 1)[0].strip().upper()
+            if ticker:
+                tickers.append(ticker)
+    return list(dict.fromkeys(tickers))
+
+
+class ReturnsMatrix:
+    """
+    Daily simple returns for a fixed universe as one float32 date x ticker
+    array, memory-mapped from the on-disk snapshot, with a ticker -> column
+    index. Row i holds the return from the previous row's close to row i's
+    close; a NaN means the ticker has no close on one of the two days.
+    """
+
+    def __init__(
+        self,
+        dates: np.ndarray,
+        tickers: list[str],
+        values: np.ndarray,
+        start_date: date,
+    ) -> None:
+        self.start_date = start_date
+        self.dates = dates
+        self.tickers = tickers
+        self.values = values
+        self.columns = {ticker: i for i, ticker in enumerate(tickers)}
+        self.index = pd.DatetimeIndex(dates, name="date")
+
+    def covers(self, tickers: list[str], start_date: date, end_date: date) -> bool:
+        """
+        Whether the matrix can answer for these tickers and dates. The
+        matrix is built nightly, so a range ending today (or on the first
+        session after the build) is still served; only today's partial
+        session is missing from it.
+        """
+        if not len(self.dates) or any(t not in self.columns for t in tickers):
+            return False
+        if start_date < self.start_date:
+            return False
+        missing_sessions = pd.bdate_range(
+            pd.Timestamp(self.dates[-1]) + timedelta(days=1), end_date
+        )
+        return len(missing_sessions) <= 1
+
+    def returns(
+        self, tickers: list[str], start_date: date, end_date: date
+    ) -> pd.DataFrame:
+        """
+        Returns between start_date and end_date as a date x ticker frame,
+        columns in request order. Like pct_change().iloc[1:] on the closes
+        of the range, the first session in the range is left out.
+
+        The date slice is a view of the memory-mapped file; only the columns
+        asked for are gathered, and when they sit next to each other in the
+        matrix the frame is a view as well.
+        """
+        start = np.searchsorted(self.dates, np.datetime64(start_date, "D"), "left")
+        end = np.searchsorted(self.dates, np.datetime64(end_date, "D"), "right")
+        start = min(start + 1, end)
+        columns = [self.columns[ticker] for ticker in tickers]
+        if not columns:
+            values = self.values[start:end, :0]
+        elif columns == list(range(columns[0], columns[0] + len(columns))):
+            values = self.values[start:end, columns[0] : columns[0] + len(columns)]
+        else:
+            values = self.values[start:end].take(columns, axis=1)
+        return pd.DataFrame(
+            values, index=self.index[start:end], columns=tickers, copy=False
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.dates.nbytes
+
+
+class ReturnsMatrixStore(BaseClass):
+    """
+    Builds the returns matrix for the configured universe from the price
+    store (nightly, via `python -m services.returns_matrix`) and serves it
+    memory-mapped to the callbacks. A rebuild writes a new version next to
+    the old one and switches meta.json over last; readers notice within
+    reload_seconds and processes still mapping the old version keep a
+    complete file.
+    """
+
+    def __init__(
+        self,
+        root: str | None = None,
+        reload_seconds: float = 60,
+        environment: str = ENVIRONMENT,
+    ) -> None:
+        super().__init__("ReturnsMatrixStore", environment)
+        self.root = root or get_cache_dir("returns")
+        self.reload_seconds = reload_seconds
+        self._matrix: ReturnsMatrix | None = None
+        self._version: str | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> ReturnsMatrix | None:
+        """The latest built matrix, or None if none has been built."""
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.reload_seconds:
+                self._checked_at = time.monotonic()
+                meta = self._read_meta()
+                if meta is not None and meta["version"] != self._version:
+                    loaded = self._load_current(meta)
+                    if loaded is not None:
+                        self._version, self._matrix = loaded
+            return self._matrix
+
+    def built_at(self) -> float | None:
+        """When the current matrix was built (epoch seconds), if ever."""
+        meta = self._read_meta()
+        return None if meta is None else meta["built_at"]
+
+    def build(
+        self,
+        tickers: list[str],
+        start_date: date = HISTORY_START,
+        end_date: date | None = None,
+        price_store: PriceHistoryStore | None = None,
+    ) -> ReturnsMatrix:
+        end_date = end_date or date.today() - timedelta(days=1)
+        price_store = price_store or get_price_store()
+        # One build at a time per directory, whichever process started it.
+        os.makedirs(self.root, exist_ok=True)
+        with file_lock(os.path.join(self.root, "build.lock")):
+            return self._build(tickers, start_date, end_date, price_store)
+
+    def _build(
+        self,
+        tickers: list[str],
+        start_date: date,
+        end_date: date,
+        price_store: PriceHistoryStore,
+    ) -> ReturnsMatrix:
+        closes = price_store.get_closes(tickers, start_date, end_date)
+        returns = closes.pct_change(fill_method=None)
+        missing = [ticker for ticker in tickers if ticker not in returns.columns]
+        if missing:
+            self.logger.warning(f"No prices for {missing}; left out of the matrix")
+
+        built_at = time.time()
+        version = f"v{int(built_at * 1000)}"
+        version_path = os.path.join(self.root, version)
+        os.makedirs(version_path, exist_ok=True)
+        np.save(
+            os.path.join(version_path, "dates.npy"),
+            pd.DatetimeIndex(returns.index).values.astype("datetime64[D]"),
+        )
+        np.save(
+            os.path.join(version_path, "values.npy"),
+            np.ascontiguousarray(returns.to_numpy(dtype="float32")),
+        )
+        meta = {
+            "tickers": list(returns.columns),
+            "start_date": start_date.isoformat(),
+            "built_at": built_at,
+            "version": version,
+        }
+        tmp_path = os.path.join(self.root, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, os.path.join(self.root, "meta.json"))
+
+        for entry in os.listdir(self.root):
+            if entry.startswith("v") and entry != version:
+                shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+        self.logger.info(
+            f"Built returns matrix {version}: {returns.shape[0]} days x "
+            f"{returns.shape[1]} tickers"
+        )
+        with self._lock:
+            self._checked_at = 0.0
+        return self._load(meta)
+
+    def _read_meta(self) -> dict | None:
+        meta_path = os.path.join(self.root, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as file:
+            return json.load(file)
+
+    def _load_current(self, meta: dict) -> tuple[str, ReturnsMatrix] | None:
+        """
+        Load the version meta points to. A rebuild deletes old versions
+        once it has switched meta.json over, so the version read here may
+        be gone by the time it is opened; then the newer meta is read again.
+        """
+        for _ in range(3):
+            try:
+                return meta["version"], self._load(meta)
+            except FileNotFoundError:
+                self.logger.info(f"Returns matrix {meta['version']} was replaced")
+                meta = self._read_meta()
+                if meta is None:
+                    return None
+        self.logger.warning("Returns matrix kept changing while loading it")
+        return None
+
+    def _load(self, meta: dict) -> ReturnsMatrix:
+        version_path = os.path.join(self.root, meta["version"])
+        dates = np.load(os.path.join(version_path, "dates.npy"))
+        values = np.load(os.path.join(version_path, "values.npy"), mmap_mode="r")
+        return ReturnsMatrix(
+            dates, meta["tickers"], values, date.fromisoformat(meta["start_date"])
+        )
+
+
+_default_store: ReturnsMatrixStore | None = None
+_default_store_lock = threading.Lock()
+_build_thread: threading.Thread | None = None
+
+
+def get_returns_store() -> ReturnsMatrixStore:
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ReturnsMatrixStore()
+        return _default_store
+
+
+def get_daily_returns(
+    tickers: list[str],
+    start_date: date,
+    end_date: date,
+    price_store: PriceHistoryStore | None = None,
+    returns_store: ReturnsMatrixStore | None = None,
+) -> pd.DataFrame:
+    """
+    Daily returns for tickers over the range: sliced from the returns matrix
+    when it covers the request, otherwise computed from the price store's
+    closes (tickers outside the universe, dates before the matrix starts,
+    or no matrix built yet). Tickers whose fetch failed are left out and
+    listed by failed_tickers on the result, as with get_closes.
+    """
+    metrics = get_metrics()
+    matrix = (returns_store or get_returns_store()).get()
+    if matrix is not None and matrix.covers(tickers, start_date, end_date):
+        with metrics.timer("returns.matrix"):
+            return matrix.returns(tickers, start_date, end_date)
+    with metrics.timer("returns.fetch"):
+        closes = (price_store or get_price_store()).get_closes(
+            tickers, start_date, end_date
+        )
+        returns = closes.pct_change(fill_method=None).iloc[1:]
+        returns.attrs["failed"] = failed_tickers(closes)
+        return returns
+
+
+def start_returns_build(
+    interval: float | None = None, max_age: float | None = None
+) -> None:
+    """
+    Keep the returns matrix built from a daemon thread in this process.
+    Heroku dynos don't share a filesystem, so the web dyno builds the copy
+    it serves from instead of relying on a one-off dyno's. Every interval
+    seconds (RETURNS_CHECK_SECONDS, default 3600; 0 turns this off) the
+    matrix is rebuilt if there is none or it is older than max_age seconds
+    (RETURNS_MAX_AGE_HOURS, default 20).
+
+    The build itself runs in a child process (python -m
+    services.returns_matrix). Background callbacks are forked from this
+    process, and one forked while a build thread held an import or pool
+    lock would wait on it forever; the thread here only waits on the child.
+    """
+    global _build_thread
+    if interval is None:
+        interval = float(os.getenv("RETURNS_CHECK_SECONDS", "3600"))
+    if interval <= 0:
+        return
+    if max_age is None:
+        max_age = float(os.getenv("RETURNS_MAX_AGE_HOURS", "20")) * 60 * 60
+    store = get_returns_store()
+
+    def run() -> None:
+        while True:
+            built_at = store.built_at()
+            if built_at is None or time.time() - built_at > max_age:
+                completed = subprocess.run(
+                    [sys.executable, "-m", "services.returns_matrix"]
+                )
+                if completed.returncode:
+                    store.logger.error(
+                        f"Returns matrix build exited with {completed.returncode}"
+                    )
+            time.sleep(interval)
+
+    with _default_store_lock:
+        if _build_thread is None or not _build_thread.is_alive():
+            _build_thread = threading.Thread(
+                target=run, name="returns-build", daemon=True
+            )
+            _build_thread.start()
+
+
+if __name__ == "__main__":
+    # start_returns_build runs this in a child process; it also rebuilds by
+    # hand: python -m services.returns_matrix
+    get_returns_store().build(load_universe())
@@ -1,12 +1,208 @@
+import asyncio
+import json
 import time
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import snowflake.connector
 from snowflake.connector.errors import ProgrammingError, OperationalError
 import os
 import requests
+import pyarrow as pa
 from pandas import DataFrame
-from typing import Any
-from utils.utils import BaseClass
+from typing import Any, Callable, Iterator, TypeVar
+from services.async_queries import AsyncQueryRunner
+from services.query_cache import QueryResultCache
+from services.replica import PortfolioReplica, get_portfolio_replica
+from utils.metrics import get_metrics
+from utils.utils import BaseClass, Logger
+
+
+# How long a cached result is served before it is refreshed. Holdings and
+# end-of-day prices change at most daily.
+QUERY_CACHE_TTLS = {
+    "sql/user_portfolios.sql": 15 * 60,
+    "sql/most_recent_stock_prices.sql": 15 * 60,
+    "sql/market_data_test.sql": 60 * 60,
+}
+
+
+T = TypeVar("T")
+
+
+def _lowercase_columns(table: pa.Table) -> pa.Table:
+    # Renaming only rewrites the schema; the column buffers are shared.
+    return table.rename_columns([name.lower() for name in table.column_names])
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class SnowflakeConnectionPool(Logger):
+    """
+    Bounded pool of Snowflake connections shared by the callback threads.
+
+    Connections are opened lazily up to max_size. A checkout waits up to
+    wait_timeout for one to come free and raises PoolTimeoutError after
+    that. Before a connection is handed out it is checked for liveness:
+    closed sessions, and idle ones that fail a SELECT 1 probe, are thrown
+    away and replaced with a fresh connection. `connect` is any zero-arg
+    factory, so a fake connector can stand in for snowflake.connector.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        max_size: int = 4,
+        wait_timeout: float = 30.0,
+        probe_after: float = 60.0,
+    ) -> None:
+        super().__init__("SnowflakeConnectionPool")
+        self.connect = connect
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.probe_after = probe_after
+        self._idle: list[tuple[Any, float]] = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "replaced": 0,
+            "peak_in_use": 0,
+        }
+
+    def checkout(self, timeout: float | None = None) -> Any:
+        timeout = self.wait_timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, 0.0
+                    break
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"No Snowflake connection free after {timeout}s "
+                        f"(max_size={self.max_size})"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds"] += time.monotonic() - started
+
+        try:
+            if conn is None:
+                conn = self._create()
+            elif not self._is_alive(conn, last_used):
+                self.logger.warning("Replacing dead Snowflake connection.")
+                self._close(conn)
+                conn = self._create()
+                with self._cond:
+                    self._stats["replaced"] += 1
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], in_use)
+        return conn
+
+    def checkin(self, conn: Any, discard: bool = False) -> None:
+        if discard or self._is_closed(conn):
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float | None = None) -> Iterator[Any]:
+        conn = self.checkout(timeout)
+        try:
+            yield conn
+        except OperationalError:
+            # Connection-level failure: don't hand this session out again.
+            self.checkin(conn, discard=True)
+            raise
+        except BaseException:
+            self.checkin(conn)
+            raise
+        else:
+            self.checkin(conn)
+
+    def metrics(self) -> dict[str, float]:
+        with self._cond:
+            stats: dict[str, float] = dict(self._stats)
+            idle = len(self._idle)
+            stats.update(
+                size=self._size,
+                idle=idle,
+                in_use=self._size - idle,
+                max_size=self.max_size,
+                utilization=(self._size - idle) / self.max_size,
+            )
+        stats["avg_wait_ms"] = (
+            stats["wait_seconds"] / stats["waits"] * 1000 if stats["waits"] else 0.0
+        )
+        return stats
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+    def _create(self) -> Any:
+        conn = self.connect()
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _is_closed(self, conn: Any) -> bool:
+        try:
+            return bool(conn.is_closed())
+        except Exception:
+            return True
+
+    def _is_alive(self, conn: Any, last_used: float) -> bool:
+        if self._is_closed(conn):
+            return False
+        if time.monotonic() - last_used < self.probe_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception as e:
+            self.logger.warning(f"Snowflake liveness probe failed. Error {e}")
+            return False
+
+    def _close(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
 
 
 class SnowflakeConnector(BaseClass):
@@ -14,14 +210,24 @@ class SnowflakeConnector(BaseClass):
 
     def __new__(cls, environment, *args, **kwargs):
         if cls._instance is None:
-            cls._instance = super(SnowflakeConnector, cls).__new__(cls, *args, **kwargs)
+            cls._instance = super(SnowflakeConnector, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, environment):
-        if not hasattr(self, "engine_initialized"):
+    def __init__(self, environment, connect: Callable[[], Any] | None = None):
+        if not hasattr(self, "pool_initialized"):
             super().__init__("SnowflakeConnector", environment)
-            self.engine = self.get_engine()
-            self.engine_initialized = True
+            self.pool = SnowflakeConnectionPool(
+                connect or self.get_engine,
+                max_size=int(os.getenv("SNOWFLAKE_POOL_SIZE", "4")),
+                wait_timeout=float(os.getenv("SNOWFLAKE_POOL_TIMEOUT", "30")),
+            )
+            self.cache = QueryResultCache(ttls=QUERY_CACHE_TTLS)
+            self.async_runner = AsyncQueryRunner(self.pool, workers=self.pool.max_size)
+            self.replica: PortfolioReplica | None = get_portfolio_replica()
+            get_metrics().add_collector("snowflake_pool", self.pool.metrics)
+            get_metrics().add_collector("query_cache", self.cache.stats)
+            get_metrics().add_collector("snowflake_async", self.async_runner.metrics)
+            self.pool_initialized = True
 
     def get_engine(self) -> snowflake.connector.SnowflakeConnection:
         if "SNOWFLAKE_USER" not in os.environ:
@@ -36,41 +242,235 @@ class SnowflakeConnector(BaseClass):
         return conn
 
     def get_user_portfolios(self, user_id: int) -> DataFrame:
+        if self.replica is not None and self.replica.is_fresh():
+            return self.replica.get_user_portfolios(user_id)
         query = self._load_sql("sql/user_portfolios.sql")
-        query = query.format(user_id=user_id)
-        result = self._query(query)
+        result = self._query(
+            query, template="sql/user_portfolios.sql", params={"user_id": user_id}
+        )
         return result
 
+    async def get_user_portfolios_async(self, user_id: int) -> DataFrame:
+        """get_user_portfolios without holding a thread while the query runs."""
+        if self.replica is not None and self.replica.is_fresh():
+            return self.replica.get_user_portfolios(user_id)
+        query = self._load_sql("sql/user_portfolios.sql")
+        return await self.query_async(
+            query, template="sql/user_portfolios.sql", params={"user_id": user_id}
+        )
+
+    def get_user_portfolios_bulk(
+        self, user_ids: list[int] | None = None
+    ) -> dict[int, DataFrame]:
+        """
+        Portfolios for many users (every user for None) from one query, so
+        the price timeseries is scanned once rather than once per user.
+        Each user's frame is also put in the result cache under the
+        single-user query, so get_user_portfolios for any of them is a hit.
+        """
+        if self.replica is not None and self.replica.is_fresh():
+            return self.replica.get_user_portfolios_bulk(user_ids)
+        query = self._load_sql("sql/user_portfolios_bulk.sql")
+        params = {
+            "user_ids": None if user_ids is None else json.dumps(sorted(set(user_ids)))
+        }
+        data = self._query(query, params=params)
+
+        single_user_query = self._load_sql("sql/user_portfolios.sql")
+        columns = data.columns.drop("user_id")
+        portfolios = {
+            int(user_id): frame[columns].reset_index(drop=True)
+            for user_id, frame in data.groupby("user_id")
+        }
+        # Users asked for but holding nothing get an empty frame, so they
+        # don't go to the warehouse one by one afterwards either.
+        for user_id in user_ids or []:
+            portfolios.setdefault(user_id, data.loc[[], columns])
+        for user_id, frame in portfolios.items():
+            self.cache.put(
+                "sql/user_portfolios.sql",
+                single_user_query,
+                {"user_id": user_id},
+                frame,
+            )
+        return portfolios
+
     def get_most_recent_prices(self, ticker_list: list[str]) -> DataFrame:
+        if self.replica is not None and self.replica.is_fresh():
+            result = self.replica.get_most_recent_prices(ticker_list)
+            if result is not None:
+                return result
         ticker_list_str = (
             "(" + ", ".join(["'" + ticker + "'" for ticker in ticker_list]) + ")"
         )
 
         query = self._load_sql("sql/most_recent_stock_prices.sql")
         query = query.format(ticker_list=ticker_list_str)
-        result = self._query(query)
+        result = self._query(query, template="sql/most_recent_stock_prices.sql")
         return result
 
+    def get_holdings_changes(self, since: datetime | None) -> DataFrame:
+        """Holdings updated at or after since (all of them for None)."""
+        query = self._load_sql("sql/replica_holdings.sql")
+        return self._query(query, params={"since": since})
+
+    def get_holding_keys(self) -> DataFrame:
+        """(portfolio_id, ticker) of every current holding."""
+        query = self._load_sql("sql/replica_holding_keys.sql")
+        return self._query(query)
+
+    def get_latest_price_changes(self, since: datetime | None) -> DataFrame:
+        """Latest close per held ticker, for tickers with a close after since."""
+        query = self._load_sql("sql/replica_latest_prices.sql")
+        return self._query(query, params={"since": since})
+
     def query_test(self):
         query = self._load_sql("sql/market_data_test.sql")
 
-        result = self._query(query)
+        result = self._query(query, template="sql/market_data_test.sql")
         return result
 
     def _load_sql(self, file_path: str):
         with open(file_path, "r") as file:
             return file.read()
 
+    def query_batches(
+        self,
+        sql: str,
+        params: dict[str, Any] | None = None,
+        max_rows: int = 50_000,
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Stream a result as Arrow record batches of at most max_rows rows,
+        column names lowercased. Batches are pulled from Snowflake as the
+        caller iterates, so only the chunk being processed is in memory.
+        The pooled connection is held until the generator is exhausted or
+        closed.
+        """
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            for table in cursor.fetch_arrow_batches():
+                yield from _lowercase_columns(table).to_batches(max_chunksize=max_rows)
+
+    def reduce_batches(
+        self,
+        sql: str,
+        reducer: Callable[[T, pa.RecordBatch], T],
+        initial: T,
+        params: dict[str, Any] | None = None,
+        max_rows: int = 50_000,
+    ) -> T:
+        """Fold reducer over the streamed batches of a query."""
+        result = initial
+        for batch in self.query_batches(sql, params, max_rows):
+            result = reducer(result, batch)
+        return result
+
+    def query_arrow(self, sql: str, params: dict[str, Any] | None = None) -> pa.Table:
+        """
+        Whole result as an Arrow table with lowercased column names. The
+        table wraps the buffers Snowflake returned; nothing is converted to
+        pandas or copied.
+        """
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            table = cursor.fetch_arrow_all(force_return_table=True)
+            return _lowercase_columns(table)
+
+    def submit_query(
+        self,
+        sql: str,
+        params: dict[str, Any] | None = None,
+        template: str | None = None,
+        max_retries: int = 3,
+        retry_delay: float = 2.0,
+        timeout: float | None = None,
+    ) -> "Future[DataFrame]":
+        """
+        Start a query with execute_async and return a Future for its result
+        (see AsyncQueryRunner). Like _query, results of a known template are
+        served from and stored in the result cache. Cancel the future when
+        the caller no longer needs the result, e.g. its client went away, to
+        abort the query in the warehouse.
+        """
+        if template is not None:
+            cached = self.cache.get(template, sql, params)
+            if cached is not None:
+                future: Future[DataFrame] = Future()
+                future.set_result(cached)
+                return future
+        future = self.async_runner.submit(sql, params, max_retries, retry_delay, timeout)
+        if template is not None:
+
+            def store(done: "Future[DataFrame]") -> None:
+                if not done.cancelled() and done.exception() is None:
+                    self.cache.put(template, sql, params, done.result())
+
+            future.add_done_callback(store)
+        return future
+
+    async def query_async(
+        self,
+        sql: str,
+        params: dict[str, Any] | None = None,
+        template: str | None = None,
+        max_retries: int = 3,
+        retry_delay: float = 2.0,
+        timeout: float | None = None,
+    ) -> DataFrame:
+        """
+        Await submit_query from asyncio code. If the awaiting task is
+        cancelled (an ASGI server does this when the client disconnects),
+        the query is aborted in the warehouse.
+        """
+        future = self.submit_query(
+            sql, params, template, max_retries, retry_delay, timeout
+        )
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def invalidate_cache(self, template: str | None = None) -> int:
+        return self.cache.invalidate(template)
+
     def _query(
-        self, sql: str, max_retries: int = 3, retry_delay: float = 2.0
+        self,
+        sql: str,
+        max_retries: int = 3,
+        retry_delay: float = 2.0,
+        template: str | None = None,
+        params: dict[str, Any] | None = None,
+    ) -> DataFrame:
+        """
+        Run a query, serving it from the result cache when it comes from a
+        known SQL template. Ad-hoc SQL (template=None) always hits Snowflake.
+        """
+        if template is None:
+            return self._run_query(sql, params, max_retries, retry_delay)
+        return self.cache.get_or_load(
+            template,
+            sql,
+            params,
+            lambda: self._run_query(sql, params, max_retries, retry_delay),
+        )
+
+    def _run_query(
+        self,
+        sql: str,
+        params: dict[str, Any] | None = None,
+        max_retries: int = 3,
+        retry_delay: float = 2.0,
     ) -> DataFrame:
         for attempt in range(1, max_retries + 1):
             try:
-                with self.engine.cursor() as cursor:
-                    cursor.execute(sql)
-                    data: DataFrame = cursor.fetch_pandas_all()
-                    data.columns = data.columns.str.lower()
-                    return data
+                with get_metrics().timer("snowflake.query"):
+                    with self.pool.connection() as conn, conn.cursor() as cursor:
+                        cursor.execute(sql, params)
+                        data: DataFrame = cursor.fetch_pandas_all()
+                        data.columns = data.columns.str.lower()
+                        return data
             except (ProgrammingError, OperationalError) as e:
                 self.logger.error(f"Queery failed on attempt {attempt}. Error {e}")
                 if attempt < max_retries:
@@ -88,9 +488,17 @@ class SnowflakeConnector(BaseClass):
                     self.logger.error("Max retries reached. Raising exception.")
                     raise
         raise RuntimeError(
-            "Unreachable _query ended without returning or raising ealier"
+            "Unreachable _run_query ended without returning or raising ealier"
         )
 
-    def _execute(self, sql, params) -> None:
-        with self.engine.cursor() as cursor:
+    def _execute(self, sql, params, invalidates: list[str] | None = None) -> None:
+        """
+        Run a write. Pass the templates whose cached results it makes stale
+        in `invalidates`; with no list, every cached result is dropped.
+        """
+        with self.pool.connection() as conn, conn.cursor() as cursor:
             cursor.execute(sql, params)
+        if invalidates is None:
+            self.cache.invalidate()
+        for template in invalidates or []:
+            self.cache.invalidate(template)
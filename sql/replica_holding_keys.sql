@@ -0,0 +1,10 @@
+SELECT holdings.portfolio_id
+        ,holdings.ticker
+FROM michaels_pms.public.fact_investment_portfolio_holdings as holdings
+JOIN michaels_pms.public.dim_investment_portfolios as dim_port
+    ON holdings.portfolio_id = dim_port.id
+join michaels_pms.public.dim_brokers as dim_brokers
+    on dim_port.broker_id = dim_brokers.id
+join michaels_pms.public.fact_users as fact_users
+    on dim_port.user_id = fact_users.id
+;
\ No newline at end of file
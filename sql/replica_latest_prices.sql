@@ -0,0 +1,6 @@
+SELECT date, ticker, value
+FROM finance__economics.cybersyn.stock_price_timeseries
+WHERE ticker IN (SELECT DISTINCT ticker FROM michaels_pms.public.fact_investment_portfolio_holdings)
+  AND variable_name = 'Post-Market Close'
+  AND (%(since)s IS NULL OR date > %(since)s)
+QUALIFY ROW_NUMBER() OVER (PARTITION BY ticker ORDER BY date DESC) = 1;
\ No newline at end of file
@@ -11,7 +11,7 @@ with user_portfolio as (
     join michaels_pms.public.fact_users as fact_users
         on dim_port.user_id = fact_users.id
     where 1=1
-    and fact_users.id = 1 -- {user_id}
+    and fact_users.id = %(user_id)s
 ),
 market_data as (
     SELECT date, ticker, value
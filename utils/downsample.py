@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+
+# Roughly the pixel width of a full-width chart. Plotting more points than
+# this can't show more detail, it only makes the figure JSON bigger.
+DEFAULT_MAX_POINTS = 1000
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: pick `threshold` points of (x, y) that
+    keep the visual shape of the line. The first and last points are always
+    kept; every bucket in between keeps the point forming the largest
+    triangle with the previously kept point and the next bucket's average.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if end >= n - 1:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def downsample_series(
+    series: pd.Series, max_points: int = DEFAULT_MAX_POINTS
+) -> pd.Series:
+    """LTTB-downsample a series (numeric or datetime index) for plotting."""
+    series = series.dropna()
+    if len(series) <= max_points:
+        return series
+    index = series.index
+    x = (
+        index.asi8.astype(np.float64)
+        if isinstance(index, pd.DatetimeIndex)
+        else index.to_numpy(dtype=np.float64)
+    )
+    return series.iloc[lttb_indices(x, series.to_numpy(dtype=np.float64), max_points)]
@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import pandas as pd
+
+
+# The mask functions return None for a filter type they don't handle; the
+# filter is then ignored rather than failing the whole rows request.
+
+
+def _text_mask(column: pd.Series, condition: dict[str, Any]) -> pd.Series | None:
+    kind = condition.get("type", "contains")
+    if kind == "blank":
+        return column.isna() | (column.astype(str).str.strip() == "")
+    if kind == "notBlank":
+        return column.notna() & (column.astype(str).str.strip() != "")
+    values = column.astype(str).str.lower()
+    needle = str(condition.get("filter", "")).lower()
+    masks = {
+        "contains": lambda: values.str.contains(needle, regex=False),
+        "notContains": lambda: ~values.str.contains(needle, regex=False),
+        "equals": lambda: values == needle,
+        "notEqual": lambda: values != needle,
+        "startsWith": lambda: values.str.startswith(needle),
+        "endsWith": lambda: values.str.endswith(needle),
+    }
+    return masks[kind]() if kind in masks else None
+
+
+def _number_mask(
+    column: pd.Series, condition: dict[str, Any]
+) -> pd.Series | None:
+    kind = condition.get("type", "equals")
+    if kind == "blank":
+        return column.isna()
+    if kind == "notBlank":
+        return column.notna()
+    values = pd.to_numeric(column, errors="coerce")
+    value = condition.get("filter")
+    masks = {
+        "equals": lambda: values == value,
+        "notEqual": lambda: values != value,
+        "lessThan": lambda: values < value,
+        "lessThanOrEqual": lambda: values <= value,
+        "greaterThan": lambda: values > value,
+        "greaterThanOrEqual": lambda: values >= value,
+        "inRange": lambda: values.between(value, condition.get("filterTo")),
+    }
+    return masks[kind]() if kind in masks else None
+
+
+def _column_mask(
+    column: pd.Series, column_filter: dict[str, Any]
+) -> pd.Series | None:
+    conditions = column_filter.get("conditions")
+    if conditions:
+        filter_type = column_filter.get("filterType")
+        masks = []
+        for condition in conditions:
+            mask = _column_mask(column, {"filterType": filter_type, **condition})
+            if mask is not None:
+                masks.append(mask)
+        if not masks:
+            return None
+        combined = masks[0]
+        for mask in masks[1:]:
+            if column_filter.get("operator") == "OR":
+                combined = combined | mask
+            else:
+                combined = combined & mask
+        return combined
+    if column_filter.get("filterType") == "number":
+        return _number_mask(column, column_filter)
+    return _text_mask(column, column_filter)
+
+
+def apply_filter_model(
+    df: pd.DataFrame, filter_model: dict[str, Any] | None
+) -> pd.DataFrame:
+    """Apply an AG Grid text/number filter model to a frame."""
+    if not filter_model:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for column, column_filter in filter_model.items():
+        column_mask = (
+            _column_mask(df[column], column_filter) if column in df.columns else None
+        )
+        if column_mask is not None:
+            mask &= column_mask.fillna(False)
+    return df[mask]
+
+
+def apply_sort_model(
+    df: pd.DataFrame, sort_model: list[dict[str, Any]] | None
+) -> pd.DataFrame:
+    """Apply an AG Grid sort model (list of {colId, sort}) to a frame."""
+    sort_model = [sort for sort in sort_model or [] if sort["colId"] in df.columns]
+    if not sort_model:
+        return df
+    return df.sort_values(
+        by=[sort["colId"] for sort in sort_model],
+        ascending=[sort["sort"] == "asc" for sort in sort_model],
+        kind="stable",
+    )
+
+
+class GridRowSource:
+    """
+    Serves AG Grid infinite row model requests from a cached frame.
+
+    The source frame and each sorted/filtered view of it are kept for ttl
+    seconds, so scrolling through blocks only slices an existing view and
+    serializes the rows in the requested block.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_views: int = 32) -> None:
+        self.ttl = ttl
+        self.max_views = max_views
+        self._views: OrderedDict[tuple, tuple[float, pd.DataFrame]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_rows(
+        self,
+        key: Hashable,
+        load_frame: Callable[[], pd.DataFrame],
+        request: dict[str, Any],
+    ) -> dict[str, Any]:
+        sort_model = request.get("sortModel") or []
+        filter_model = request.get("filterModel") or {}
+        view_key = (
+            key,
+            json.dumps(sort_model, sort_keys=True),
+            json.dumps(filter_model, sort_keys=True),
+        )
+        view = self._get(view_key)
+        if view is None:
+            frame = self._get((key, None, None))
+            if frame is None:
+                frame = load_frame().reset_index(drop=True)
+                self._put((key, None, None), frame)
+            view = apply_sort_model(apply_filter_model(frame, filter_model), sort_model)
+            self._put(view_key, view)
+
+        start = request.get("startRow") or 0
+        end = request.get("endRow") or start + 100
+        return {
+            "rowData": view.iloc[start:end].to_dict("records"),
+            "rowCount": len(view),
+        }
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        with self._lock:
+            for view_key in list(self._views):
+                if key is None or view_key[0] == key:
+                    del self._views[view_key]
+
+    def _get(self, view_key: tuple) -> pd.DataFrame | None:
+        with self._lock:
+            cached = self._views.get(view_key)
+            if cached is None or time.monotonic() - cached[0] > self.ttl:
+                return None
+            self._views.move_to_end(view_key)
+            return cached[1]
+
+    def _put(self, view_key: tuple, frame: pd.DataFrame) -> None:
+        with self._lock:
+            self._views[view_key] = (time.monotonic(), frame)
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
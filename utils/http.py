@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+
+# Responses smaller than this aren't worth a compressor's CPU or the
+# Content-Encoding round trip.
+MIN_COMPRESS_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "text/css",
+    "text/html",
+    "text/plain",
+    "image/svg+xml",
+}
+
+# Fingerprinted URLs change whenever the file does, so browsers may keep them.
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Compressed copies of fingerprinted static files, by (url, encoding).
+STATIC_CACHE_ENTRIES = 64
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Best encoding the client accepts: br if available, then gzip."""
+    accepted = {
+        part.split(";")[0].lower()
+        for part in accept_encoding.replace(" ", "").split(",")
+        if not part.endswith(";q=0")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        # Quality 5 is most of quality 11's ratio at a fraction of the CPU,
+        # which matters for callback responses compressed on every request.
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def optimize_responses(app: Any) -> None:
+    """
+    Shrink what app.server sends:
+
+    - compress JSON, JS, CSS and HTML responses of at least
+      MIN_COMPRESS_BYTES with brotli (when installed) or gzip;
+    - mark fingerprinted static files (Dash's versioned component bundles
+      and assets requested with their ?m=<mtime> stamp) immutable for a
+      year, and keep their compressed bytes so they're compressed once;
+    - give callback and other JSON responses a weak ETag and answer a
+      matching If-None-Match with an empty 304. assets/callback_etags.js
+      sends If-None-Match for repeated callback requests, which browsers
+      don't do for POSTs themselves. The ETag is a hash of the response,
+      so a 304 still runs the callback and only saves sending its output;
+      callbacks read server-side data (prices, holdings, caches) that the
+      request's inputs don't capture, so the tag can't come from them.
+    """
+    prefix = app.config.routes_pathname_prefix
+    suites_prefix = f"{prefix}_dash-component-suites/"
+    assets_prefix = f"{prefix}assets/"
+    static_cache: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+    static_lock = threading.Lock()
+
+    def is_fingerprinted(response: Response) -> bool:
+        if request.path.startswith(assets_prefix):
+            return "m" in request.args
+        if request.path.startswith(suites_prefix):
+            # Dash sets max-age only on the bundles it serves fingerprinted.
+            return bool(response.cache_control.max_age)
+        return False
+
+    @app.server.after_request
+    def _optimize_response(response: Response) -> Response:
+        if response.status_code != 200 or "Content-Encoding" in response.headers:
+            return response
+        fingerprinted = is_fingerprinted(response)
+        if fingerprinted:
+            response.headers["Cache-Control"] = IMMUTABLE
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.direct_passthrough = False
+        data = response.get_data()
+
+        if response.mimetype == "application/json":
+            etag = f'W/"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+            if request.headers.get("If-None-Match") == etag:
+                not_modified = Response(status=304)
+                not_modified.headers["ETag"] = etag
+                return not_modified
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "no-cache"
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+        response.vary.add("Accept-Encoding")
+        if encoding is None or len(data) < MIN_COMPRESS_BYTES:
+            return response
+        if fingerprinted:
+            key = (request.full_path, encoding)
+            with static_lock:
+                body = static_cache.get(key)
+                if body is not None:
+                    static_cache.move_to_end(key)
+            if body is None:
+                body = compress(data, encoding)
+                with static_lock:
+                    static_cache[key] = body
+                    while len(static_cache) > STATIC_CACHE_ENTRIES:
+                        static_cache.popitem(last=False)
+        else:
+            body = compress(data, encoding)
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,284 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Iterator
+
+import diskcache
+from dash.exceptions import PreventUpdate
+from flask import abort, request
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+DEFAULT_WINDOW = 1024
+# Bound on the forked jobs' spool: a full window for this many stages. If
+# nothing scrapes /metrics the oldest samples are dropped instead of the
+# spool growing on disk. Counts then miss them; quantiles only ever use the
+# last window of each stage.
+SPOOL_STAGES = 64
+
+# The callback the current request is dispatching. Dash hands callback
+# exceptions to the app's on_error handler instead of raising them, so the
+# handler flags the error here for the dispatch timer to count.
+_current_callback: ContextVar[dict[str, Any] | None] = ContextVar(
+    "current_callback", default=None
+)
+
+
+class LatencyStats:
+    """Count, total, errors and a window of the most recent samples."""
+
+    def __init__(self, window: int) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.count += 1
+        self.total += seconds
+        self.errors += error
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return math.nan
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MetricsRegistry:
+    """
+    Per-stage latency summaries (p50/p95/p99 over the last `window`
+    samples), call counts and error counts, rendered in the Prometheus text
+    format.
+
+    Background callbacks run in processes forked from the web worker; their
+    observations are appended to a disk spool instead, and drained into the
+    web worker's registry whenever the metrics are rendered.
+    """
+
+    def __init__(
+        self, window: int = DEFAULT_WINDOW, spool: diskcache.Deque | None = None
+    ):
+        self.window = window
+        self.spool = spool
+        self.pid = os.getpid()
+        self._stages: dict[str, LatencyStats] = {}
+        self._collectors: dict[str, Callable[[], dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, error: bool = False) -> None:
+        if self.spool is not None and os.getpid() != self.pid:
+            self.spool.append((stage, seconds, error))
+            return
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = LatencyStats(self.window)
+            stats.observe(seconds, error)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except PreventUpdate:
+            raise
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, error)
+
+    def add_collector(
+        self, name: str, collect: Callable[[], dict[str, float]]
+    ) -> None:
+        """Render collect()'s values as app_<name>_<key> gauges."""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def drain_spool(self) -> int:
+        drained = 0
+        while self.spool is not None:
+            try:
+                stage, seconds, error = self.spool.popleft()
+            except IndexError:
+                break
+            self.observe(stage, seconds, error)
+            drained += 1
+        return drained
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "sum": stats.total,
+                    **{f"p{int(q * 100)}": stats.quantile(q) for q in QUANTILES},
+                }
+                for stage, stats in self._stages.items()
+            }
+
+    def render(self) -> str:
+        self.drain_spool()
+        lines = [
+            "# HELP app_stage_latency_seconds Wall-clock time per stage.",
+            "# TYPE app_stage_latency_seconds summary",
+        ]
+        snapshot = self.snapshot()
+        for stage, stats in sorted(snapshot.items()):
+            label = f'stage="{stage}"'
+            for q in QUANTILES:
+                value = stats[f"p{int(q * 100)}"]
+                lines.append(
+                    f'app_stage_latency_seconds{{{label},quantile="{q}"}} '
+                    f"{value:.6g}"
+                )
+            lines.append(
+                f"app_stage_latency_seconds_sum{{{label}}} {stats['sum']:.6g}"
+            )
+            lines.append(
+                f"app_stage_latency_seconds_count{{{label}}} {stats['count']}"
+            )
+        lines += [
+            "# HELP app_stage_errors_total Calls that raised, per stage.",
+            "# TYPE app_stage_errors_total counter",
+        ]
+        for stage, stats in sorted(snapshot.items()):
+            lines.append(
+                f'app_stage_errors_total{{stage="{stage}"}} {stats["errors"]}'
+            )
+
+        with self._lock:
+            collectors = list(self._collectors.items())
+        for name, collect in collectors:
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                metric = f"app_{name}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {float(value):.6g}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics: MetricsRegistry | None = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            # Imported here: utils.utils times BaseClass methods through this
+            # module, so it can't be imported at the top.
+            from utils.utils import get_cache_dir
+
+            _metrics = MetricsRegistry(
+                spool=diskcache.Deque(
+                    directory=get_cache_dir("metrics"),
+                    maxlen=DEFAULT_WINDOW * SPOOL_STAGES,
+                )
+            )
+        return _metrics
+
+
+def timed(stage: str) -> Callable[[Callable], Callable]:
+    """Decorator timing every call of a function as `stage`."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().timer(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_callback_error() -> None:
+    """Count the callback being dispatched as failed (for on_error handlers)."""
+    current = _current_callback.get()
+    if current is not None:
+        current["error"] = True
+
+
+def _instrument_callback(name: str, func: Callable) -> Callable:
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        current = {"error": False}
+        token = _current_callback.set(current)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except BaseException:
+            current["error"] = True
+            raise
+        finally:
+            _current_callback.reset(token)
+            get_metrics().observe(
+                name, time.perf_counter() - start, current["error"]
+            )
+
+    wrapper._instrumented = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+def instrument_app(app: Any) -> None:
+    """
+    Time every callback the app dispatches (as callback.<function name>)
+    and serve the registry at /metrics.
+
+    Callbacks registered with dash.callback only reach app.callback_map on
+    the first request, so they are wrapped from a before_request hook that
+    runs after Dash's own setup, once per callback.
+
+    /metrics asks for METRICS_TOKEN as a bearer token when it is set.
+    Without one it is only served outside production.
+    """
+    metrics = get_metrics()
+    # Callbacks are only ever added to the map, so its size tells whether
+    # there is anything new to wrap without scanning it on every request.
+    wrapped = 0
+    wrap_lock = threading.Lock()
+
+    @app.server.before_request
+    def _instrument_callbacks() -> None:
+        nonlocal wrapped
+        if len(app.callback_map) == wrapped:
+            return
+        with wrap_lock:
+            for spec in app.callback_map.values():
+                func = spec.get("callback")
+                if func is not None and not getattr(func, "_instrumented", False):
+                    spec["callback"] = _instrument_callback(
+                        f"callback.{func.__name__}", func
+                    )
+            wrapped = len(app.callback_map)
+
+    @app.server.route("/metrics")
+    def _metrics_endpoint():
+        # utils.utils imports this module.
+        from utils.utils import ENVIRONMENT
+
+        token = os.getenv("METRICS_TOKEN")
+        if token:
+            if request.headers.get("Authorization") != f"Bearer {token}":
+                abort(401)
+        elif ENVIRONMENT == "prod":
+            abort(404)
+        return app.server.response_class(
+            metrics.render(), mimetype="text/plain; version=0.0.4"
+        )
@@ -1,12 +1,43 @@
+import fcntl
 import io
 import logging
-from typing import Any
+import os
+from contextlib import contextmanager
+from typing import Any, Iterator
 from dash import html
-import time
 import base64
 import inspect
 from datetime import datetime, timedelta
 import pandas as pd
+from utils.metrics import timed
+
+
+ENVIRONMENT = "prod" if "DYNO" in os.environ else "dev"
+
+
+def get_cache_dir(*parts: str) -> str:
+    """
+    Return (and create) a directory under the local cache root. The root
+    defaults to ./.cache and can be moved with the CACHE_DIR env var.
+    """
+    path = os.path.join(os.getenv("CACHE_DIR", ".cache"), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive lock on path (created if missing) for as long as the block
+    runs. Every holder opens the file itself, so the lock keeps out other
+    threads as well as other processes, such as background callback jobs.
+    """
+    with open(path, "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
 
 
 def parse_file_contents(contents, filename):
@@ -32,15 +63,9 @@ def is_float(s):
         return False
 
 
-def time_function(func):
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        print(f"Execution time for {func.__name__}: {end_time - start_time} seconds")
-        return result
-
-    return wrapper
+def time_function(func, stage: str | None = None):
+    """Record every call's wall-clock time in the metrics registry."""
+    return timed(stage or func.__qualname__)(func)
 
 
 class Logger:
@@ -72,14 +97,22 @@ class BaseClass(Logger):
     def __init__(self, name: str, environment: str) -> None:
         super().__init__(name)
         self.environment = environment
-        if self.environment == "dev":
-            self._wrap_methods_with_timer()
+        self._wrap_methods_with_timer()
 
     def _wrap_methods_with_timer(self):
         for attr_name in dir(self):
-            if callable(getattr(self, attr_name)) and not attr_name.startswith("_"):
-                method = getattr(self, attr_name)
-                if inspect.iscoroutinefunction(method):
-                    continue
-                decorated_method = time_function(method)
-                setattr(self, attr_name, decorated_method)
+            method = getattr(self, attr_name)
+            # Public methods only, leaving out the logging helpers. Timing a
+            # generator or coroutine call would only measure creating it.
+            if (
+                attr_name.startswith("_")
+                or attr_name in vars(Logger)
+                or not inspect.ismethod(method)
+                or inspect.iscoroutinefunction(method)
+                or inspect.isgeneratorfunction(method)
+            ):
+                continue
+            decorated_method = time_function(
+                method, f"{type(self).__name__}.{attr_name}"
+            )
+            setattr(self, attr_name, decorated_method)
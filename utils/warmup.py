@@ -0,0 +1,63 @@
+import importlib
+import os
+import threading
+import time
+from typing import Any, Callable
+
+from utils.utils import Logger
+
+
+_threads: dict[str, threading.Thread] = {}
+_lock = threading.Lock()
+logger = Logger("Warmup")
+
+
+def warm_up(name: str, fn: Callable[[], Any]) -> None:
+    """
+    Run fn once per process in a daemon thread, off the request path.
+    DISABLE_WARMUP=1 turns this off (the startup benchmark uses it to
+    measure the boot path alone); fn then runs on first use instead.
+    """
+    if os.getenv("DISABLE_WARMUP"):
+        return
+    with _lock:
+        if name in _threads:
+            return
+        thread = threading.Thread(
+            target=_run, args=(name, fn), name=f"warmup-{name}", daemon=True
+        )
+        _threads[name] = thread
+        thread.start()
+
+
+def preload(*modules: str) -> None:
+    """Import modules in the background so the first callback needing them
+    doesn't pay for it."""
+    for module in modules:
+        warm_up(module, lambda module=module: importlib.import_module(module))
+
+
+def wait_for_warm_up(timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    with _lock:
+        threads = list(_threads.values())
+    for thread in threads:
+        if thread is not threading.current_thread():
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+
+def _run(name: str, fn: Callable[[], Any]) -> None:
+    started = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        logger.warning(f"Warm-up of {name} failed. Error {e}")
+        return
+    logger.info(f"Warmed up {name} in {time.perf_counter() - started:.2f}s")
+
+
+# Background callbacks run in processes forked from the web worker. A fork
+# taken while a warm-up thread is halfway through an import would leave the
+# child waiting on a module lock that nothing will release, so forks wait
+# for running warm-ups to finish (and the child inherits their result).
+os.register_at_fork(before=wait_for_warm_up)